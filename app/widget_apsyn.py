@@ -19,6 +19,8 @@ class ApertureSynthesisWidget(QWidget):
     def __init__(self, array_widget=None):
         super().__init__()
         self.array_widget = array_widget  # Reference to InterferometricArrayWidget
+        self.observatory = None  # Cached antenna array, see argosim.antenna_utils.Observatory
+        self.mask_cache = argosim.imaging_utils.UVMaskCache()  # Cached uv masks and dirty beams, shared with the imaging widget
         layout = QVBoxLayout()
         title = QLabel("Aperture Synthesis")
         title.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -156,15 +158,20 @@ class ApertureSynthesisWidget(QWidget):
             self.canvas.draw()
             return
 
-        # Compute the uv points and dirty beam
-        baselines = argosim.antenna_utils.get_baselines(antenna)
-        uv_points, _ = argosim.antenna_utils.uv_track_multiband(
-            b_ENU=baselines, lat=latitude/180*np.pi, dec=declination/180*np.pi, 
+        # Compute the uv points and dirty beam, reusing the baselines XYZ coordinates
+        # while the antenna array and the latitude are unchanged
+        if self.observatory is None:
+            self.observatory = argosim.antenna_utils.Observatory(antenna, lat=latitude/180*np.pi)
+        else:
+            self.observatory.set_antenna(antenna)
+            self.observatory.set_lat(latitude/180*np.pi)
+        uv_points, _ = self.observatory.uv_track(
+            dec=declination/180*np.pi, 
             track_time=duration, t_0=start_time, n_times=int(duration*60/timestep),
             f=central_freq*1e9, df=bandwidth*1e9, n_freqs=nchan)
         self.current_uv_points = uv_points
         try:
-            uv_mask, _ = argosim.imaging_utils.grid_uv_samples(uv_samples=uv_points, sky_uv_shape=(Npx, Npx), fov_size=(fov_size, fov_size))
+            uv_mask, dirty_beam = self.mask_cache(uv_points, sky_uv_shape=(Npx, Npx), fov_size=(fov_size, fov_size))
         except ValueError as e:
             self.fig.clear()
             ax = self.fig.add_subplot(1, 1, 1)
@@ -172,7 +179,6 @@ class ApertureSynthesisWidget(QWidget):
             ax.axis('off')
             self.canvas.draw()
             return
-        dirty_beam = argosim.imaging_utils.uv2sky(uv_mask)
 
         # Plot
         self.fig.clear()
@@ -198,3 +204,6 @@ class ApertureSynthesisWidget(QWidget):
     
     def get_current_Npx(self):
         return self.param_widgets['Npx'].text()
+
+    def get_mask_cache(self):
+        return self.mask_cache
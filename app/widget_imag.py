@@ -139,7 +139,8 @@ class ImagingWidget(QWidget):
         rand_sizes = np.random.rand(n_sources)
         source_sizes = rand_sizes * (max_source_size-min_source_size) + min_source_size
         sky_model = argosim.data_utils.n_source_sky((Npx, Npx), fov_size, deg_size_list=source_sizes, source_intensity_list=[1.]*n_sources, seed=seed, norm='max')
-        obs, _ = argosim.imaging_utils.simulate_dirty_observation(sky_model, uv_points, fov_size, sigma=noise_level)
+        # Reuse the uv mask and dirty beam gridded by the aperture synthesis widget
+        obs, _ = argosim.imaging_utils.simulate_dirty_observation(sky_model, uv_points, fov_size, sigma=noise_level, mask_cache=self.aperture_widget.get_mask_cache())
 
         self.fig.clear()
         ax1 = self.fig.add_subplot(1, 2, 1)
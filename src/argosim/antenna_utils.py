@@ -8,19 +8,29 @@ perform aperture synthesis, obtain uv-coverage and get observations from sky mod
 
 """
 
+from collections import OrderedDict
+
 import jax.numpy as jnp
 import numpy as np
-import numpy.random as rnd
 from jax import jit, vmap
 
-from argosim.rand_utils import local_seed
+from argosim.jax_utils import pad_to_bucket, real_dtype
+from argosim.rand_utils import local_rng
+
+# Speed of light in m/s
+SPEED_OF_LIGHT = 299792458.0
+
+# Compiled uv track functions, keyed on the bucketed shapes of their arguments,
+# the least recently used ones are evicted beyond _UV_TRACK_CACHE_SIZE entries
+_uv_track_cache = OrderedDict()
+_UV_TRACK_CACHE_SIZE = 32
 
 ########################################
 #      Generate antenna positions      #
 ########################################
 
 
-def random_antenna_pos(E_lim=1000.0, N_lim=1000.0, U_lim=0.0, seed=None):
+def random_antenna_pos(E_lim=1000.0, N_lim=1000.0, U_lim=0.0, seed=None, rng=None):
     """Random antenna pos.
 
     Function to generate a random antenna location in ENU coordinates.
@@ -36,14 +46,17 @@ def random_antenna_pos(E_lim=1000.0, N_lim=1000.0, U_lim=0.0, seed=None):
         The up coordinate span width of the antenna position in meters.
     seed : int
         Optional seed to set.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
 
     Returns
     -------
     antenna_pos : np.ndarray
         The antenna position in ENU coordinates.
     """
-    with local_seed(seed):
-        random_coords = rnd.random_sample(3)
+    with local_rng(seed, rng) as gen:
+        random_coords = gen.random(3)
 
     # Return (x,y) random location for single dish
     return (
@@ -118,7 +131,9 @@ def y_antenna_arr(n_antenna=5, r=500.0, alpha=0.0):
     ).reshape((3 * n_antenna, 3))
 
 
-def random_antenna_arr(n_antenna=3, E_lim=1000.0, N_lim=1000.0, U_lim=0.0, seed=None):
+def random_antenna_arr(
+    n_antenna=3, E_lim=1000.0, N_lim=1000.0, U_lim=0.0, seed=None, rng=None
+):
     """Random antenna arr.
 
     Function to generate a random antenna array. Antennas lie randomly distributed
@@ -136,15 +151,20 @@ def random_antenna_arr(n_antenna=3, E_lim=1000.0, N_lim=1000.0, U_lim=0.0, seed=
         The up coordinate span width of the antenna positions in meters.
     seed : int
         Optional seed to set.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
 
     Returns
     -------
     antenna_arr : np.ndarray
         The antenna array positions in ENU coordinates.
     """
-    with local_seed(seed):
+    with local_rng(seed, rng) as gen:
         # Make a list of 'n' antenna locations (x_i, y_i) randomly distributed.
-        positions = [random_antenna_pos(E_lim, N_lim, U_lim) for i in range(n_antenna)]
+        positions = [
+            random_antenna_pos(E_lim, N_lim, U_lim, rng=gen) for i in range(n_antenna)
+        ]
 
     return np.array(positions)
 
@@ -192,7 +212,32 @@ def uni_antenna_array(
 ########################################
 
 
-def get_baselines(array):
+def get_antenna_idx(n_antenna, unique=False):
+    """Get antenna indices.
+
+    Function to list the (i, j) antenna index pairs forming the baselines of an array,
+    in the same order as the baselines returned by `get_baselines`.
+
+    Parameters
+    ----------
+    n_antenna : int
+        The number of antennas in the array.
+    unique : bool
+        If True, only list the antenna pairs i < j.
+
+    Returns
+    -------
+    antenna_idx : np.ndarray
+        The (i, j) antenna indices of each baseline, shape (n_baselines, 2).
+    """
+    if unique:
+        i, j = np.triu_indices(n_antenna, k=1)
+    else:
+        i, j = np.nonzero(~np.eye(n_antenna, dtype=bool))
+    return np.column_stack((i, j))
+
+
+def get_baselines(array, unique=False):
     """Get baselines (JAX version).
 
     Function to compute the baselines of an antenna array.
@@ -201,24 +246,137 @@ def get_baselines(array):
     ----------
     array : np.ndarray
         The antenna array positions.
+    unique : bool
+        If True, only return the baselines of the antenna pairs i < j. The
+        conjugate baselines (j, i) are implied and must be restored downstream,
+        e.g. with the 'hermitian' option of the gridding functions.
 
     Returns
     -------
     baselines : np.ndarray
         The baselines of the antenna array.
+    antenna_idx : np.ndarray
+        If unique==True, the (i, j) antenna indices of each baseline.
     """
-    # Get the baseline for every combination of antennas except for i=j baselines.
     array = jnp.asarray(array)
+    if unique:
+        # Get the baseline for every antenna pair i < j.
+        antenna_idx = get_antenna_idx(array.shape[0], unique=True)
+        return array[antenna_idx[:, 0]] - array[antenna_idx[:, 1]], antenna_idx
+    # Get the baseline for every combination of antennas except for i=j baselines.
     diffs = array[:, None, :] - array[None, :, :]  # Shape: (n, n, 3)
     mask = ~jnp.eye(array.shape[0], dtype=bool)  # Shape: (n, n), True where i ≠ j
     return diffs[mask].reshape(-1, 3)
 
 
+def get_redundant_baselines(array, unique=False, tol=1e-3):
+    """Get redundant baselines.
+
+    Function to group the baselines of an antenna array into unique baseline
+    vectors. Regular arrays (e.g. `uni_antenna_array`) have many redundant
+    baselines, so tracking and gridding the unique vectors with their
+    multiplicities is much cheaper than using all the antenna pairs.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        The antenna array positions.
+    unique : bool
+        If True, only consider the antenna pairs i < j and group each baseline
+        with its conjugate, so that the conjugate samples must be restored
+        downstream (see `get_baselines`).
+    tol : float
+        The tolerance in meters to consider two baselines as redundant.
+
+    Returns
+    -------
+    baselines : np.ndarray
+        The unique baseline vectors, shape (n_unique, 3).
+    multiplicity : np.ndarray
+        The number of antenna pairs of each unique baseline, shape (n_unique,).
+    antenna_idx : np.ndarray
+        The (i, j) antenna indices of the antenna pairs, shape (n_pairs, 2).
+    group_idx : np.ndarray
+        The unique baseline index of each antenna pair, shape (n_pairs,).
+    """
+    array = np.asarray(array, dtype=float)
+    antenna_idx = get_antenna_idx(array.shape[0], unique)
+    b_ENU = array[antenna_idx[:, 0]] - array[antenna_idx[:, 1]]
+    b_quantized = np.rint(b_ENU / tol).astype(np.int64)
+    if unique:
+        # Orient each baseline so that its first non-zero coordinate is positive
+        first_nonzero = np.argmax(b_quantized != 0, axis=1)
+        sign = np.sign(b_quantized[np.arange(len(b_quantized)), first_nonzero])
+        sign[sign == 0] = 1
+        b_ENU = b_ENU * sign[:, None]
+        b_quantized = b_quantized * sign[:, None]
+    _, first_idx, group_idx, multiplicity = np.unique(
+        b_quantized, axis=0, return_index=True, return_inverse=True, return_counts=True
+    )
+    return b_ENU[first_idx], multiplicity, antenna_idx, group_idx.reshape(-1)
+
+
+def baseline_noise(
+    noise_level,
+    bandwidth,
+    int_time,
+    antenna_idx=None,
+    group_idx=None,
+    efficiency=1.0,
+):
+    """Baseline noise.
+
+    Function to compute the thermal noise of the visibilities of each baseline
+    from the per-antenna noise levels with the radiometer equation:
+
+    sigma_ij = sqrt(SEFD_i * SEFD_j / (2 * bandwidth * int_time)) / efficiency,
+
+    which is the standard deviation of the real and imaginary parts of a
+    visibility.
+
+    Parameters
+    ----------
+    noise_level : np.ndarray
+        The system equivalent flux density (SEFD) of each antenna in Jy, e.g. from
+        `load_antenna_enu_txt(noise=True)`.
+    bandwidth : float
+        The channel bandwidth in Hz.
+    int_time : float
+        The integration time of a visibility in seconds.
+    antenna_idx : np.ndarray
+        The (i, j) antenna indices of each baseline. Default is the baselines of
+        `get_baselines`.
+    group_idx : np.ndarray
+        Optional unique baseline index of each antenna pair (see
+        `get_redundant_baselines`). The noise of each unique baseline is then the
+        root mean square noise of its antenna pairs, so that a sample of
+        multiplicity m has the noise variance of the sum of its m antenna pairs.
+    efficiency : float
+        The correlator efficiency.
+
+    Returns
+    -------
+    sigma : np.ndarray
+        The noise standard deviation of each baseline in Jy, shape (n_baselines,)
+        or (n_unique,) with `group_idx`.
+    """
+    noise_level = np.asarray(noise_level, dtype=float)
+    if antenna_idx is None:
+        antenna_idx = get_antenna_idx(len(noise_level))
+    sefd2 = noise_level[antenna_idx[:, 0]] * noise_level[antenna_idx[:, 1]]
+    sigma2 = sefd2 / (2 * bandwidth * int_time) / efficiency**2
+    if group_idx is not None:
+        sigma2 = np.bincount(group_idx, weights=sigma2) / np.bincount(group_idx)
+    return np.sqrt(sigma2)
+
+
 @jit
 def ENU_to_XYZ(b_ENU, lat=35.0 / 180 * jnp.pi):
     """ENU to XYZ (JAX version).
 
     Function to convert the baselines from East-North-Up (ENU) to XYZ coordinates.
+    The conversion is a rotation around the East axis, so it also applies to
+    antenna positions (including an antenna at the array origin).
 
     Parameters
     ----------
@@ -236,14 +394,12 @@ def ENU_to_XYZ(b_ENU, lat=35.0 / 180 * jnp.pi):
     Z : jnp.ndarray
         The Z coordinate of the baselines in XYZ coordinates.
     """
-    # Compute baseline length, Azimuth and Elevation angles
-    D = jnp.sqrt(jnp.sum(b_ENU**2, axis=1))
-    A = jnp.arctan2(b_ENU[:, 0], b_ENU[:, 1])
-    E = jnp.arcsin(b_ENU[:, 2] / D)
-    # Compute the baseline in XYZ coordinates
-    X = D * (jnp.cos(lat) * jnp.sin(E) - jnp.sin(lat) * jnp.cos(E) * jnp.cos(A))
-    Y = D * jnp.cos(E) * jnp.sin(A)
-    Z = D * (jnp.sin(lat) * jnp.sin(E) + jnp.cos(lat) * jnp.cos(E) * jnp.cos(A))
+    # Equivalent to the (length, azimuth, elevation) formulation:
+    # D*sin(E) = U, D*cos(E)*cos(A) = N, D*cos(E)*sin(A) = E
+    E, N, U = b_ENU[:, 0], b_ENU[:, 1], b_ENU[:, 2]
+    X = jnp.cos(lat) * U - jnp.sin(lat) * N
+    Y = E
+    Z = jnp.sin(lat) * U + jnp.cos(lat) * N
 
     return X, Y, Z
 
@@ -279,8 +435,7 @@ def XYZ_to_uvw(X, Y, Z, dec=30.0 / 180 * jnp.pi, ha=0.0, f=1420e6):
     w : np.ndarray
         The w coordinate of the baselines in uvw coordinates.
     """
-    c = 299792458.0
-    lam_inv = f / c
+    lam_inv = f / SPEED_OF_LIGHT
     u = lam_inv * (jnp.sin(ha) * X + jnp.cos(ha) * Y)
     v = lam_inv * (
         -jnp.sin(dec) * jnp.cos(ha) * X
@@ -295,6 +450,152 @@ def XYZ_to_uvw(X, Y, Z, dec=30.0 / 180 * jnp.pi, ha=0.0, f=1420e6):
     return u, v, w
 
 
+def uvw_track_meters(X, Y, Z, dec, h, antenna_idx=None):
+    """Uvw track in meters (JAX version).
+
+    Function to compute the uvw coordinates in meters of the baselines for a list
+    of hour angles.
+
+    Parameters
+    ----------
+    X : jnp.ndarray
+        The X coordinate of the baselines (or antennas) in XYZ coordinates.
+    Y : jnp.ndarray
+        The Y coordinate of the baselines (or antennas) in XYZ coordinates.
+    Z : jnp.ndarray
+        The Z coordinate of the baselines (or antennas) in XYZ coordinates.
+    dec : float
+        The declination of the source in radians.
+    h : jnp.ndarray
+        The hour angles in radians.
+    antenna_idx : np.ndarray
+        Optional (i, j) antenna indices of the baselines. If given, the XYZ
+        coordinates are antenna positions and the baselines are formed from them.
+
+    Returns
+    -------
+    track_m : jnp.ndarray
+        The uvw coordinates in meters, shape (n_times, n_baselines, 3).
+    """
+    # Vectorise the function XYZ_to_uvw over the time steps h (5th argument of XYZ_to_uvw)
+    vmap_ha = vmap(XYZ_to_uvw, in_axes=(None, None, None, None, 0, None))
+
+    # Compute the uvw coordinates in meters for all time steps (f = c)
+    u, v, w = vmap_ha(X, Y, Z, dec, h, SPEED_OF_LIGHT)
+
+    # Stack the uvw coordinates in a single array
+    track_m = jnp.stack([u, v, w], axis=-1)
+
+    if antenna_idx is not None:
+        # Form the baselines from the per-antenna uvw coordinates
+        antenna_idx = jnp.asarray(antenna_idx)
+        track_m = track_m[:, antenna_idx[:, 0]] - track_m[:, antenna_idx[:, 1]]
+
+    return track_m
+
+
+def stack_XYZ(b_ENU, lat=35.0 / 180 * jnp.pi, precision=None):
+    """Stack XYZ.
+
+    Function to convert the baselines (or antenna positions) from ENU to XYZ
+    coordinates, stacked in a single array. The conversion runs on the shape
+    bucket of the input (see `jax_utils.shape_bucket`) to limit recompilations.
+
+    Parameters
+    ----------
+    b_ENU : np.ndarray
+        The baselines (or antenna positions) in ENU coordinates.
+    lat : float
+        The latitude of the antenna array in radians.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    XYZ : np.ndarray
+        The baselines (or antenna positions) in XYZ coordinates, shape (n, 3).
+    """
+    b_ENU = np.asarray(b_ENU, dtype=real_dtype(precision))
+    X, Y, Z = ENU_to_XYZ(pad_to_bucket(b_ENU), np.asarray(lat, dtype=b_ENU.dtype))
+    return np.stack([X, Y, Z], axis=-1)[: b_ENU.shape[0]]
+
+
+def _uv_track(XYZ, antenna_idx, dec, h, lam_inv):
+    """Uv track in meters, or in wavelengths if lam_inv is given."""
+    track_m = uvw_track_meters(XYZ[:, 0], XYZ[:, 1], XYZ[:, 2], dec, h, antenna_idx)
+    if lam_inv is None:
+        return track_m
+    return lam_inv[:, None, None, None] * track_m
+
+
+def compiled_uv_track(XYZ, dec, h, f_range=None, antenna_idx=None, precision=None):
+    """Compiled uv track (JAX version).
+
+    Function to compute the uvw track with a compiled function. The baselines (or
+    antennas), time steps and frequencies are zero-padded to their shape bucket
+    (see `jax_utils.shape_bucket`) and the compiled function is cached per bucket,
+    so that tracks of similar sizes reuse the same compilation. The padded entries
+    are sliced out of the result. The cache keeps the most recently used
+    compilations. If `dec` is an array, the track is computed for a batch of
+    pointings, with a leading pointing axis.
+
+    Parameters
+    ----------
+    XYZ : np.ndarray
+        The baselines in XYZ coordinates, shape (n_baselines, 3) (see `stack_XYZ`).
+        If `antenna_idx` is given, the antenna positions in XYZ coordinates instead.
+    dec : float or np.ndarray
+        The declination of the source in radians, or the declinations of a batch
+        of pointings, shape (n_pointings,).
+    h : np.ndarray
+        The hour angles in radians, shape (n_times,), or (n_pointings, n_times)
+        for a batch of pointings.
+    f_range : np.ndarray
+        Optional frequency list in Hz. If None, the track is returned in meters.
+    antenna_idx : np.ndarray
+        Optional (i, j) antenna indices of the baselines.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    track : jnp.ndarray
+        The uvw track, shape (n_freqs, n_times, n_baselines, 3), or
+        (n_times, n_baselines, 3) in meters if `f_range` is None. For a batch of
+        pointings, the track has a leading (n_pointings,) axis.
+    """
+    XYZ = np.asarray(XYZ, dtype=real_dtype(precision))
+    dec = np.asarray(dec, dtype=XYZ.dtype)
+    h = np.asarray(h, dtype=XYZ.dtype)
+    batched = dec.ndim > 0
+    n_times = h.shape[-1]
+    n_baselines = XYZ.shape[0] if antenna_idx is None else len(antenna_idx)
+    # Pad the inputs to their shape bucket, the padded entries are zero
+    args = [
+        pad_to_bucket(XYZ),
+        None if antenna_idx is None else pad_to_bucket(antenna_idx),
+        pad_to_bucket(dec) if batched else dec,
+        pad_to_bucket(pad_to_bucket(h, axis=-1)) if batched else pad_to_bucket(h),
+        None if f_range is None else pad_to_bucket(f_range / SPEED_OF_LIGHT),
+    ]
+    key = tuple(None if a is None else (a.shape, a.dtype) for a in args)
+    if key in _uv_track_cache:
+        _uv_track_cache.move_to_end(key)
+    else:
+        fn = vmap(_uv_track, in_axes=(None, None, 0, 0, None)) if batched else _uv_track
+        _uv_track_cache[key] = jit(fn).lower(*args).compile()
+        if len(_uv_track_cache) > _UV_TRACK_CACHE_SIZE:
+            _uv_track_cache.popitem(last=False)
+    track = _uv_track_cache[key](*args)
+    if batched:
+        track = track[: dec.shape[0]]
+    if f_range is None:
+        return track[..., :n_times, :n_baselines, :]
+    return track[..., : len(f_range), :n_times, :n_baselines, :]
+
+
 def uv_track_multiband(
     b_ENU,
     lat=35.0 / 180 * jnp.pi,
@@ -306,6 +607,10 @@ def uv_track_multiband(
     df=0.0,
     n_freqs=1,
     multi_band=False,
+    antenna_idx=None,
+    lazy=False,
+    precision=None,
+    XYZ=None,
 ):
     """Uv track multiband (JAX version).
 
@@ -314,7 +619,8 @@ def uv_track_multiband(
     Parameters
     ----------
     b_ENU : np.ndarray
-        The baselines in ENU coordinates.
+        The baselines in ENU coordinates. If `antenna_idx` is given, the antenna
+        positions in ENU coordinates instead.
     lat : float
         The latitude of the antenna array in radians.
     dec : float
@@ -333,32 +639,46 @@ def uv_track_multiband(
         The number of frequency samples.
     multi_band : bool
         If True separate the uv samples per frequency bands.
+    antenna_idx : np.ndarray
+        Optional (i, j) antenna indices of the baselines (see `get_antenna_idx`).
+        If given, the uvw coordinates are computed once per antenna and the
+        baselines are formed afterwards as uvw_i - uvw_j, which scales with the
+        number of antennas instead of the number of baselines.
+    lazy : bool
+        If True, return a `UVTrack` holding the uvw coordinates in meters and the
+        frequency list, instead of the uv samples for every frequency. The
+        'multi_band' option is then ignored.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    XYZ : np.ndarray
+        Optional XYZ coordinates of `b_ENU` at latitude `lat` (see `stack_XYZ`),
+        e.g. cached by an `Observatory`, to skip the ENU to XYZ conversion.
 
     Returns
     -------
-    track : jnp.ndarray
+    track : jnp.ndarray or UVTrack
         The uv sampling baselines listed for each time step and frequency.
     f_range : jnp.ndarray
         The list of frequency bands used in the simulation.
     """
-    # Compute the baselines in XYZ coordinates
-    X, Y, Z = ENU_to_XYZ(b_ENU, lat)
+    # Compute the baselines (or antenna positions) in XYZ coordinates
+    if XYZ is None:
+        XYZ = stack_XYZ(b_ENU, lat, precision)
     # Compute the time steps
     h = jnp.linspace(t_0, t_0 + track_time, n_times) * jnp.pi / 12
     # Compute the frequency range
-    f_range = jnp.linspace(f - df / 2, f + df / 2, n_freqs)
+    f_range = jnp.linspace(f - df / 2, f + df / 2, n_freqs, dtype=real_dtype(precision))
 
-    # Vectorise the function XYZ_to_uvw over the time steps h (5th argument of XYZ_to_uvw)
-    vmap_ha = vmap(XYZ_to_uvw, in_axes=(None, None, None, None, 0, None))
-
-    # Vectorise the function vmap_ha over the frequency bands f_range (6th argument of vmap_ha)
-    vmap_f = vmap(vmap_ha, in_axes=(None, None, None, None, None, 0))
+    if lazy:
+        # Compute the uvw coordinates in meters for all time steps
+        track_m = compiled_uv_track(
+            XYZ, dec, h, antenna_idx=antenna_idx, precision=precision
+        )
+        return UVTrack(track_m.reshape(-1, 3), f_range), f_range
 
     # Compute the uvw coordinates for all baselines, time steps and frequency bands
-    u, v, w = vmap_f(X, Y, Z, dec, h, f_range)
-
-    # Stack the uvw coordinates in a single array
-    track_f = jnp.stack([u, v, w], axis=-1)
+    track_f = compiled_uv_track(XYZ, dec, h, f_range, antenna_idx, precision)
 
     if multi_band:
         # Separate the uv samples per frequency bands
@@ -369,6 +689,544 @@ def uv_track_multiband(
     return track, f_range
 
 
+def uv_track_stream(
+    b_ENU,
+    lat=35.0 / 180 * jnp.pi,
+    dec=35.0 / 180 * jnp.pi,
+    track_time=0.0,
+    t_0=0.0,
+    n_times=1,
+    f=1420e6,
+    df=0.0,
+    n_freqs=1,
+    antenna_idx=None,
+    max_bytes=2**28,
+    precision=None,
+    XYZ=None,
+):
+    """Uv track stream (JAX version).
+
+    Generator version of `uv_track_multiband` which yields the track by blocks of
+    time steps and frequency bands, so that the full track is never held in memory.
+    The blocks are sized so that the uv samples of a block (all baselines, in
+    wavelengths) fit in `max_bytes`. Time blocks are the outer loop.
+
+    Parameters
+    ----------
+    b_ENU : np.ndarray
+        The baselines in ENU coordinates. If `antenna_idx` is given, the antenna
+        positions in ENU coordinates instead.
+    lat : float
+        The latitude of the antenna array in radians.
+    dec : float
+        The declination of the source in radians.
+    track_time : float
+        The duration of the tracking in hours.
+    t_0 : float
+        The initial tracking time in hours.
+    n_times : int
+        The number of time steps.
+    f : float
+        The central frequency of the observation in Hz.
+    df : float
+        The frequency range of the observation in Hz.
+    n_freqs : int
+        The number of frequency samples.
+    antenna_idx : np.ndarray
+        Optional (i, j) antenna indices of the baselines (see `uv_track_multiband`).
+    max_bytes : int
+        The memory budget in bytes for the uv samples of a block.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    XYZ : np.ndarray
+        Optional XYZ coordinates of `b_ENU` at latitude `lat` (see `stack_XYZ`),
+        e.g. cached by an `Observatory`, to skip the ENU to XYZ conversion.
+
+    Yields
+    ------
+    track_chunk : UVTrack
+        The track of a block of time steps and frequency bands. Its `channels`
+        attribute gives the band indices within the full frequency range.
+    """
+    if XYZ is None:
+        XYZ = stack_XYZ(b_ENU, lat, precision)
+    h = jnp.linspace(t_0, t_0 + track_time, n_times) * jnp.pi / 12
+    f_range = jnp.linspace(f - df / 2, f + df / 2, n_freqs, dtype=real_dtype(precision))
+
+    # Bytes of the uv samples of a single time step and frequency band
+    n_baselines = XYZ.shape[0] if antenna_idx is None else len(antenna_idx)
+    step_bytes = max(n_baselines * 3 * f_range.dtype.itemsize, 1)
+    t_block = int(min(max(max_bytes // step_bytes, 1), n_times))
+    f_block = int(min(max(max_bytes // (step_bytes * t_block), 1), n_freqs))
+
+    for t_start in range(0, n_times, t_block):
+        h_block = h[t_start : t_start + t_block]
+        track_m = compiled_uv_track(
+            XYZ, dec, h_block, antenna_idx=antenna_idx, precision=precision
+        )
+        track_m = track_m.reshape(-1, 3)
+        for f_start in range(0, n_freqs, f_block):
+            f_stop = min(f_start + f_block, n_freqs)
+            yield UVTrack(
+                track_m, f_range[f_start:f_stop], channels=np.arange(f_start, f_stop)
+            )
+
+
+def uv_track_pointings_stream(
+    b_ENU,
+    lat=35.0 / 180 * jnp.pi,
+    dec=35.0 / 180 * jnp.pi,
+    track_time=0.0,
+    t_0=0.0,
+    n_times=1,
+    f=1420e6,
+    df=0.0,
+    n_freqs=1,
+    multi_band=False,
+    antenna_idx=None,
+    max_bytes=2**28,
+    precision=None,
+    XYZ=None,
+):
+    """Uv track pointings stream (JAX version).
+
+    Function to compute the uv tracks of a batch of pointings, e.g. a survey
+    tiling, with a single vectorised function per block of pointings. The blocks
+    are sized so that the uv samples of a block fit in `max_bytes`.
+
+    Parameters
+    ----------
+    b_ENU : np.ndarray
+        The baselines in ENU coordinates. If `antenna_idx` is given, the antenna
+        positions in ENU coordinates instead.
+    lat : float
+        The latitude of the antenna array in radians.
+    dec : np.ndarray
+        The declination of each pointing in radians, shape (n_pointings,).
+    track_time : float
+        The duration of the tracking in hours.
+    t_0 : float or np.ndarray
+        The initial tracking time in hours, common to all pointings or one per
+        pointing, shape (n_pointings,).
+    n_times : int
+        The number of time steps.
+    f : float
+        The central frequency of the observation in Hz.
+    df : float
+        The frequency range of the observation in Hz.
+    n_freqs : int
+        The number of frequency samples.
+    multi_band : bool
+        If True separate the uv samples per frequency bands.
+    antenna_idx : np.ndarray
+        Optional (i, j) antenna indices of the baselines (see `uv_track_multiband`).
+    max_bytes : int
+        The memory budget in bytes for the uv samples of a block of pointings.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    XYZ : np.ndarray
+        Optional XYZ coordinates of `b_ENU` at latitude `lat` (see `stack_XYZ`).
+
+    Yields
+    ------
+    pointing_idx : np.ndarray
+        The indices of the pointings of the block.
+    track : jnp.ndarray
+        The uv samples of the block, shape (n_block, ...) where each entry is
+        formatted as the track returned by `uv_track_multiband`.
+    """
+    if XYZ is None:
+        XYZ = stack_XYZ(b_ENU, lat, precision)
+    dtype = real_dtype(precision)
+    dec, t_0 = np.broadcast_arrays(np.atleast_1d(dec), t_0)
+    n_pointings = dec.shape[0]
+    # Time steps of each pointing, shape (n_pointings, n_times)
+    h = np.linspace(t_0, t_0 + track_time, n_times, axis=-1) * np.pi / 12
+    f_range = jnp.linspace(f - df / 2, f + df / 2, n_freqs, dtype=dtype)
+
+    # Bytes of the uv samples of a single pointing
+    n_baselines = XYZ.shape[0] if antenna_idx is None else len(antenna_idx)
+    pointing_bytes = max(n_freqs * n_times * n_baselines * 3 * dtype.itemsize, 1)
+    p_block = int(min(max(max_bytes // pointing_bytes, 1), n_pointings))
+
+    for p_start in range(0, n_pointings, p_block):
+        idx = np.arange(p_start, min(p_start + p_block, n_pointings))
+        track_f = compiled_uv_track(
+            XYZ, dec[idx], h[idx], f_range, antenna_idx, precision
+        )
+        if multi_band:
+            yield idx, track_f.reshape(len(idx), n_freqs, -1, 3)
+        else:
+            yield idx, track_f.reshape(len(idx), -1, 3)
+
+
+def uv_track_pointings(
+    b_ENU,
+    lat=35.0 / 180 * jnp.pi,
+    dec=35.0 / 180 * jnp.pi,
+    track_time=0.0,
+    t_0=0.0,
+    n_times=1,
+    f=1420e6,
+    df=0.0,
+    n_freqs=1,
+    multi_band=False,
+    antenna_idx=None,
+    max_bytes=2**28,
+    precision=None,
+    XYZ=None,
+):
+    """Uv track pointings (JAX version).
+
+    Function to compute the uv tracks of a batch of pointings, stacked along a
+    leading pointing axis. See `uv_track_pointings_stream` for the parameters,
+    the pointings are computed by blocks of at most `max_bytes`.
+
+    Returns
+    -------
+    track : jnp.ndarray
+        The uv samples of each pointing, shape (n_pointings, ...) where each entry
+        is formatted as the track returned by `uv_track_multiband`.
+    f_range : jnp.ndarray
+        The list of frequency bands used in the simulation.
+    """
+    blocks = uv_track_pointings_stream(
+        b_ENU,
+        lat,
+        dec,
+        track_time,
+        t_0,
+        n_times,
+        f,
+        df,
+        n_freqs,
+        multi_band,
+        antenna_idx,
+        max_bytes,
+        precision,
+        XYZ,
+    )
+    track = jnp.concatenate([track_block for _, track_block in blocks])
+    f_range = jnp.linspace(f - df / 2, f + df / 2, n_freqs, dtype=real_dtype(precision))
+    return track, f_range
+
+
+class UVTrack:
+    """Uv track.
+
+    Class to hold a uv track as uvw coordinates in meters plus its frequency list.
+    The uv samples of each frequency band are the meter coordinates scaled by f/c,
+    so they are only computed when a band (or a range of bands) is requested.
+    Iterating over the track yields the uv samples of each frequency band, in the
+    same format as a multi-band track from `uv_track_multiband`.
+
+    Attributes
+    ----------
+    uvw : jnp.ndarray
+        The uvw coordinates in meters, shape (n_samples, 3).
+    freqs : jnp.ndarray
+        The frequency list in Hz, shape (n_freqs,).
+    channels : np.ndarray
+        The index of each frequency band within the full observation band, used
+        when the track is a chunk of a larger track (see `uv_track_stream`).
+
+    """
+
+    def __init__(self, uvw, freqs, channels=None):
+        """Initialize the uv track.
+
+        Parameters
+        ----------
+        uvw : np.ndarray
+            The uvw coordinates in meters, shape (n_samples, 3).
+        freqs : np.ndarray
+            The frequency list in Hz.
+        channels : np.ndarray
+            Optional index of each frequency band within the full observation band.
+            Default is range(n_freqs).
+
+        """
+        self.uvw = jnp.asarray(uvw)
+        self.freqs = jnp.atleast_1d(jnp.asarray(freqs))
+        if channels is None:
+            channels = np.arange(len(self.freqs))
+        self.channels = np.asarray(channels)
+
+    def __len__(self):
+        """Return the number of frequency bands."""
+        return self.freqs.shape[0]
+
+    def __getitem__(self, idx):
+        """Uv samples of a frequency band.
+
+        Parameters
+        ----------
+        idx : int or slice
+            The frequency band index, or a slice of frequency bands.
+
+        Returns
+        -------
+        track : jnp.ndarray
+            The uv samples in wavelengths, shape (n_samples, 3) for a single band
+            or (n_bands, n_samples, 3) for a slice.
+
+        """
+        lam_inv = self.freqs[idx] / SPEED_OF_LIGHT
+        return lam_inv[..., None, None] * self.uvw
+
+    def __iter__(self):
+        """Iterate over the uv samples of each frequency band."""
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def shape(self):
+        """Shape of the (multi-band) uv samples array represented by the track."""
+        return (len(self), self.uvw.shape[0], 3)
+
+    def to_array(self, multi_band=False):
+        """To array.
+
+        Function to compute the uv samples for all frequency bands.
+
+        Parameters
+        ----------
+        multi_band : bool
+            If True separate the uv samples per frequency bands.
+
+        Returns
+        -------
+        track : jnp.ndarray
+            The uv samples, in the format returned by `uv_track_multiband`.
+
+        """
+        track_f = self[:]
+        return track_f if multi_band else track_f.reshape(-1, 3)
+
+
+class Observatory:
+    """Observatory.
+
+    Class to hold an antenna array at a given latitude. The baselines and their
+    XYZ coordinates only depend on the antenna positions and the latitude, so they
+    are computed once and reused for all pointings (declination, hour angles and
+    frequencies) of the array. Changing the antenna positions or the latitude
+    invalidates the cached coordinates.
+
+    Attributes
+    ----------
+    antenna : np.ndarray
+        The antenna positions in ENU coordinates.
+    lat : float
+        The latitude of the antenna array in radians.
+    unique : bool
+        If True only use the unique baselines (i < j).
+    antenna_based : bool
+        If True compute the uvw coordinates per antenna and form the baselines as
+        differences of antenna coordinates (see `uvw_track_meters`).
+
+    """
+
+    def __init__(
+        self, antenna, lat=35.0 / 180 * jnp.pi, unique=False, antenna_based=False
+    ):
+        """Initialize the observatory.
+
+        Parameters
+        ----------
+        antenna : np.ndarray
+            The antenna positions in ENU coordinates.
+        lat : float
+            The latitude of the antenna array in radians.
+        unique : bool
+            If True only use the unique baselines (i < j).
+        antenna_based : bool
+            If True compute the uvw coordinates per antenna.
+
+        """
+        self.unique = unique
+        self.antenna_based = antenna_based
+        self.antenna = None
+        self.lat = None
+        self.set_antenna(antenna)
+        self.set_lat(lat)
+
+    def set_antenna(self, antenna):
+        """Set the antenna positions, invalidating the cache if they changed.
+
+        Parameters
+        ----------
+        antenna : np.ndarray
+            The antenna positions in ENU coordinates.
+
+        """
+        antenna = np.array(antenna, dtype=float)
+        if self.antenna is None or not np.array_equal(antenna, self.antenna):
+            self.antenna = antenna
+            self._baselines = None
+            self._XYZ = {}
+
+    def set_lat(self, lat):
+        """Set the latitude, invalidating the cache if it changed.
+
+        Parameters
+        ----------
+        lat : float
+            The latitude of the antenna array in radians.
+
+        """
+        lat = float(lat)
+        if lat != self.lat:
+            self.lat = lat
+            self._XYZ = {}
+
+    @property
+    def baselines(self):
+        """Baselines in ENU coordinates and their (i, j) antenna indices."""
+        if self._baselines is None:
+            if self.unique:
+                self._baselines = get_baselines(self.antenna, unique=True)
+            else:
+                antenna_idx = get_antenna_idx(self.antenna.shape[0])
+                self._baselines = (get_baselines(self.antenna), antenna_idx)
+        return self._baselines
+
+    def XYZ(self, precision=None):
+        """XYZ coordinates.
+
+        Function to get the cached XYZ coordinates of the baselines, or of the
+        antennas if `antenna_based` is True.
+
+        Parameters
+        ----------
+        precision : str
+            Optional precision, 'single' or 'double'. Default is the global
+            precision (see `jax_utils.set_precision`).
+
+        Returns
+        -------
+        XYZ : np.ndarray
+            The XYZ coordinates, shape (n, 3).
+
+        """
+        dtype = real_dtype(precision)
+        if dtype not in self._XYZ:
+            b_ENU = self.antenna if self.antenna_based else self.baselines[0]
+            self._XYZ[dtype] = stack_XYZ(b_ENU, self.lat, precision)
+        return self._XYZ[dtype]
+
+    def _track_args(self, precision):
+        """Arguments of the uv track functions sharing the cached coordinates."""
+        if self.antenna_based:
+            b_ENU, antenna_idx = self.antenna, self.baselines[1]
+        else:
+            b_ENU, antenna_idx = self.baselines[0], None
+        return {
+            "b_ENU": b_ENU,
+            "lat": self.lat,
+            "antenna_idx": antenna_idx,
+            "precision": precision,
+            "XYZ": self.XYZ(precision),
+        }
+
+    def uv_track(
+        self,
+        dec,
+        track_time,
+        t_0,
+        n_times,
+        f,
+        df,
+        n_freqs,
+        multi_band=False,
+        lazy=False,
+        precision=None,
+    ):
+        """Uv track.
+
+        Function to compute the uv track of a pointing reusing the cached XYZ
+        coordinates. See `uv_track_multiband` for the parameters and outputs.
+
+        """
+        return uv_track_multiband(
+            dec=dec,
+            track_time=track_time,
+            t_0=t_0,
+            n_times=n_times,
+            f=f,
+            df=df,
+            n_freqs=n_freqs,
+            multi_band=multi_band,
+            lazy=lazy,
+            **self._track_args(precision),
+        )
+
+    def uv_track_pointings(
+        self,
+        dec,
+        track_time,
+        t_0,
+        n_times,
+        f,
+        df,
+        n_freqs,
+        multi_band=False,
+        max_bytes=2**28,
+        precision=None,
+    ):
+        """Uv track pointings.
+
+        Function to compute the uv tracks of a batch of pointings reusing the
+        cached XYZ coordinates. See `uv_track_pointings` for the parameters and
+        outputs.
+
+        """
+        return uv_track_pointings(
+            dec=dec,
+            track_time=track_time,
+            t_0=t_0,
+            n_times=n_times,
+            f=f,
+            df=df,
+            n_freqs=n_freqs,
+            multi_band=multi_band,
+            max_bytes=max_bytes,
+            **self._track_args(precision),
+        )
+
+    def uv_track_stream(
+        self,
+        dec,
+        track_time,
+        t_0,
+        n_times,
+        f,
+        df,
+        n_freqs=1,
+        max_bytes=2**28,
+        precision=None,
+    ):
+        """Uv track stream.
+
+        Function to stream the uv track of a pointing reusing the cached XYZ
+        coordinates. See `uv_track_stream` for the parameters and outputs.
+
+        """
+        return uv_track_stream(
+            dec=dec,
+            track_time=track_time,
+            t_0=t_0,
+            n_times=n_times,
+            f=f,
+            df=df,
+            n_freqs=n_freqs,
+            max_bytes=max_bytes,
+            **self._track_args(precision),
+        )
+
+
 def combine_antenna_arr(arr1, arr2):
     """Combine antenna arr.
 
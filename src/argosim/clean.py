@@ -10,6 +10,7 @@ the Hogbom's clean algorithm on dirty observations.
 import numpy as np
 
 from argosim.data_utils import gauss_source
+from argosim.jax_utils import get_precision, real_dtype
 
 
 def shift_beam(beam, shift_x, shift_y):
@@ -46,6 +47,39 @@ def shift_beam(beam, shift_x, shift_y):
     return beam_shift
 
 
+def cut_beam(beam, x_max, y_max, shape):
+    """Cut beam.
+
+    Function to cut the window of an oversized beam image which places the beam
+    centre at the pixel (x_max, y_max) of an image, without truncation.
+
+    Parameters
+    ----------
+    beam : np.ndarray
+        The oversized beam image, at least twice the image size (see
+        `imaging_utils.oversize_beam`).
+    x_max : int
+        The x coordinate of the beam centre in the image.
+    y_max : int
+        The y coordinate of the beam centre in the image.
+    shape : tuple
+        The shape of the image.
+
+    Returns
+    -------
+    beam_cut : np.ndarray
+        The beam window, of the image shape.
+    """
+    y_0, x_0 = beam.shape[0] // 2 - y_max, beam.shape[1] // 2 - x_max
+    if (
+        min(y_0, x_0) < 0
+        or y_0 + shape[0] > beam.shape[0]
+        or x_0 + shape[1] > beam.shape[1]
+    ):
+        raise ValueError("The beam is too small to be centred on the peak.")
+    return beam[y_0 : y_0 + shape[0], x_0 : x_0 + shape[1]]
+
+
 def find_peak(I):
     """Find peak.
 
@@ -101,7 +135,14 @@ def pad_odd(im):
 
 
 def clean_hogbom(
-    I_obs, B, gamma=0.2, max_iter=100, threshold=None, clean_beam_size_px=2, res=False
+    I_obs,
+    B,
+    gamma=0.2,
+    max_iter=100,
+    threshold=None,
+    clean_beam_size_px=2,
+    res=False,
+    precision=None,
 ):
     """Clean Hogbom.
 
@@ -112,7 +153,10 @@ def clean_hogbom(
     I_obs : np.ndarray
         The dirty image.
     B : np.ndarray
-        The beam image (fft shifted).
+        The beam image (fft shifted). A beam of at least twice the image size
+        (see `imaging_utils.oversize_beam`) is cut around each peak instead of
+        being shifted, so that the sources near the image edges are subtracted
+        with their full sidelobes.
     gamma : float
         The clean gain.
     max_iter : int
@@ -123,6 +167,9 @@ def clean_hogbom(
         The size (FWHM) of the clean beam in pixels.
     res : bool
         Add residual signal to clean image.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
 
     Returns
     -------
@@ -131,19 +178,30 @@ def clean_hogbom(
     sky_model : np.ndarray
         The sky model image.
     """
+    if get_precision(precision) is not None:
+        I_obs = np.asarray(I_obs, dtype=real_dtype(precision))
+        B = np.asarray(B, dtype=real_dtype(precision))
+
     # If the observation and beam are even in size, pad them with zeros at the bottom and right
     # An odd beam is easier to place at the image peaks
     if I_obs.shape[0] % 2 == 0:
         I_obs = pad_odd(I_obs)
         B = pad_odd(B)
 
+    # An oversized beam covers the sidelobes of any peak of the image
+    oversized = B.shape[0] >= 2 * I_obs.shape[0] - 1
+
     I_res = I_obs.copy()
     I_clean = np.zeros_like(I_obs)
     sky_model = np.zeros_like(I_obs)
     B_norm = B / np.max(B)
     # B_clean = clean_beam(B_norm, search_box=B_norm.shape[0]//8)
     B_clean = gauss_source(
-        B.shape[1], B.shape[0], np.array([0, 0]), fwhm_pix=clean_beam_size_px
+        I_obs.shape[1],
+        I_obs.shape[0],
+        np.array([0, 0]),
+        fwhm_pix=clean_beam_size_px,
+        precision=precision,
     )
 
     for i in range(max_iter):
@@ -153,7 +211,10 @@ def clean_hogbom(
             print("Reached threshold at iteration {}".format(i))
             break
         # Subtract the peak from the dirty image
-        I_res -= gamma * max_val * shift_beam(B_norm, shift_x, shift_y)
+        if oversized:
+            I_res -= gamma * max_val * cut_beam(B_norm, x_max, y_max, I_res.shape)
+        else:
+            I_res -= gamma * max_val * shift_beam(B_norm, shift_x, shift_y)
         sky_model[y_max, x_max] += gamma * max_val
         I_clean += gamma * max_val * shift_beam(B_clean, shift_x, shift_y)
 
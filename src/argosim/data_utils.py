@@ -10,10 +10,13 @@ This module contains functions to generate synthetic observations for the Argosi
 import jax.numpy as jnp
 import numpy as np
 
-from argosim.rand_utils import local_seed
+from argosim.jax_utils import cast_precision, get_precision, real_dtype
+from argosim.rand_utils import local_rng
 
 
-def gauss_source(nx=512, ny=512, mu=np.array([0, 0]), sigma=np.eye(2), fwhm_pix=64):
+def gauss_source(
+    nx=512, ny=512, mu=np.array([0, 0]), sigma=np.eye(2), fwhm_pix=64, precision=None
+):
     """Gauss source (JAX version).
 
     Function to generate a 2D Gaussian source.
@@ -30,6 +33,9 @@ def gauss_source(nx=512, ny=512, mu=np.array([0, 0]), sigma=np.eye(2), fwhm_pix=
         The covariance matrix of the Gaussian source.
     fwhm_pix : float
         The FWHM of the Gaussian source in pixels.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
 
     Returns
     -------
@@ -49,10 +55,12 @@ def gauss_source(nx=512, ny=512, mu=np.array([0, 0]), sigma=np.eye(2), fwhm_pix=
     sigminv = jnp.linalg.inv(sigma)
     sigminv.dot(X_unroll).shape
     Q = jnp.sum(jnp.multiply(X_unroll, sigminv.dot(X_unroll)), axis=0).reshape(ny, nx)
-    return jnp.exp(-Q / 2)  # /(np.sqrt(2*np.pi*np.abs(np.linalg.det(sigma))))
+    return cast_precision(
+        jnp.exp(-Q / 2), precision
+    )  # /(np.sqrt(2*np.pi*np.abs(np.linalg.det(sigma))))
 
 
-def sigma2d(min_var=5, cov_lim=0.5, seed=None):
+def sigma2d(min_var=5, cov_lim=0.5, seed=None, rng=None):
     """Sigma 2D.
 
     Function to generate a random 2D covariance matrix.
@@ -65,22 +73,25 @@ def sigma2d(min_var=5, cov_lim=0.5, seed=None):
         The limit of the covariance between gaussian components.
     seed : int
         Optional seed to set.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
 
     Returns
     -------
     sigma : np.ndarray
         The 2D covariance matrix.
     """
-    with local_seed(seed):
-        var_1 = np.random.rand() + min_var
+    with local_rng(seed, rng) as gen:
+        var_1 = gen.random() + min_var
         # Limit eccentricity
-        var_2 = np.random.rand() + min_var
+        var_2 = gen.random() + min_var
         # Cov <= sqrt(var1 x var2)
-        cov12 = (np.random.rand() * 2 - 1) * np.sqrt(var_1 * var_2) * cov_lim
+        cov12 = (gen.random() * 2 - 1) * np.sqrt(var_1 * var_2) * cov_lim
     return np.array([[var_1, cov12], [cov12, var_2]])
 
 
-def mu2d(seed=None):
+def mu2d(seed=None, rng=None):
     """Mu 2D.
 
     Function to generate a random 2D mean vector in the range [-1,1]x[-1,1].
@@ -89,18 +100,21 @@ def mu2d(seed=None):
     ----------
     seed : int
         Optional seed to set
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
 
     Returns
     -------
     mu : np.ndarray
         The 2D mean vector.
     """
-    with local_seed(seed):
-        mu = np.random.rand(2) * 2 - 1
+    with local_rng(seed, rng) as gen:
+        mu = gen.random(2) * 2 - 1
     return mu
 
 
-def random_source(shape, pix_size, seed=None):
+def random_source(shape, pix_size, seed=None, precision=None, rng=None):
     """Random source.
 
     Function to generate 2D Gaussian source with random mean and covariance.
@@ -113,20 +127,33 @@ def random_source(shape, pix_size, seed=None):
         The size in pixels of the Gaussian source.
     seed : int
         Optional seed to set
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
 
     Returns
     -------
     source : np.ndarray
         Image of size (nx,ny) containing the 2D Gaussian source.
     """
-    with local_seed(seed):
-        mu = mu2d()
-        sigma = sigma2d()
-    return gauss_source(shape[0], shape[1], mu, sigma, pix_size)
+    with local_rng(seed, rng) as gen:
+        mu = mu2d(rng=gen)
+        sigma = sigma2d(rng=gen)
+    return gauss_source(shape[0], shape[1], mu, sigma, pix_size, precision)
 
 
 def n_source_sky(
-    shape_px, fov, deg_size_list, source_intensity_list, seed=None, norm="none"
+    shape_px,
+    fov,
+    deg_size_list,
+    source_intensity_list,
+    seed=None,
+    norm="none",
+    precision=None,
+    rng=None,
 ):
     """N source sky.
 
@@ -148,6 +175,12 @@ def n_source_sky(
         Optional seed to set
     norm : str
         The normalization method. Options are 'none', 'flux' and 'max'. Default is 'none'.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
 
     Returns
     -------
@@ -156,9 +189,12 @@ def n_source_sky(
     """
     pix_per_deg = shape_px[0] / fov
     pix_size_list = [deg_size * pix_per_deg for deg_size in deg_size_list]
-    with local_seed(seed):
+    with local_rng(seed, rng) as gen:
         source_list = [
-            random_source((shape_px[0], shape_px[1]), pix_size) * intensity
+            random_source(
+                (shape_px[0], shape_px[1]), pix_size, precision=precision, rng=gen
+            )
+            * intensity
             for pix_size, intensity in zip(pix_size_list, source_intensity_list)
         ]
 
@@ -173,4 +209,7 @@ def n_source_sky(
     else:
         raise ValueError("Invalid normalization method. Use 'sum', 'max' or 'none'.")
 
+    if get_precision(precision) is not None:
+        norm_sky = norm_sky.astype(real_dtype(precision))
+
     return norm_sky
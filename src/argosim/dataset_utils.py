@@ -0,0 +1,280 @@
+"""Dataset utils.
+
+This module contains functions to write large simulated datasets to disk: the
+samples are generated by a pool of worker processes and streamed into shards
+of memory-mappable '.npy' files, listed in an index which makes the writing
+resumable.
+
+:Authors: Ezequiel Centofanti <ezequiel.centofanti@cea.fr>
+
+"""
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from argosim.data_utils import n_source_sky
+from argosim.imaging_utils import simulate_dirty_batch
+from argosim.rand_utils import fold_rng
+
+INDEX_FILE = "index.json"
+
+
+def simulate_samples(
+    indices,
+    rngs,
+    track,
+    fov_size,
+    sky_shape=(256, 256),
+    n_sources=(1, 10),
+    source_size=(0.005, 0.03),
+    sigma=0.2,
+    **sim_params,
+):
+    """Simulate samples.
+
+    Function to simulate a chunk of dataset samples observed with the same
+    track: random sky models of Gaussian sources (see `data_utils.n_source_sky`),
+    their dirty observations and the dirty beam (see
+    `imaging_utils.simulate_dirty_batch`). It is the default sample function of
+    `write_dataset`.
+
+    Parameters
+    ----------
+    indices : np.ndarray
+        The indices of the samples in the dataset.
+    rngs : list
+        The random generator of each sample, drawing its sky model then its noise.
+    track : np.ndarray
+        The uv sampling points.
+    fov_size : float
+        The field of view size in degrees.
+    sky_shape : tuple
+        The sky image size in pixels.
+    n_sources : tuple
+        The minimum and maximum number of sources of a sky model.
+    source_size : tuple
+        The minimum and maximum size of the sources in degrees.
+    sigma : float
+        The standard deviation of the noise.
+    **sim_params
+        Optional parameters of `imaging_utils.simulate_dirty_batch`.
+
+    Returns
+    -------
+    samples : dict
+        The samples fields, arrays of first axis len(indices): 'sky', 'obs',
+        'psf' and the metadata 'index' and 'n_sources'.
+    """
+    skies, n_sources_list = [], []
+    for rng in rngs:
+        n = int(rng.integers(n_sources[0], n_sources[1] + 1))
+        deg_size_list = rng.uniform(source_size[0], source_size[1], n)
+        skies.append(
+            n_source_sky(
+                sky_shape, fov_size, deg_size_list, [1.0] * n, norm="max", rng=rng
+            )
+        )
+        n_sources_list.append(n)
+    skies = np.array(skies)
+    obs, dirty_beam = simulate_dirty_batch(
+        skies, track, fov_size, sigma, rng=list(rngs), **sim_params
+    )
+    return {
+        "sky": skies.astype(obs.dtype),
+        "obs": obs,
+        "psf": np.broadcast_to(
+            np.asarray(dirty_beam), (len(indices), *np.shape(dirty_beam))
+        ),
+        "index": np.asarray(indices),
+        "n_sources": np.array(n_sources_list),
+    }
+
+
+def load_index(output_dir):
+    """Load index.
+
+    Function to load the index of a dataset written by `write_dataset`.
+
+    Parameters
+    ----------
+    output_dir : str
+        The dataset directory.
+
+    Returns
+    -------
+    index : dict
+        The dataset index: 'n_samples', 'shard_size', 'seed', 'attrs' and
+        'fields' (shape and dtype of a sample of each field) of the dataset, and
+        'shards', the completed shards with their 'start' and 'stop' samples and
+        their 'files' per field.
+    """
+    with open(os.path.join(output_dir, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def _save_index(output_dir, index):
+    """Write the index, then rename it, so that it is never left partial."""
+    path = os.path.join(output_dir, INDEX_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_shard(output_dir, shard, mmap_mode="r"):
+    """Load shard.
+
+    Function to load the fields of a shard of a dataset written by
+    `write_dataset`.
+
+    Parameters
+    ----------
+    output_dir : str
+        The dataset directory.
+    shard : int or dict
+        The shard number, or the shard entry of the index.
+    mmap_mode : str
+        The memory-map mode of the fields (see `numpy.load`), None to load the
+        fields in memory.
+
+    Returns
+    -------
+    samples : dict
+        The fields of the samples of the shard.
+    """
+    if not isinstance(shard, dict):
+        shards = {entry["shard"]: entry for entry in load_index(output_dir)["shards"]}
+        if shard not in shards:
+            raise KeyError(f"Shard {shard} is not completed.")
+        shard = shards[shard]
+    return {
+        name: np.load(os.path.join(output_dir, file), mmap_mode=mmap_mode)
+        for name, file in shard["files"].items()
+    }
+
+
+def _write_shard(output_dir, shard, start, stop, sample_fn, seed, chunk_size):
+    """Generate the samples of a shard and write them to its files."""
+    files, arrays = {}, {}
+    for chunk_start in range(start, stop, chunk_size):
+        indices = np.arange(chunk_start, min(chunk_start + chunk_size, stop))
+        samples = sample_fn(indices, [fold_rng(seed, i) for i in indices])
+        for name, values in samples.items():
+            values = np.asarray(values)
+            if name not in arrays:
+                # Written to temporary files, renamed once the shard is complete
+                files[name] = f"shard_{shard:05d}_{name}.npy"
+                arrays[name] = np.lib.format.open_memmap(
+                    os.path.join(output_dir, f"{files[name]}.tmp"),
+                    mode="w+",
+                    dtype=values.dtype,
+                    shape=(stop - start, *values.shape[1:]),
+                )
+            arrays[name][indices - start] = values
+    for name, array in arrays.items():
+        array.flush()
+        path = os.path.join(output_dir, files[name])
+        os.replace(f"{path}.tmp", path)
+    fields = {
+        name: {"shape": list(array.shape[1:]), "dtype": array.dtype.str}
+        for name, array in arrays.items()
+    }
+    return {"shard": shard, "start": start, "stop": stop, "files": files}, fields
+
+
+def write_dataset(
+    output_dir,
+    sample_fn,
+    n_samples,
+    shard_size=256,
+    chunk_size=32,
+    n_workers=1,
+    seed=0,
+    attrs=None,
+):
+    """Write dataset.
+
+    Function to generate a dataset of samples and write it to disk as shards of
+    memory-mappable '.npy' files, one file per field and shard (e.g.
+    'shard_00000_obs.npy'), listed in an index file (see `load_index`). The
+    shards are generated by a pool of worker processes, by chunks of samples to
+    bound the memory of the workers. The index is updated as soon as a shard is
+    complete, so that an interrupted writing resumes from the completed shards
+    when called again with the same parameters. The random generator of sample
+    i is `rand_utils.fold_rng(seed, i)`, so the samples do not depend on the
+    number of workers nor on the interruptions.
+
+    Parameters
+    ----------
+    output_dir : str
+        The dataset directory, created if needed.
+    sample_fn : callable
+        The sample function, called as `sample_fn(indices, rngs)` with the
+        indices of a chunk of samples and their random generators, and returning
+        a dict of arrays of first axis len(indices), e.g. `simulate_samples` with
+        its parameters bound by `functools.partial`. It must be picklable (e.g.
+        a module-level function) if `n_workers` > 1.
+    n_samples : int
+        The number of samples.
+    shard_size : int
+        The number of samples per shard.
+    chunk_size : int
+        The number of samples per call of the sample function.
+    n_workers : int
+        The number of worker processes. With a single worker, the shards are
+        generated in the calling process.
+    seed : int
+        The seed of the dataset.
+    attrs : dict
+        Optional JSON-serializable attributes stored in the index, e.g. the
+        observation parameters.
+
+    Returns
+    -------
+    index : dict
+        The dataset index (see `load_index`).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    params = {"n_samples": n_samples, "shard_size": shard_size, "seed": seed}
+    if os.path.exists(os.path.join(output_dir, INDEX_FILE)):
+        index = load_index(output_dir)
+        if any(index[key] != value for key, value in params.items()):
+            raise ValueError(
+                "The dataset directory holds a dataset with other parameters: "
+                + ", ".join(f"{key}={index[key]}" for key in params)
+                + "."
+            )
+    else:
+        index = {**params, "attrs": attrs or {}, "fields": {}, "shards": []}
+        _save_index(output_dir, index)
+
+    completed = {entry["shard"] for entry in index["shards"]}
+    pending = [
+        (output_dir, shard, start, min(start + shard_size, n_samples))
+        for shard, start in enumerate(range(0, n_samples, shard_size))
+        if shard not in completed
+    ]
+
+    def add_shard(entry, fields):
+        index["fields"].update(fields)
+        index["shards"] = sorted(index["shards"] + [entry], key=lambda e: e["shard"])
+        _save_index(output_dir, index)
+
+    shard_params = (sample_fn, seed, chunk_size)
+    if n_workers <= 1:
+        for args in pending:
+            add_shard(*_write_shard(*args, *shard_params))
+    else:
+        # Spawned workers, forking a process running JAX may deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(n_workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(_write_shard, *args, *shard_params) for args in pending
+            ]
+            for future in as_completed(futures):
+                add_shard(*future.result())
+
+    return index
@@ -0,0 +1,1016 @@
+"""Gridding utils.
+
+This module contains functions to perform convolutional gridding and degridding
+of visibilities with oversampled anti-aliasing kernels, and the matching image
+plane grid correction. They are combined into non-uniform FFTs to simulate
+observations at the exact (off-grid) uv coordinates, and into w-stacking
+transforms correcting the w-term of wide fields of view.
+
+:Authors: Ezequiel Centofanti <ezequiel.centofanti@cea.fr>
+
+"""
+
+from functools import lru_cache, partial
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+import argosim.jax_utils as aju
+from argosim.imaging_utils import scale_uv_samples, sky2uv, uv2sky
+from argosim.jax_utils import cast_precision, complex_dtype, real_dtype
+from argosim.rand_utils import get_rng, local_rng
+
+
+class GriddingKernel:
+    """Gridding kernel.
+
+    Class to hold an oversampled lookup table of a separable anti-aliasing kernel.
+    The kernel is tabulated once on `support * oversampling + 1` points over
+    [-support / 2, support / 2] pixels, and the gridding taps are linearly
+    interpolated between the table entries.
+
+    Attributes
+    ----------
+    kernel : str
+        The kernel function. Choose between 'kaiser_bessel' and 'exp_semicircle'
+        (exponential of semicircle).
+    support : int
+        The kernel support in pixels.
+    oversampling : int
+        The number of table entries per pixel.
+    beta : float
+        The shape parameter of the kernel.
+    table : np.ndarray
+        The kernel lookup table, shape (support * oversampling + 1,).
+
+    """
+
+    def __init__(
+        self,
+        kernel="kaiser_bessel",
+        support=6,
+        oversampling=128,
+        padding=2.0,
+        beta=None,
+    ):
+        """Initialize the gridding kernel.
+
+        Parameters
+        ----------
+        kernel : str
+            The kernel function. Choose between 'kaiser_bessel' and
+            'exp_semicircle'.
+        support : int
+            The kernel support in pixels.
+        oversampling : int
+            The number of table entries per pixel.
+        padding : float
+            The grid padding factor (uv grid size over image size) the kernel is
+            optimised for, used to set the default `beta`.
+        beta : float
+            Optional shape parameter of the kernel. Default is the optimal value
+            for the support and padding (Beatty et al. 2005).
+
+        """
+        if kernel not in ["kaiser_bessel", "exp_semicircle"]:
+            raise ValueError(
+                "Invalid kernel. Choose between 'kaiser_bessel' and 'exp_semicircle'."
+            )
+        if beta is None:
+            beta = np.pi * np.sqrt(
+                (support / padding) ** 2 * (padding - 0.5) ** 2 - 0.8
+            )
+        self.kernel = kernel
+        self.support = int(support)
+        self.oversampling = int(oversampling)
+        self.beta = float(beta)
+        self.table = self(self.positions)
+
+    @property
+    def positions(self):
+        """Positions of the lookup table entries in pixels."""
+        n_table = self.support * self.oversampling + 1
+        return np.linspace(-self.support / 2, self.support / 2, n_table)
+
+    def __call__(self, x):
+        """Evaluate the kernel.
+
+        Parameters
+        ----------
+        x : np.ndarray
+            The offsets from the kernel centre in pixels.
+
+        Returns
+        -------
+        kernel : np.ndarray
+            The kernel values, zero outside the support.
+
+        """
+        r2 = 1 - (2 * np.asarray(x, dtype=float) / self.support) ** 2
+        sqrt_r2 = np.sqrt(np.clip(r2, 0, None))
+        if self.kernel == "kaiser_bessel":
+            kernel = np.i0(self.beta * sqrt_r2) / np.i0(self.beta)
+        else:
+            kernel = np.exp(self.beta * (sqrt_r2 - 1))
+        return np.where(r2 >= 0, kernel, 0.0)
+
+    def grid_correction(self, shape):
+        """Grid correction.
+
+        Function to compute the image plane correction of the kernel, i.e. the
+        Fourier transform of the kernel evaluated at the image pixels. Images
+        obtained from a convolved grid are divided by the correction, and sky
+        models are divided by it before being degridded. The transform of the
+        analytic kernel is integrated with a Gauss-Legendre quadrature over its
+        support, and cached per shape and kernel.
+
+        Parameters
+        ----------
+        shape : tuple
+            The image shape in pixels.
+
+        Returns
+        -------
+        correction : np.ndarray
+            The grid correction, shape `shape`, read-only.
+
+        """
+        return _grid_correction(self.kernel, self.support, self.beta, tuple(shape))
+
+
+@lru_cache(maxsize=16)
+def _grid_correction(kernel, support, beta, shape):
+    """Grid correction of a kernel, cached per shape and kernel parameters."""
+    gridding_kernel = GriddingKernel(kernel, support, oversampling=1, beta=beta)
+    # The kernel is even, 2 * support Gauss-Legendre nodes over [0, support / 2]
+    nodes, weights = np.polynomial.legendre.leggauss(2 * support)
+    nodes, weights = (nodes + 1) * support / 4, weights * support / 2
+    kernel_weights = gridding_kernel(nodes) * weights
+    corrections = []
+    for n in shape:
+        # Image pixel coordinates with respect to the centre pixel n // 2
+        x = (np.arange(n) - n // 2) / n
+        corrections.append(np.cos(2 * np.pi * np.outer(x, nodes)) @ kernel_weights)
+    correction = np.outer(corrections[0], corrections[1])
+    # Shared by the callers of the cache
+    correction.flags.writeable = False
+    return correction
+
+
+def _kernel_taps(uv_pixels, n_pix, table, support, oversampling):
+    """Grid cells and kernel weights of the samples along one axis."""
+    first_cell = jnp.floor(uv_pixels - support / 2).astype(jnp.int32) + 1
+    cells = first_cell[:, None] + jnp.arange(support)
+    # Linear interpolation between the nearest table entries
+    table_pos = (cells - uv_pixels[:, None] + support / 2) * oversampling
+    table_idx = jnp.clip(jnp.floor(table_pos).astype(jnp.int32), 0, len(table) - 2)
+    frac = table_pos - table_idx
+    weights = (1 - frac) * table[table_idx] + frac * table[table_idx + 1]
+    # The weights take the precision of the table, not of the uv coordinates
+    weights = weights.astype(table.dtype)
+    # The uv grid is periodic, the taps beyond its edges wrap around
+    return cells % n_pix, weights
+
+
+def _check_uv_pixels_range(uv_pixels, sky_uv_shape):
+    """Check that the uv samples lie within the uv grid."""
+    if jnp.any(uv_pixels < 0) or jnp.any(uv_pixels > jnp.array(sky_uv_shape) - 1):
+        raise ValueError(
+            "uv samples lie out of the uv-plane. Increase Npix or reduce the FOV size."
+        )
+
+
+@partial(
+    jax.jit, static_argnames=("sky_uv_shape", "support", "oversampling", "n_planes")
+)
+def _grid(
+    uv_pixels,
+    vis,
+    table,
+    sky_uv_shape,
+    support,
+    oversampling,
+    plane_idx=None,
+    n_planes=1,
+):
+    """Convolve the visibilities onto the uv grid, or onto a stack of uv grids."""
+    n_v, n_u = sky_uv_shape
+    cells_u, w_u = _kernel_taps(uv_pixels[:, 0], n_u, table, support, oversampling)
+    cells_v, w_v = _kernel_taps(uv_pixels[:, 1], n_v, table, support, oversampling)
+    # Flat cell index of the taps, the grid is indexed [plane, v, u]
+    flat_idx = cells_v[:, :, None] * n_u + cells_u[:, None, :]
+    if plane_idx is not None:
+        flat_idx = flat_idx + plane_idx[:, None, None] * (n_v * n_u)
+    taps = vis[:, None, None] * w_v[:, :, None] * w_u[:, None, :]
+    uv_grid = jax.ops.segment_sum(
+        taps.reshape(-1),
+        flat_idx.reshape(-1),
+        num_segments=n_planes * n_v * n_u,
+    )
+    if plane_idx is None:
+        return uv_grid.reshape(sky_uv_shape)
+    return uv_grid.reshape(n_planes, n_v, n_u)
+
+
+@partial(jax.jit, static_argnames=("support", "oversampling"))
+def _degrid(uv_grid, uv_pixels, table, support, oversampling, plane_idx=None):
+    """Interpolate the uv grid, or the stack of uv grids, at the samples."""
+    n_v, n_u = uv_grid.shape[-2:]
+    cells_u, w_u = _kernel_taps(uv_pixels[:, 0], n_u, table, support, oversampling)
+    cells_v, w_v = _kernel_taps(uv_pixels[:, 1], n_v, table, support, oversampling)
+    if plane_idx is None:
+        taps = uv_grid[cells_v[:, :, None], cells_u[:, None, :]]
+    else:
+        taps = uv_grid[
+            plane_idx[:, None, None], cells_v[:, :, None], cells_u[:, None, :]
+        ]
+    return jnp.sum(taps * w_v[:, :, None] * w_u[:, None, :], axis=(1, 2))
+
+
+def grid_visibilities(
+    uv_samples, vis, sky_uv_shape, fov_size, kernel=None, precision=None
+):
+    """Grid visibilities (JAX version).
+
+    Function to convolve the visibilities at the (off-grid) uv samples onto the
+    uv grid with an anti-aliasing kernel. The image obtained from the grid must
+    be divided by the kernel grid correction (see `image_visibilities`).
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray
+        The uv samples coordinates in wavelengths.
+    vis : np.ndarray
+        The visibilities of the uv samples.
+    sky_uv_shape : tuple
+        The shape of the uv grid in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    kernel : GriddingKernel
+        The gridding kernel. Default is a Kaiser-Bessel kernel of support 6.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    uv_grid : jnp.ndarray
+        The gridded visibilities.
+    """
+    if kernel is None:
+        kernel = GriddingKernel()
+    sky_uv_shape = tuple(sky_uv_shape)
+    uv_pixels = scale_uv_samples(jnp.asarray(uv_samples), sky_uv_shape, fov_size, False)
+    _check_uv_pixels_range(uv_pixels, sky_uv_shape)
+    return _grid(
+        uv_pixels,
+        jnp.asarray(vis, dtype=complex_dtype(precision)),
+        jnp.asarray(kernel.table, dtype=real_dtype(precision)),
+        sky_uv_shape,
+        kernel.support,
+        kernel.oversampling,
+    )
+
+
+def degrid_visibilities(uv_grid, uv_samples, fov_size, kernel=None, precision=None):
+    """Degrid visibilities (JAX version).
+
+    Function to predict the visibilities at the (off-grid) uv samples by
+    interpolating the uv grid with an anti-aliasing kernel. The sky model must be
+    divided by the kernel grid correction before computing the uv grid (see
+    `predict_visibilities`).
+
+    Parameters
+    ----------
+    uv_grid : np.ndarray
+        The uv grid, i.e. the Fourier transform of the corrected sky model.
+    uv_samples : np.ndarray
+        The uv samples coordinates in wavelengths.
+    fov_size : tuple
+        The field of view size in degrees.
+    kernel : GriddingKernel
+        The gridding kernel. Default is a Kaiser-Bessel kernel of support 6.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    vis : jnp.ndarray
+        The visibilities of the uv samples.
+    """
+    if kernel is None:
+        kernel = GriddingKernel()
+    uv_grid = cast_precision(jnp.asarray(uv_grid), precision)
+    uv_pixels = scale_uv_samples(
+        jnp.asarray(uv_samples), uv_grid.shape, fov_size, False
+    )
+    _check_uv_pixels_range(uv_pixels, uv_grid.shape)
+    return _degrid(
+        uv_grid,
+        uv_pixels,
+        jnp.asarray(kernel.table, dtype=uv_grid.real.dtype),
+        kernel.support,
+        kernel.oversampling,
+    )
+
+
+def _padded_shape(shape, padding):
+    """Shape of the padded grid and offset of the image within it."""
+    padded_shape = tuple(int(np.ceil(n * padding)) for n in shape)
+    offset = tuple(m // 2 - n // 2 for n, m in zip(shape, padded_shape))
+    return padded_shape, offset
+
+
+def predict_visibilities(
+    sky, uv_samples, fov_size, kernel=None, padding=2.0, precision=None
+):
+    """Predict visibilities (JAX version).
+
+    Function to predict the visibilities of a sky model at off-grid uv samples.
+    The sky is divided by the grid correction, zero-padded by `padding` to reduce
+    the aliasing, Fourier transformed and degridded at the uv samples.
+
+    Parameters
+    ----------
+    sky : np.ndarray
+        The sky model.
+    uv_samples : np.ndarray
+        The uv samples coordinates in wavelengths.
+    fov_size : tuple
+        The field of view size of the sky model in degrees.
+    kernel : GriddingKernel
+        The gridding kernel. Default is a Kaiser-Bessel kernel of support 6
+        optimised for `padding`.
+    padding : float
+        The padding factor of the uv grid with respect to the sky model.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    vis : jnp.ndarray
+        The visibilities of the uv samples, with the normalisation of `sky2uv`.
+    """
+    if kernel is None:
+        kernel = GriddingKernel(padding=padding)
+    sky = cast_precision(jnp.asarray(sky), precision)
+    padded_shape, offset = _padded_shape(sky.shape, padding)
+    crop = tuple(slice(o, o + n) for o, n in zip(offset, sky.shape))
+    correction = kernel.grid_correction(padded_shape)[crop]
+    sky_padded = jnp.zeros(padded_shape, dtype=sky.dtype)
+    sky_padded = sky_padded.at[crop].set(sky / correction.astype(sky.dtype))
+    fov_padded = tuple(f * m / n for f, m, n in zip(fov_size, padded_shape, sky.shape))
+    return degrid_visibilities(
+        sky2uv(sky_padded, precision), uv_samples, fov_padded, kernel, precision
+    )
+
+
+def image_visibilities(
+    uv_samples, vis, sky_shape, fov_size, kernel=None, padding=2.0, precision=None
+):
+    """Image visibilities (JAX version).
+
+    Function to compute the dirty image of visibilities at off-grid uv samples.
+    The visibilities are gridded on a uv grid padded by `padding`, transformed
+    back to the image plane, cropped and divided by the grid correction.
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray
+        The uv samples coordinates in wavelengths.
+    vis : np.ndarray
+        The visibilities of the uv samples.
+    sky_shape : tuple
+        The shape of the dirty image in pixels.
+    fov_size : tuple
+        The field of view size of the dirty image in degrees.
+    kernel : GriddingKernel
+        The gridding kernel. Default is a Kaiser-Bessel kernel of support 6
+        optimised for `padding`.
+    padding : float
+        The padding factor of the uv grid with respect to the dirty image.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    sky : jnp.ndarray
+        The dirty image, with the normalisation of `uv2sky`.
+    """
+    if kernel is None:
+        kernel = GriddingKernel(padding=padding)
+    padded_shape, offset = _padded_shape(sky_shape, padding)
+    crop = tuple(slice(o, o + n) for o, n in zip(offset, sky_shape))
+    fov_padded = tuple(f * m / n for f, m, n in zip(fov_size, padded_shape, sky_shape))
+    uv_grid = grid_visibilities(
+        uv_samples, vis, padded_shape, fov_padded, kernel, precision
+    )
+    # uv2sky normalises by the grid size, rescale to the dirty image size
+    scale = np.prod(padded_shape) / np.prod(sky_shape)
+    sky = uv2sky(uv_grid, precision)[crop]
+    correction = kernel.grid_correction(padded_shape)[crop]
+    return sky * (scale / correction).astype(sky.dtype)
+
+
+########################################
+#             W-stacking               #
+########################################
+
+
+def plan_w_planes(uv_samples, fov_size, phase_tol=0.1):
+    """Plan w-planes.
+
+    Function to get the number of w-planes needed to image the uv samples with
+    w-stacking. Each sample is gridded on its nearest w-plane, which introduces a
+    phase error of at most pi * dw * max|n - 1| at the edges of the field, dw
+    being the spacing of the w-planes. The number of planes is the smallest one
+    keeping this error below `phase_tol`. Narrow fields or coplanar arrays only
+    need one plane, i.e. plain 2D gridding.
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray
+        The uvw samples coordinates in wavelengths.
+    fov_size : tuple
+        The field of view size in degrees.
+    phase_tol : float
+        The maximum phase error in radians.
+
+    Returns
+    -------
+    n_w_planes : int
+        The number of w-planes.
+    """
+    w = np.asarray(uv_samples)[..., 2]
+    w_range = float(np.max(w) - np.min(w))
+    # Largest |n - 1| of the field, reached at its corners
+    l_max, m_max = np.deg2rad(np.asarray(fov_size, dtype=float)) / 2
+    n_term = 1 - np.sqrt(1 - l_max**2 - m_max**2)
+    return int(np.ceil(np.pi * w_range * n_term / phase_tol)) + 1
+
+
+def _w_planes(w, n_w_planes):
+    """W values of the planes and nearest plane of the samples."""
+    w_min, w_max = jnp.min(w), jnp.max(w)
+    if n_w_planes == 1:
+        return jnp.reshape((w_min + w_max) / 2, (1,)), jnp.zeros(len(w), jnp.int32)
+    w_planes = jnp.linspace(w_min, w_max, n_w_planes)
+    plane_idx = jnp.rint((w - w_min) / (w_planes[1] - w_planes[0]))
+    return w_planes, jnp.clip(plane_idx, 0, n_w_planes - 1).astype(jnp.int32)
+
+
+def _n_grid(shape, fov_size):
+    """Direction cosine n of the image pixels."""
+    # Pixel size in radians, u (columns) pairs with fov_size[0] (see scale_uv_samples)
+    l_pix = np.deg2rad(fov_size[0]) / shape[1]
+    m_pix = np.deg2rad(fov_size[1]) / shape[0]
+    l = (np.arange(shape[1]) - shape[1] // 2) * l_pix
+    m = (np.arange(shape[0]) - shape[0] // 2) * m_pix
+    return np.sqrt(1 - l[None, :] ** 2 - m[:, None] ** 2)
+
+
+def _w_stack_setup(uv_samples, sky_shape, fov_size, n_w_planes, padding, phase_tol):
+    """Set up the padded grid, w-planes and uv pixels of a w-stacking transform."""
+    uv_samples = jnp.asarray(uv_samples)
+    if n_w_planes is None:
+        n_w_planes = plan_w_planes(uv_samples, fov_size, phase_tol)
+    padded_shape, offset = _padded_shape(sky_shape, padding)
+    crop = tuple(slice(o, o + n) for o, n in zip(offset, sky_shape))
+    fov_padded = tuple(f * m / n for f, m, n in zip(fov_size, padded_shape, sky_shape))
+    uv_pixels = scale_uv_samples(uv_samples, padded_shape, fov_padded, False)
+    _check_uv_pixels_range(uv_pixels, padded_shape)
+    n = _n_grid(padded_shape, fov_padded)[crop]
+    w_planes, plane_idx = _w_planes(uv_samples[:, 2], n_w_planes)
+    return padded_shape, crop, n, uv_pixels, w_planes, plane_idx
+
+
+def _w_plane_blocks(plane_idx, padded_shape, dtype, max_bytes):
+    """Blocks of occupied w-planes and the samples gridded on them."""
+    plane_idx = np.asarray(plane_idx)
+    order = np.argsort(plane_idx, kind="stable")
+    # Planes without samples are neither transformed nor gridded
+    planes, first = np.unique(plane_idx[order], return_index=True)
+    bounds = np.append(first, len(order))
+    # Each plane of a block is held twice, before and after its FFT
+    plane_bytes = 2 * int(np.prod(padded_shape)) * np.dtype(dtype).itemsize
+    block = int(min(max(max_bytes // plane_bytes, 1), len(planes)))
+    for start in range(0, len(planes), block):
+        stop = min(start + block, len(planes))
+        samples = order[bounds[start] : bounds[stop]]
+        # Plane of the samples within the block
+        local_idx = np.searchsorted(planes[start:stop], plane_idx[samples])
+        yield planes[start:stop], samples, local_idx.astype(np.int32)
+
+
+def predict_visibilities_wstack(
+    sky,
+    uv_samples,
+    fov_size,
+    n_w_planes=None,
+    kernel=None,
+    padding=2.0,
+    phase_tol=0.1,
+    precision=None,
+    max_bytes=2**28,
+):
+    """Predict visibilities w-stacking (JAX version).
+
+    Function to predict the visibilities of a sky model at off-grid uvw samples,
+    including the w-term of wide fields:
+    V(u, v, w) = sum I(l, m) / n exp(-2 pi i (u l + v m + w (n - 1))).
+    The sky is multiplied by the w-term phase of each w-plane, the planes are
+    Fourier transformed by blocks fitting in `max_bytes` and each sample is
+    degridded from its nearest plane (see `plan_w_planes`). The planes without
+    samples are skipped.
+
+    Parameters
+    ----------
+    sky : np.ndarray
+        The sky model.
+    uv_samples : np.ndarray
+        The uvw samples coordinates in wavelengths.
+    fov_size : tuple
+        The field of view size of the sky model in degrees.
+    n_w_planes : int
+        The number of w-planes. Default is planned from `phase_tol`.
+    kernel : GriddingKernel
+        The gridding kernel. Default is a Kaiser-Bessel kernel of support 6
+        optimised for `padding`.
+    padding : float
+        The padding factor of the uv grid with respect to the sky model.
+    phase_tol : float
+        The maximum w-term phase error in radians used to plan the w-planes.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    max_bytes : int
+        The memory budget in bytes for the padded planes of a block of w-planes.
+
+    Returns
+    -------
+    vis : jnp.ndarray
+        The visibilities of the uv samples, with the normalisation of `sky2uv`.
+    """
+    if kernel is None:
+        kernel = GriddingKernel(padding=padding)
+    sky = cast_precision(jnp.asarray(sky), precision)
+    padded_shape, crop, n, uv_pixels, w_planes, plane_idx = _w_stack_setup(
+        uv_samples, sky.shape, fov_size, n_w_planes, padding, phase_tol
+    )
+    correction = kernel.grid_correction(padded_shape)[crop]
+    sky = sky / (correction * n).astype(sky.dtype)
+    dtype = jnp.result_type(sky.dtype, jnp.complex64)
+    table = jnp.asarray(kernel.table, dtype=sky.dtype)
+    vis = jnp.zeros(len(uv_pixels), dtype=dtype)
+    for planes, samples, local_idx in _w_plane_blocks(
+        plane_idx, padded_shape, dtype, max_bytes
+    ):
+        # w-term phase of each plane of the block, shape (len(planes), *sky.shape)
+        phase = jnp.exp(-2j * jnp.pi * w_planes[planes, None, None] * (n - 1))
+        sky_planes = jnp.zeros((len(planes), *padded_shape), dtype=dtype)
+        sky_planes = sky_planes.at[(slice(None), *crop)].set(sky * phase.astype(dtype))
+        uv_planes = jnp.fft.fftshift(
+            jnp.fft.fft2(jnp.fft.ifftshift(sky_planes, axes=(-2, -1))), axes=(-2, -1)
+        )
+        # Samples padded to their shape bucket to reuse the compiled degridding
+        block_vis = _degrid(
+            uv_planes,
+            uv_pixels[aju.pad_to_bucket(samples)],
+            table,
+            kernel.support,
+            kernel.oversampling,
+            aju.pad_to_bucket(local_idx),
+        )
+        vis = vis.at[samples].set(block_vis[: len(samples)])
+    return vis
+
+
+def image_visibilities_wstack(
+    uv_samples,
+    vis,
+    sky_shape,
+    fov_size,
+    n_w_planes=None,
+    kernel=None,
+    padding=2.0,
+    phase_tol=0.1,
+    precision=None,
+    max_bytes=2**28,
+):
+    """Image visibilities w-stacking (JAX version).
+
+    Function to compute the dirty image of visibilities at off-grid uvw samples,
+    correcting the w-term of wide fields. The samples are gridded on their
+    nearest w-plane by blocks of planes fitting in `max_bytes`, the planes of a
+    block are transformed back to the image plane, multiplied by their w-term
+    phase and added to the image. The planes without samples are skipped. The
+    image is finally divided by the grid correction and by n.
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray
+        The uvw samples coordinates in wavelengths.
+    vis : np.ndarray
+        The visibilities of the uv samples.
+    sky_shape : tuple
+        The shape of the dirty image in pixels.
+    fov_size : tuple
+        The field of view size of the dirty image in degrees.
+    n_w_planes : int
+        The number of w-planes. Default is planned from `phase_tol` (see
+        `plan_w_planes`).
+    kernel : GriddingKernel
+        The gridding kernel. Default is a Kaiser-Bessel kernel of support 6
+        optimised for `padding`.
+    padding : float
+        The padding factor of the uv grid with respect to the dirty image.
+    phase_tol : float
+        The maximum w-term phase error in radians used to plan the w-planes.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    max_bytes : int
+        The memory budget in bytes for the padded planes of a block of w-planes.
+
+    Returns
+    -------
+    sky : jnp.ndarray
+        The dirty image, with the normalisation of `uv2sky`.
+    """
+    if kernel is None:
+        kernel = GriddingKernel(padding=padding)
+    sky_shape = tuple(sky_shape)
+    padded_shape, crop, n, uv_pixels, w_planes, plane_idx = _w_stack_setup(
+        uv_samples, sky_shape, fov_size, n_w_planes, padding, phase_tol
+    )
+    vis = jnp.asarray(vis, dtype=complex_dtype(precision))
+    table = jnp.asarray(kernel.table, dtype=real_dtype(precision))
+    sky = jnp.zeros(sky_shape, dtype=table.dtype)
+    for planes, samples, local_idx in _w_plane_blocks(
+        plane_idx, padded_shape, vis.dtype, max_bytes
+    ):
+        # Padded samples have zero visibilities and add nothing to the grid
+        uv_planes = _grid(
+            uv_pixels[aju.pad_to_bucket(samples)],
+            aju.pad_to_bucket(vis[samples]),
+            table,
+            padded_shape,
+            kernel.support,
+            kernel.oversampling,
+            aju.pad_to_bucket(local_idx),
+            len(planes),
+        )
+        sky_planes = jnp.fft.fftshift(
+            jnp.fft.ifft2(jnp.fft.ifftshift(uv_planes, axes=(-2, -1))), axes=(-2, -1)
+        )[(slice(None), *crop)]
+        # Undo the w-term phase of each plane and add the planes to the image
+        phase = jnp.exp(2j * jnp.pi * w_planes[planes, None, None] * (n - 1))
+        sky = sky + jnp.sum(sky_planes * phase.astype(sky_planes.dtype), axis=0).real
+    # ifft2 normalises by the grid size, rescale to the dirty image size
+    scale = np.prod(padded_shape) / np.prod(sky_shape)
+    correction = kernel.grid_correction(padded_shape)[crop]
+    return sky * (scale / (correction * n)).astype(sky.dtype)
+
+
+########################################
+#                NUFFT                 #
+########################################
+
+
+def nufft_kernel(eps=1e-6, padding=2.0):
+    """NUFFT kernel.
+
+    Function to get the exponential of semicircle kernel reaching a relative
+    accuracy `eps` on a uv grid padded by `padding` (Barnett et al. 2019).
+
+    Parameters
+    ----------
+    eps : float
+        The requested relative accuracy of the transforms.
+    padding : float
+        The padding factor of the uv grid, larger than 1.
+
+    Returns
+    -------
+    kernel : GriddingKernel
+        The gridding kernel.
+    """
+    support = int(np.ceil(np.log(1 / eps) / (np.pi * np.sqrt(1 - 1 / padding)))) + 1
+    beta = 0.97 * np.pi * (1 - 1 / (2 * padding)) * support
+    # The linear interpolation error of the table decreases as 1 / oversampling^2
+    oversampling = int(np.clip(np.ceil(np.sqrt(1 / eps)), 128, 2**16))
+    return GriddingKernel("exp_semicircle", support, oversampling, padding, beta)
+
+
+def sky2vis(
+    sky,
+    uv_samples,
+    fov_size,
+    eps=1e-6,
+    padding=2.0,
+    precision=None,
+    w_stacking=False,
+    phase_tol=0.1,
+    kernel=None,
+    max_bytes=2**28,
+):
+    """Sky to visibilities (JAX version).
+
+    Function to compute the visibilities of the sky at the exact uv coordinates
+    with a type-2 non-uniform FFT, at O(N log N + M) cost. With `w_stacking`, the
+    w-term of wide fields is included (see `predict_visibilities_wstack`).
+
+    Parameters
+    ----------
+    sky : np.ndarray
+        The sky image.
+    uv_samples : np.ndarray
+        The uv samples coordinates in wavelengths.
+    fov_size : tuple
+        The field of view size in degrees.
+    eps : float
+        The requested relative accuracy.
+    padding : float
+        The padding factor of the uv grid.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    w_stacking : bool
+        If True, include the w-term with w-stacking.
+    phase_tol : float
+        The maximum w-term phase error in radians used to plan the w-planes.
+    kernel : GriddingKernel
+        Optional gridding kernel, e.g. to share it across calls. Default is
+        `nufft_kernel(eps, padding)`.
+    max_bytes : int
+        The memory budget in bytes for a block of w-planes, with `w_stacking`.
+
+    Returns
+    -------
+    vis : jnp.ndarray
+        The visibilities, with the normalisation of `sky2uv`.
+    """
+    if kernel is None:
+        kernel = nufft_kernel(eps, padding)
+    if w_stacking:
+        return predict_visibilities_wstack(
+            sky,
+            uv_samples,
+            fov_size,
+            None,
+            kernel,
+            padding,
+            phase_tol,
+            precision,
+            max_bytes,
+        )
+    return predict_visibilities(sky, uv_samples, fov_size, kernel, padding, precision)
+
+
+def vis2sky(
+    uv_samples,
+    vis,
+    sky_shape,
+    fov_size,
+    eps=1e-6,
+    padding=2.0,
+    hermitian=False,
+    w_stacking=False,
+    phase_tol=0.1,
+    precision=None,
+    kernel=None,
+    max_bytes=2**28,
+):
+    """Visibilities to sky (JAX version).
+
+    Function to compute the dirty image of visibilities at the exact uv
+    coordinates with a type-1 non-uniform FFT. With `w_stacking`, the w-term of
+    wide fields is corrected (see `image_visibilities_wstack`).
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray
+        The uv samples coordinates in wavelengths.
+    vis : np.ndarray
+        The visibilities of the uv samples.
+    sky_shape : tuple
+        The shape of the dirty image in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    eps : float
+        The requested relative accuracy.
+    padding : float
+        The padding factor of the uv grid.
+    hermitian : bool
+        If True, the uv samples only hold one baseline of each conjugate pair
+        and the conjugate visibilities are added.
+    w_stacking : bool
+        If True, correct the w-term with w-stacking.
+    phase_tol : float
+        The maximum w-term phase error in radians used to plan the w-planes.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    kernel : GriddingKernel
+        Optional gridding kernel, e.g. to share it across calls. Default is
+        `nufft_kernel(eps, padding)`.
+    max_bytes : int
+        The memory budget in bytes for a block of w-planes, with `w_stacking`.
+
+    Returns
+    -------
+    sky : jnp.ndarray
+        The dirty image, with the normalisation of `uv2sky`.
+    """
+    uv_samples = jnp.asarray(uv_samples)
+    vis = jnp.asarray(vis)
+    if hermitian:
+        uv_samples = jnp.concatenate([uv_samples, -uv_samples])
+        vis = jnp.concatenate([vis, jnp.conj(vis)])
+    if kernel is None:
+        kernel = nufft_kernel(eps, padding)
+    if w_stacking:
+        return image_visibilities_wstack(
+            uv_samples,
+            vis,
+            sky_shape,
+            fov_size,
+            None,
+            kernel,
+            padding,
+            phase_tol,
+            precision,
+            max_bytes,
+        )
+    return image_visibilities(
+        uv_samples, vis, sky_shape, fov_size, kernel, padding, precision
+    )
+
+
+def add_noise_vis(vis, sigma=0.1, n_pix=1, seed=None, rng=None):
+    """Add noise to visibilities.
+
+    Function to add complex white gaussian noise to the visibilities. The noise
+    level matches `imaging_utils.add_noise_uv`, i.e. the Fourier transform of a
+    white noise image of standard deviation `sigma` and `n_pix` pixels.
+
+    Parameters
+    ----------
+    vis : np.ndarray
+        The visibilities.
+    sigma : float
+        The standard deviation of the image plane noise.
+    n_pix : int
+        The number of pixels of the image.
+    seed : int
+        Optional seed to set.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
+
+    Returns
+    -------
+    vis : np.ndarray
+        The visibilities with added noise.
+    """
+    if sigma == 0.0:
+        return vis
+
+    with local_rng(seed, rng) as gen:
+        noise = gen.normal(0, sigma * np.sqrt(n_pix / 2), (2, *np.shape(vis)))
+
+    return vis + (noise[0] + 1j * noise[1]).astype(vis.dtype)
+
+
+def simulate_dirty_observation_nufft(
+    sky,
+    track,
+    fov_size,
+    multi_band=False,
+    freqs=None,
+    beam=None,
+    sigma=0.2,
+    seed=None,
+    hermitian=False,
+    eps=1e-6,
+    padding=2.0,
+    precision=None,
+    return_vis=False,
+    w_stacking=False,
+    phase_tol=0.1,
+    rng=None,
+):
+    """Simulate dirty observation NUFFT.
+
+    Function to simulate a radio observation of the sky model from the track
+    uv-samples, with the visibilities computed at the exact uv coordinates by
+    non-uniform FFTs instead of on the uv grid (see
+    `imaging_utils.simulate_dirty_observation`).
+
+    Parameters
+    ----------
+    sky : np.ndarray
+        The sky model image.
+    track : np.ndarray
+        The uv sampling points, or the uv sampling points of each band (e.g. a
+        multi-band track or a `UVTrack`) for a multi-band simulation.
+    fov_size : float
+        The field of view size in degrees.
+    multi_band : bool
+        If True, simulate a multi-band observation.
+    freqs : list
+        The frequency list for the multi-band simulation.
+    beam : Beam
+        The beam object to apply to the sky, only used in multi-band simulations.
+    sigma : float
+        The standard deviation of the noise.
+    seed : int
+        Optional seed to set for reproducibility in noise realisation.
+    hermitian : bool
+        If True, the track only holds one baseline of each conjugate pair
+        (see `get_baselines(unique=True)`).
+    eps : float
+        The requested relative accuracy of the non-uniform FFTs.
+    padding : float
+        The padding factor of the uv grid.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    return_vis : bool
+        If True, also return the (noisy) visibilities of the uv samples.
+    w_stacking : bool
+        If True, include the w-term of the uvw samples with w-stacking, for wide
+        fields of view (see `plan_w_planes`).
+    phase_tol : float
+        The maximum w-term phase error in radians used to plan the w-planes.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
+        In multi-band simulations, each band draws from its own child generator
+        (see `imaging_utils.simulate_dirty_cube`).
+
+    Returns
+    -------
+    obs : np.ndarray
+        The dirty observation(s).
+    dirty_beam : np.ndarray
+        The dirty beam(s).
+    vis : np.ndarray
+        The visibilities of each uv sample (of each band), if `return_vis`.
+    """
+    fov = (fov_size, fov_size)
+    if multi_band:
+        assert freqs is not None, "Frequency list is required for multiband simulation"
+        bands = list(zip(freqs, track))
+    else:
+        bands = [(None, track)]
+    # Independent generator of each band, or the legacy seed of the global state
+    if rng is None:
+        band_rngs = [None] * len(bands)
+    elif multi_band:
+        band_rngs = get_rng(rng).spawn(len(bands))
+    else:
+        band_rngs = [rng]
+    # Kernel shared by the transforms of all the bands, its grid corrections
+    # are cached per shape (see `GriddingKernel.grid_correction`)
+    nufft_params = {
+        "eps": eps,
+        "padding": padding,
+        "precision": precision,
+        "w_stacking": w_stacking,
+        "phase_tol": phase_tol,
+        "kernel": nufft_kernel(eps, padding),
+    }
+
+    obs, dirty_beam, vis = [], [], []
+    for (f_, track_f), rng_f in zip(bands, band_rngs):
+        # Apply beam to the sky
+        if beam is not None and f_ is not None:
+            beam.set_fov(fov_size)
+            beam.set_f(f_ / 1e9)
+            sky_obs = sky * beam.get_beam()
+        else:
+            sky_obs = sky
+        vis_f = sky2vis(sky_obs, track_f, fov, **nufft_params)
+        vis_f = add_noise_vis(vis_f, sigma, np.prod(np.shape(sky)), seed, rng_f)
+        imaging_params = {
+            "sky_shape": np.shape(sky),
+            "fov_size": fov,
+            "hermitian": hermitian,
+            **nufft_params,
+        }
+        obs.append(vis2sky(track_f, vis_f, **imaging_params))
+        dirty_beam.append(vis2sky(track_f, jnp.ones_like(vis_f), **imaging_params))
+        vis.append(vis_f)
+
+    if multi_band:
+        obs, dirty_beam = np.array(obs), np.array(dirty_beam)
+    else:
+        obs, dirty_beam, vis = obs[0], dirty_beam[0], vis[0]
+    if return_vis:
+        return obs, dirty_beam, vis
+    return obs, dirty_beam
@@ -7,22 +7,34 @@ This module contains functions to perform radio interferometric imaging.
 
 """
 
+import hashlib
+import os
+from collections import OrderedDict
+from functools import partial
+
+import jax
 import jax.numpy as jnp
 import numpy as np
-import numpy.random as rnd
 
-from argosim.rand_utils import local_seed
+import argosim.jax_utils as aju
+from argosim.antenna_utils import UVTrack
+from argosim.rand_utils import get_rng, local_rng
 
 
-def sky2uv(sky):
+def sky2uv(sky, precision=None):
     """Sky to uv plane (JAX version).
 
-    Function to compute the Fourier transform of the sky.
+    Function to compute the Fourier transform of the sky. Stacks of images, e.g.
+    the channels of a cube, are transformed along their last two axes in a
+    single batched FFT.
 
     Parameters
     ----------
     sky : np.ndarray
         The sky image.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
 
     Returns
     -------
@@ -30,10 +42,184 @@ def sky2uv(sky):
         The Fourier transform of the sky.
     """
     # return np.fft.fft2(sky)
-    return jnp.fft.fftshift(jnp.fft.fft2(jnp.fft.ifftshift(sky)))
+    sky = aju.cast_precision(sky, precision)
+    return jnp.fft.fftshift(
+        jnp.fft.fft2(jnp.fft.ifftshift(sky, axes=(-2, -1))), axes=(-2, -1)
+    )
+
+
+def sky2uv_half(sky, precision=None):
+    """Sky to half uv plane (JAX version).
+
+    Function to compute the Fourier transform of a real sky with a real-to-complex
+    FFT. Only the half uv-plane u >= 0 is computed, the other half being given by
+    the Hermitian symmetry. The half plane holds the columns u = 0, ..., N // 2 of
+    the full uv-plane (see `half_uv_grid`), at half the memory and FFT time.
+
+    Parameters
+    ----------
+    sky : np.ndarray
+        The real sky image.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    sky_uv_half : np.ndarray
+        The Fourier transform of the sky, shape (N_v, N_u // 2 + 1).
+    """
+    sky = aju.cast_precision(sky, precision)
+    sky_uv_half = jnp.fft.rfft2(jnp.fft.ifftshift(sky, axes=(-2, -1)))
+    return jnp.fft.fftshift(sky_uv_half, axes=-2)
+
+
+class SkyFFTCache:
+    """Sky FFT cache.
+
+    Class to hold the Fourier transforms of sky-domain images within a run, so
+    that identical images are only transformed once, e.g. the sky of every band
+    of a multi-band simulation without beam or with an achromatic beam. The
+    transforms are keyed by the image content and the transform options, and the
+    least recently used ones are evicted beyond `max_size` entries.
+
+    Attributes
+    ----------
+    max_size : int
+        The maximum number of cached transforms.
+    hits : int
+        The number of transforms found in the cache.
+    misses : int
+        The number of transforms computed.
+
+    """
+
+    def __init__(self, max_size=8):
+        """Initialize the sky FFT cache.
+
+        Parameters
+        ----------
+        max_size : int
+            The maximum number of cached transforms.
+
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        """Return the number of cached transforms."""
+        return len(self._cache)
 
+    def __call__(self, sky, half_plane=False, precision=None, key=None):
+        """Fourier transform of a sky image.
 
-def scale_uv_samples(uv_samples, sky_uv_shape, fov_size):
+        Parameters
+        ----------
+        sky : np.ndarray
+            The sky image.
+        half_plane : bool
+            If True, compute the half uv-plane (see `sky2uv_half`).
+        precision : str
+            Optional precision, 'single' or 'double'. Default is the global
+            precision (see `jax_utils.set_precision`).
+        key : hashable
+            Optional key of the image, to skip the hash of its content.
+
+        Returns
+        -------
+        sky_uv : jnp.ndarray
+            The Fourier transform of the sky.
+
+        """
+        keys = None if key is None else [key]
+        return self.transform_stack([sky], half_plane, precision, keys)[0]
+
+    @staticmethod
+    def key(sky, half_plane=False, precision=None):
+        """Key of a sky image.
+
+        Parameters
+        ----------
+        sky : np.ndarray
+            The sky image.
+        half_plane : bool
+            If True, the key of the half uv-plane transform.
+        precision : str
+            Optional precision, 'single' or 'double'.
+
+        Returns
+        -------
+        key : tuple
+            The digest of the image content, shape and dtype, and the transform
+            options.
+
+        """
+        sky = np.ascontiguousarray(sky)
+        digest = hashlib.blake2b(sky.data, digest_size=16).hexdigest()
+        return (
+            digest,
+            sky.shape,
+            sky.dtype.str,
+            half_plane,
+            aju.complex_dtype(precision),
+        )
+
+    def transform_stack(self, skies, half_plane=False, precision=None, keys=None):
+        """Fourier transform of a stack of sky images.
+
+        The distinct images missing from the cache are transformed in a single
+        batched FFT.
+
+        Parameters
+        ----------
+        skies : list or np.ndarray
+            The sky images.
+        half_plane : bool
+            If True, compute the half uv-planes (see `sky2uv_half`).
+        precision : str
+            Optional precision, 'single' or 'double'. Default is the global
+            precision (see `jax_utils.set_precision`).
+        keys : list
+            Optional keys of the images, to skip the hash of their content.
+
+        Returns
+        -------
+        sky_uv : jnp.ndarray
+            The Fourier transforms of the sky images.
+
+        """
+        if keys is None:
+            keys = [self.key(sky, half_plane, precision) for sky in skies]
+        sky_uv = {}
+        for key in keys:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                sky_uv[key] = self._cache[key]
+        # First image of each distinct key missing from the cache
+        missing = {}
+        for sky, key in zip(skies, keys):
+            if key not in sky_uv:
+                missing.setdefault(key, sky)
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        if missing:
+            to_uv = sky2uv_half if half_plane else sky2uv
+            sky_uv_missing = to_uv(jnp.stack(list(missing.values())), precision)
+            for key, sky_uv_f in zip(missing, sky_uv_missing):
+                sky_uv[key] = sky_uv_f
+                self._cache[key] = sky_uv_f
+                if len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return jnp.stack([sky_uv[key] for key in keys])
+
+    def clear(self):
+        """Clear the cached transforms."""
+        self._cache.clear()
+
+
+def scale_uv_samples(uv_samples, sky_uv_shape, fov_size, snap=True):
     """Scale uv samples (JAX version).
 
     Function to scale the uv samples to pixel coordinates.
@@ -46,6 +232,9 @@ def scale_uv_samples(uv_samples, sky_uv_shape, fov_size):
         The shape of the sky model in pixels.
     fov_size : tuple
         The field of view size in degrees.
+    snap : bool
+        If True, round the coordinates to the nearest pixel. If False, return the
+        fractional pixel coordinates (see `gridding_utils`).
 
     Returns
     -------
@@ -54,16 +243,17 @@ def scale_uv_samples(uv_samples, sky_uv_shape, fov_size):
     """
     max_u = (180 / jnp.pi) * sky_uv_shape[0] / (2 * fov_size[0])
     max_v = (180 / jnp.pi) * sky_uv_shape[1] / (2 * fov_size[1])
-    uv_samples_indices = (
-        jnp.rint(
-            uv_samples[:, :2] / jnp.array([max_u, max_v]) / 2 * jnp.array(sky_uv_shape)
-        )
-        + jnp.array(sky_uv_shape) // 2
+    uv_pixels = (
+        uv_samples[:, :2] / jnp.array([max_u, max_v]) / 2 * jnp.array(sky_uv_shape)
     )
-    return uv_samples_indices
+    if snap:
+        uv_pixels = jnp.rint(uv_pixels)
+    return uv_pixels + jnp.array(sky_uv_shape) // 2
 
 
-def check_uv_samples_range(uv_samples_indices, uv_samples, sky_uv_shape, fov_size):
+def check_uv_samples_range(
+    uv_samples_indices, uv_samples, sky_uv_shape, fov_size, hermitian=False
+):
     """Check uv samples range (JAX version).
 
     Function to check if the uv samples are within the uv-plane range.
@@ -78,85 +268,1157 @@ def check_uv_samples_range(uv_samples_indices, uv_samples, sky_uv_shape, fov_siz
         The uv samples coordinates in meters.
     fov_size : tuple
         The field of view size in degrees.
+    hermitian : bool
+        If True, also check the range of the conjugate samples (-u, -v).
+    """
+    min_index, max_index = _uv_index_range(sky_uv_shape, hermitian)
+    if jnp.any(uv_samples_indices < min_index) or jnp.any(
+        uv_samples_indices > max_index
+    ):
+        raise _out_of_range_error(uv_samples, fov_size)
+
+
+def _uv_index_range(sky_uv_shape, hermitian=False):
+    """Range of the valid uv grid indices, also for the conjugates if hermitian."""
+    sky_uv_shape = np.asarray(sky_uv_shape)
+    max_index = sky_uv_shape - 1
+    min_index = np.zeros_like(sky_uv_shape)
+    if hermitian:
+        # The conjugate of index k lies at 2 * (N // 2) - k
+        min_index = np.maximum(min_index, 2 * (sky_uv_shape // 2) - max_index)
+    return min_index, max_index
+
+
+def _out_of_range_error(uv_samples, fov_size):
+    """Error for uv samples out of the uv-plane, with the required grid size."""
+    max_uv = jnp.max(jnp.abs(uv_samples[:, :2]), axis=0)
+    required_npix = jnp.ceil(max_uv * 2 * jnp.pi * jnp.array(fov_size) / 180)
+    return ValueError(
+        f"uv samples lie out of the uv-plane. Required Npix > {required_npix}"
+    )
+
+
+def mirror_uv_grid(uv_grid):
+    """Mirror uv grid (JAX version).
+
+    Function to reflect a gridded uv-plane through its origin, i.e. to move the
+    value at (u, v) to (-u, -v). The origin lies at pixel N // 2 along each axis.
+
+    Parameters
+    ----------
+    uv_grid : np.ndarray
+        The gridded uv-plane.
+
+    Returns
+    -------
+    uv_grid_mirror : np.ndarray
+        The uv-plane reflected through its origin.
+    """
+    uv_grid_mirror = jnp.flip(uv_grid, axis=(0, 1))
+    # For even sizes the flip maps k to N - 1 - k, shift by one to get N - k
+    shift = tuple(1 - n % 2 for n in uv_grid.shape)
+    return jnp.roll(uv_grid_mirror, shift, axis=(0, 1))
+
+
+def half_uv_grid(uv_grid, symmetrize=True):
+    """Half uv grid (JAX version).
+
+    Function to extract the half uv-plane u >= 0 used by the real-to-complex
+    transforms (see `sky2uv_half`) from a full uv-plane.
+
+    Parameters
+    ----------
+    uv_grid : np.ndarray
+        The full gridded uv-plane.
+    symmetrize : bool
+        If True, keep the Hermitian part of the uv-plane, (G(u, v) + G*(-u, -v)) / 2,
+        so that `uv2sky_half` of the half plane matches `uv2sky` of the full plane
+        even for uv-planes without Hermitian symmetry.
+
+    Returns
+    -------
+    uv_grid_half : np.ndarray
+        The half uv-plane, shape (N_v, N_u // 2 + 1).
     """
-    sky_uv_shape_array = jnp.array(sky_uv_shape)
-    if jnp.any(sky_uv_shape_array <= jnp.max(uv_samples_indices, axis=0)):
-        max_uv = jnp.max(jnp.abs(uv_samples[:, :2]), axis=0)
-        required_npix = jnp.ceil(max_uv * 2 * jnp.pi * jnp.array(fov_size) / 180)
+    uv_grid = jnp.asarray(uv_grid)
+    if symmetrize:
+        return _fold_uv_grid(uv_grid) / 2
+    # Columns u = 0, ..., N // 2, the last one wraps to u = -N // 2 for even sizes
+    n_u = uv_grid.shape[1]
+    return uv_grid[:, (np.arange(n_u // 2 + 1) + n_u // 2) % n_u]
+
+
+def _fold_uv_grid(uv_grid):
+    """Sum of the half uv-plane of a grid and of its conjugate mirror, gathered."""
+    n_v, n_u = uv_grid.shape[-2:]
+    # Half plane column j holds u = j, its mirror u = -j (see `mirror_uv_grid`)
+    columns = (np.arange(n_u // 2 + 1) + n_u // 2) % n_u
+    mirror_columns = (n_u // 2 - np.arange(n_u // 2 + 1)) % n_u
+    mirror_rows = (2 * (n_v // 2) - np.arange(n_v)) % n_v
+    return uv_grid[..., columns] + jnp.conj(
+        uv_grid[..., mirror_rows[:, None], mirror_columns]
+    )
+
+
+def _fold_uv_indices(indices, sky_uv_shape):
+    """Fold the grid indices of the samples u < 0 to their conjugate (-u, -v).
+
+    The indices are mapped to the half uv-plane (see `half_uv_grid`), column j
+    holding u = j. The column u = -N_u / 2 of even sizes is its own conjugate,
+    kept as the last column of the half plane.
+    """
+    n_v, n_u = sky_uv_shape
+    u = indices[:, 0] - n_u // 2
+    fold = u < 0
+    if n_u % 2 == 0:
+        fold = fold & (u > -(n_u // 2))
+    rows = jnp.where(fold, (2 * (n_v // 2) - indices[:, 1]) % n_v, indices[:, 1])
+    return jnp.stack([jnp.abs(u), rows], axis=1)
+
+
+def _add_self_conjugate(uv_counts, sky_uv_shape):
+    """Add the conjugate counts of the self-conjugate columns of the half uv-plane."""
+    n_v, n_u = sky_uv_shape
+    mirror_rows = (2 * (n_v // 2) - np.arange(n_v)) % n_v
+    # Column u = 0, and u = -N_u / 2 for even sizes, concatenated rather than
+    # updated in place as they are read and written at the mirrored rows
+    split = [1, n_u // 2] if n_u % 2 == 0 else [1]
+    columns = jnp.split(uv_counts, split, axis=-1)
+    columns[0] = columns[0] + columns[0][..., mirror_rows, :]
+    if len(split) > 1:
+        columns[-1] = columns[-1] + columns[-1][..., mirror_rows, :]
+    return jnp.concatenate(columns, axis=-1)
+
+
+def iter_uv_chunks(uv_samples):
+    """Iterate uv chunks.
+
+    Function to iterate over the chunks of a uv track given as a `UVTrack`, or as
+    an iterable (e.g. the `uv_track_stream` generator) of `UVTrack` or arrays.
+
+    Parameters
+    ----------
+    uv_samples : UVTrack or iterable
+        The uv track chunks.
+
+    Yields
+    ------
+    channel : int
+        The frequency band index of the chunk, or None if unknown (array chunks).
+    uv_samples_chunk : jnp.ndarray
+        The uv samples of the chunk, shape (n_samples, 3).
+    """
+    if isinstance(uv_samples, UVTrack):
+        for channel, track_f in zip(uv_samples.channels, uv_samples):
+            yield channel, track_f
+    else:
+        for chunk in uv_samples:
+            if isinstance(chunk, UVTrack):
+                yield from iter_uv_chunks(chunk)
+            else:
+                yield None, jnp.asarray(chunk).reshape(-1, 3)
+
+
+def _check_out_of_range(out_of_range):
+    """Check the out of range policy."""
+    if out_of_range not in ["raise", "clip", "drop"]:
         raise ValueError(
-            f"uv samples lie out of the uv-plane. Required Npix > {required_npix}"
+            "Invalid out of range policy. Choose between 'raise', 'clip' and 'drop'."
         )
 
 
+def _check_mask_type(mask_type, weights):
+    """Check the mask type and the weights of the mask type 'weighted'."""
+    if mask_type not in [
+        "binary",
+        "histogram",
+        "weighted",
+        "natural",
+        "uniform",
+        "briggs",
+    ]:
+        raise ValueError(
+            "Invalid mask type. Choose between 'binary', 'histogram', 'weighted', "
+            "'natural', 'uniform' and 'briggs'."
+        )
+    if mask_type == "weighted":
+        assert weights is not None, "Weights must be provided for mask type 'weighted'."
+
+
+def _tile_multiplicity(multiplicity, n_samples):
+    """Repeat the per-baseline multiplicities over the samples of a track."""
+    if multiplicity is None:
+        return 1.0
+    multiplicity = jnp.asarray(multiplicity)
+    if n_samples % multiplicity.shape[0] != 0:
+        raise ValueError(
+            "The number of uv samples is not a multiple of the number of baselines."
+        )
+    # The baselines index runs fastest in the tracks
+    return jnp.tile(multiplicity, n_samples // multiplicity.shape[0])
+
+
+@partial(
+    jax.jit,
+    static_argnames=(
+        "sky_uv_shape",
+        "fov_size",
+        "hermitian",
+        "out_of_range",
+        "n_channels",
+        "half_plane",
+    ),
+)
+def _bincount_uv_samples(
+    uv_samples,
+    counts,
+    sky_uv_shape,
+    fov_size,
+    hermitian,
+    out_of_range,
+    channels=None,
+    n_channels=1,
+    half_plane=False,
+):
+    """Scale, range check and count the uv samples in a single compiled pass."""
+    uv_samples_indices = scale_uv_samples(uv_samples, sky_uv_shape, fov_size)
+    min_index, max_index = _uv_index_range(sky_uv_shape, hermitian)
+    in_range = jnp.all(
+        (uv_samples_indices >= min_index) & (uv_samples_indices <= max_index), axis=1
+    )
+    n_out = jnp.sum(~in_range)
+    if out_of_range == "clip":
+        # Move the samples to the nearest edge of the uv grid
+        uv_samples_indices = jnp.clip(uv_samples_indices, min_index, max_index)
+        in_range = jnp.ones_like(in_range)
+    indices = uv_samples_indices.astype(jnp.int32)
+    grid_shape = sky_uv_shape
+    if half_plane:
+        indices = _fold_uv_indices(indices, sky_uv_shape)
+        grid_shape = (sky_uv_shape[0], sky_uv_shape[1] // 2 + 1)
+    # Flat cell index of the samples, the grid is indexed [channel, v, u]
+    flat_idx = indices[:, 1] * grid_shape[1] + indices[:, 0]
+    if channels is not None:
+        flat_idx = flat_idx + channels * (grid_shape[0] * grid_shape[1])
+    uv_counts = jnp.bincount(
+        jnp.where(in_range, flat_idx, 0),
+        weights=jnp.where(in_range, counts, 0),
+        length=n_channels * grid_shape[0] * grid_shape[1],
+    ).reshape(n_channels, *grid_shape)
+    if half_plane:
+        uv_counts = _add_self_conjugate(uv_counts, sky_uv_shape)
+    if channels is None:
+        return uv_counts[0], uv_samples_indices, n_out
+    return uv_counts, uv_samples_indices, n_out
+
+
+def count_uv_samples(
+    uv_samples,
+    sky_uv_shape,
+    fov_size,
+    hermitian=False,
+    multiplicity=None,
+    out_of_range="raise",
+    half_plane=False,
+):
+    """Count uv samples (JAX version).
+
+    Function to count the uv samples falling in each cell of the uv grid. The
+    scaling to pixel coordinates, the range check and the accumulation are fused
+    in a single compiled pass, accumulated with an integer bincount over the flat
+    cell indices. The samples are zero-padded to their shape bucket (see
+    `jax_utils.shape_bucket`), the padded samples having a zero count, on the
+    host for NumPy inputs and on the device for JAX arrays. Only the 'raise'
+    policy for the samples out of the uv grid synchronises with the host, the
+    'clip' and 'drop' policies leave device inputs on the device.
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray
+        The uv samples coordinates in meters.
+    sky_uv_shape : tuple
+        The shape of the sky model in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    hermitian : bool
+        If True, also check the range of the conjugate samples (-u, -v). The
+        conjugate samples are not counted (see `counts_to_uv_mask`).
+    multiplicity : np.ndarray
+        Optional number of antenna pairs represented by each baseline of the track
+        (see `get_redundant_baselines`), each sample being counted that many times.
+    out_of_range : str
+        The policy for the uv samples out of the uv grid (or whose conjugate is,
+        with the 'hermitian' option). Choose between 'raise' (raise a ValueError),
+        'clip' (move them to the nearest edge of the grid) and 'drop' (discard
+        them).
+    half_plane : bool
+        If True, count the samples and their conjugates (-u, -v) on the half
+        uv-plane u >= 0 (see `half_uv_grid`), the samples u < 0 being folded to
+        their conjugate, without the full uv grid. The folded counts are the half
+        uv-plane of the counts plus their mirror (see `mirror_uv_grid`).
+
+    Returns
+    -------
+    uv_counts : jnp.ndarray
+        The number of uv samples in each cell, integer array of shape sky_uv_shape,
+        or (N_v, N_u // 2 + 1) with `half_plane`.
+    uv_samples_indices : jnp.ndarray
+        The indices of the uv samples in pixel coordinates (clipped with the
+        'clip' policy).
+    n_out : jnp.ndarray
+        The number of uv samples out of the uv grid, i.e. clipped or dropped.
+    """
+    _check_out_of_range(out_of_range)
+    # Device arrays are padded on the device, without a copy back to the host
+    if not isinstance(uv_samples, jax.Array):
+        uv_samples = np.asarray(uv_samples)
+    n_samples = uv_samples.shape[0]
+    counts = jnp.broadcast_to(
+        jnp.asarray(_tile_multiplicity(multiplicity, n_samples), dtype=jnp.int32),
+        (n_samples,),
+    )
+    uv_counts, uv_samples_indices, n_out = _bincount_uv_samples(
+        aju.pad_to_bucket(uv_samples),
+        aju.pad_to_bucket(counts),
+        tuple(sky_uv_shape),
+        tuple(fov_size),
+        hermitian,
+        out_of_range,
+        half_plane=half_plane,
+    )
+    # Check if the uv samples are within the uv-plane range
+    if out_of_range == "raise" and n_out > 0:
+        raise _out_of_range_error(uv_samples, fov_size)
+    return uv_counts, uv_samples_indices[:n_samples], n_out
+
+
+def _iter_band_blocks(uv_samples, start=0, stop=None):
+    """Iterate over the blocks of bands of a multi-band track within [start, stop)."""
+    if isinstance(uv_samples, (np.ndarray, jax.Array, UVTrack, list, tuple)):
+        stop = len(uv_samples) if stop is None else min(stop, len(uv_samples))
+    if isinstance(uv_samples, (np.ndarray, jax.Array)):
+        yield np.arange(start, stop), jnp.asarray(uv_samples[start:stop])
+    elif isinstance(uv_samples, UVTrack):
+        yield uv_samples.channels[start:stop], uv_samples[start:stop]
+    elif isinstance(uv_samples, (list, tuple)):
+        # One track per band, possibly with different numbers of samples
+        for channel in range(start, stop):
+            yield np.array([channel]), jnp.asarray(uv_samples[channel])[None]
+    else:
+        for chunk in uv_samples:
+            if not isinstance(chunk, UVTrack):
+                raise ValueError(
+                    "Multi-band uv chunks must be UVTrack objects to identify "
+                    "their band."
+                )
+            in_block = (chunk.channels >= start) & (
+                chunk.channels < (np.inf if stop is None else stop)
+            )
+            if np.all(in_block):
+                yield chunk.channels, chunk[:]
+            elif np.any(in_block):
+                yield chunk.channels[in_block], chunk[np.flatnonzero(in_block)]
+
+
+# Largest flat index of the (channel, v, u) cells counted in a single scatter,
+# the indices being int32
+_MAX_FLAT_INDEX = 2**31 - 1
+
+
+def count_uv_samples_multiband(
+    uv_samples,
+    n_freqs,
+    sky_uv_shape,
+    fov_size,
+    hermitian=False,
+    multiplicity=None,
+    out_of_range="raise",
+    channel_range=None,
+    half_plane=False,
+    max_bytes=2**28,
+):
+    """Count uv samples multiband (JAX version).
+
+    Function to count the uv samples of each frequency band in each cell of the uv
+    grid. The bands of a block of the track are counted together in a single
+    scatter, over the span of their channels, and accumulated in the cube of
+    counts on the host. The spans are split so that the flat cell indices of a
+    scatter fit in int32 and its arrays fit in `max_bytes`. Streamed tracks are
+    counted chunk by chunk.
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray or UVTrack or iterable
+        The multi-band uv samples coordinates, as an array of shape
+        (n_freqs, n_samples, 3), a list of per-band tracks, a `UVTrack` or an
+        iterable of `UVTrack` chunks (e.g. from `uv_track_stream`).
+    n_freqs : int
+        The number of frequency bands.
+    sky_uv_shape : tuple
+        The shape of the sky model in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    hermitian : bool
+        If True, also check the range of the conjugate samples (see
+        `count_uv_samples`).
+    multiplicity : np.ndarray
+        Optional number of antenna pairs represented by each baseline of the track
+        (see `get_redundant_baselines`), each sample being counted that many times.
+    out_of_range : str
+        The policy for the uv samples out of the uv grid. Choose between 'raise',
+        'clip' and 'drop' (see `count_uv_samples`).
+    channel_range : tuple
+        Optional (start, stop) range of the bands to count, e.g. a block of bands
+        of `simulate_dirty_cube`. The samples of the other bands are skipped, and
+        only sliced out of array, list and `UVTrack` tracks.
+    half_plane : bool
+        If True, count the samples and their conjugates on the half uv-plane (see
+        `count_uv_samples`).
+    max_bytes : int
+        The memory budget in bytes of a scatter: the uv samples of its bands, their
+        counts and channel indices, and the counts of its channel span, up to the
+        padding to their shape bucket. A scatter holds at least one band. The
+        returned cube of counts, of (stop - start) int32 uv grids, is not included,
+        it is bounded with `channel_range`.
+
+    Returns
+    -------
+    uv_counts : np.ndarray
+        The number of uv samples in each cell of each band, integer array of shape
+        (stop - start, *sky_uv_shape), (n_freqs, *sky_uv_shape) by default, and
+        (stop - start, N_v, N_u // 2 + 1) with `half_plane`.
+    n_out : jnp.ndarray
+        The number of uv samples out of the uv grid, i.e. clipped or dropped.
+    """
+    _check_out_of_range(out_of_range)
+    sky_uv_shape = tuple(sky_uv_shape)
+    start, stop = (0, n_freqs) if channel_range is None else channel_range
+    grid_shape = sky_uv_shape
+    if half_plane:
+        grid_shape = (sky_uv_shape[0], sky_uv_shape[1] // 2 + 1)
+    n_cells = grid_shape[0] * grid_shape[1]
+    if n_cells > _MAX_FLAT_INDEX:
+        raise ValueError(f"The uv grid must have less than {_MAX_FLAT_INDEX} cells.")
+    max_span = _MAX_FLAT_INDEX // n_cells
+    uv_counts = np.zeros((stop - start, *grid_shape), dtype=np.int32)
+    n_out = 0
+    for channels, uv_samples_block in _iter_band_blocks(uv_samples, start, stop):
+        uv_samples_block = uv_samples_block.reshape(len(channels), -1, 3)
+        n_samples = uv_samples_block.shape[1]
+        counts = jnp.broadcast_to(
+            jnp.asarray(_tile_multiplicity(multiplicity, n_samples), dtype=jnp.int32),
+            (n_samples,),
+        )
+        # Bytes of a band in a scatter, its uv samples, counts and channel indices
+        band_bytes = n_samples * (3 * uv_samples_block.dtype.itemsize + 8)
+        # Sub-blocks of bands whose channel span fits the int32 flat indices and
+        # whose samples and counts fit the memory budget
+        channels = np.asarray(channels)
+        first, sub_start = channels[0], 0
+        for i, channel in enumerate(channels):
+            if i + 1 < len(channels):
+                n_span = int(channels[i + 1] - first) + 1
+                n_bytes = (i + 2 - sub_start) * band_bytes + n_span * n_cells * 4
+                if n_span <= max_span and n_bytes <= max_bytes:
+                    continue
+            sub_channels = channels[sub_start : i + 1] - first
+            span = aju.shape_bucket(int(sub_channels.max()) + 1)
+            sub_block = uv_samples_block[sub_start : i + 1].reshape(-1, 3)
+            uv_counts_block, _, n_out_block = _bincount_uv_samples(
+                aju.pad_to_bucket(sub_block),
+                aju.pad_to_bucket(jnp.tile(counts, len(sub_channels))),
+                sky_uv_shape,
+                tuple(fov_size),
+                hermitian,
+                out_of_range,
+                aju.pad_to_bucket(np.repeat(sub_channels.astype(np.int32), n_samples)),
+                min(span, max_span),
+                half_plane,
+            )
+            if out_of_range == "raise" and n_out_block > 0:
+                raise _out_of_range_error(sub_block, fov_size)
+            n_span = int(sub_channels.max()) + 1
+            uv_counts[first - start : first - start + n_span] += np.asarray(
+                uv_counts_block[:n_span]
+            )
+            n_out += n_out_block
+            if i + 1 < len(channels):
+                first, sub_start = channels[i + 1], i + 1
+    return uv_counts, n_out
+
+
+def imaging_weights(
+    uv_counts, weighting="natural", robust=0.0, precision=None, n_u=None
+):
+    """Imaging weights (JAX version).
+
+    Function to compute the gridded imaging weights from the uv sample density.
+    With natural weighting every sample has a unit weight, with uniform weighting
+    every sampled cell has a unit weight, and Briggs weighting interpolates
+    between them: each sample has the weight 1 / (1 + f^2 D), where D is the
+    density of its cell and f^2 = (5 * 10^-robust)^2 / (sum D^2 / sum D)
+    (Briggs 1995).
+
+    Parameters
+    ----------
+    uv_counts : jnp.ndarray
+        The number of uv samples in each cell (see `count_uv_samples`).
+    weighting : str
+        The weighting. Choose between 'natural', 'uniform' and 'briggs'.
+    robust : float
+        The Briggs robustness, from -2 (close to uniform) to 2 (close to natural).
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    n_u : int
+        The number of u cells of the full uv grid if `uv_counts` is a half
+        uv-plane (see `half_uv_grid`), whose cells stand for two cells of the full
+        plane but in the self-conjugate columns.
+
+    Returns
+    -------
+    weights : jnp.ndarray
+        The sum of the sample weights in each cell.
+    """
+    if weighting not in ["natural", "uniform", "briggs"]:
+        raise ValueError(
+            "Invalid weighting. Choose between 'natural', 'uniform' and 'briggs'."
+        )
+    density = jnp.asarray(uv_counts, dtype=aju.real_dtype(precision))
+    if weighting == "natural":
+        return density
+    if weighting == "uniform":
+        return jnp.where(density > 0, 1.0, 0.0).astype(density.dtype)
+    # Cells of the full uv grid represented by each cell
+    cells = 1.0 if n_u is None else _half_plane_cells(n_u)
+    f2 = (5 * 10.0 ** (-robust)) ** 2 / (
+        jnp.sum(cells * density**2) / jnp.sum(cells * density)
+    )
+    return density / (1 + f2 * density)
+
+
+def _half_plane_cells(n_u):
+    """Count the cells of the full uv grid represented by each half plane column."""
+    cells = np.full(n_u // 2 + 1, 2.0)
+    cells[0] = 1.0
+    if n_u % 2 == 0:
+        cells[-1] = 1.0
+    return cells
+
+
+def uv_taper(sky_uv_shape, fov_size, taper, half_plane=False):
+    """Uv taper.
+
+    Function to compute a gaussian taper of the uv-plane, which down-weights the
+    long baselines to trade resolution for sensitivity to extended emission.
+
+    Parameters
+    ----------
+    sky_uv_shape : tuple
+        The shape of the uv grid in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    taper : float
+        The FWHM of the taper in wavelengths.
+    half_plane : bool
+        If True, return the taper of the half uv-plane (see `half_uv_grid`).
+
+    Returns
+    -------
+    uv_taper : np.ndarray
+        The taper of each uv cell, shape sky_uv_shape, or (N_v, N_u // 2 + 1)
+        with `half_plane`.
+    """
+    if fov_size is None:
+        raise ValueError("The field of view size is required by the uv taper.")
+    # Coordinates of the cells in wavelengths, the grid is indexed [v, u]
+    pix_size = 180 / np.pi / np.asarray(fov_size, dtype=float)
+    if half_plane:
+        # The taper is even, the last column u = -N_u / 2 of even sizes included
+        u = np.arange(sky_uv_shape[1] // 2 + 1) * pix_size[0]
+    else:
+        u = (np.arange(sky_uv_shape[1]) - sky_uv_shape[1] // 2) * pix_size[0]
+    v = (np.arange(sky_uv_shape[0]) - sky_uv_shape[0] // 2) * pix_size[1]
+    uv_dist2 = u[None, :] ** 2 + v[:, None] ** 2
+    return np.exp(-4 * np.log(2) * uv_dist2 / taper**2)
+
+
+def counts_to_uv_mask(
+    uv_counts,
+    mask_type="binary",
+    weights=None,
+    hermitian=False,
+    precision=None,
+    half_plane=False,
+    robust=0.0,
+    taper=None,
+    fov_size=None,
+    sky_uv_shape=None,
+):
+    """Convert counts to uv mask (JAX version).
+
+    Function to convert a grid of uv sample counts (see `count_uv_samples`) to a
+    uv sampling mask.
+
+    Parameters
+    ----------
+    uv_counts : jnp.ndarray
+        The number of uv samples in each cell.
+    mask_type : str
+        The type of mask to use. Choose between 'binary', 'histogram', 'weighted'
+        and the imaging weightings 'natural', 'uniform' and 'briggs' (see
+        `imaging_weights`).
+    weights : np.ndarray
+        The weights to use for the mask type 'weighted', indexed as the uv grid.
+    hermitian : bool
+        If True, add the conjugate samples (-u, -v) to the counts.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    half_plane : bool
+        If True, return the half uv-plane of the mask (see `half_uv_grid`). The
+        counts are folded to the half plane with their conjugates before the
+        conversion, so that the full mask is never built. The counts of a track
+        holding both baselines of each pair (without `hermitian`) are assumed
+        Hermitian.
+    robust : float
+        The Briggs robustness, for the mask type 'briggs'.
+    taper : float
+        Optional FWHM of a gaussian uv taper in wavelengths (see `uv_taper`).
+    fov_size : tuple
+        The field of view size in degrees, required by the uv taper.
+    sky_uv_shape : tuple
+        The shape of the full uv grid if `uv_counts` are already the folded counts
+        of the half uv-plane (see `count_uv_samples`), with `half_plane`.
+
+    Returns
+    -------
+    uv_mask : jnp.ndarray
+        The uv sampling mask.
+    """
+    _check_mask_type(mask_type, weights)
+    n_u = None
+    if half_plane:
+        if sky_uv_shape is None:
+            sky_uv_shape = uv_counts.shape
+            uv_counts = _fold_uv_grid(uv_counts)
+        n_u = sky_uv_shape[1]
+        # The folded counts hold the conjugate samples, a track holding both
+        # baselines of each pair is counted twice
+        if not hermitian:
+            uv_counts = uv_counts / 2
+        if mask_type == "weighted":
+            weights = half_uv_grid(weights)
+    else:
+        sky_uv_shape = uv_counts.shape
+        if hermitian:
+            uv_counts = uv_counts + mirror_uv_grid(uv_counts)
+    dtype = aju.complex_dtype(precision)
+    if mask_type == "binary":
+        uv_mask = jnp.where(uv_counts != 0, 1, 0).astype(dtype)
+    elif mask_type in ["natural", "uniform", "briggs"]:
+        uv_mask = imaging_weights(uv_counts, mask_type, robust, precision, n_u)
+        uv_mask = uv_mask.astype(dtype)
+    else:
+        uv_mask = uv_counts.astype(dtype)
+    if mask_type == "weighted":
+        uv_mask = uv_mask * jnp.asarray(weights, dtype=dtype)
+    if taper is not None:
+        taper_grid = uv_taper(sky_uv_shape, fov_size, taper, half_plane)
+        uv_mask = uv_mask * taper_grid.astype(dtype)
+    return uv_mask
+
+
+def _counts_to_uv_masks(uv_counts, *mask_params):
+    """Convert a stack of counts to uv masks, batched over the bands."""
+    return jax.vmap(lambda uv_counts_f: counts_to_uv_mask(uv_counts_f, *mask_params))(
+        uv_counts
+    )
+
+
 def grid_uv_samples(
-    uv_samples, sky_uv_shape, fov_size, mask_type="binary", weights=None
+    uv_samples,
+    sky_uv_shape,
+    fov_size,
+    mask_type="binary",
+    weights=None,
+    hermitian=False,
+    precision=None,
+    multiplicity=None,
+    half_plane=False,
+    out_of_range="raise",
+    return_n_out=False,
+    robust=0.0,
+    taper=None,
 ):
     """Grid uv samples (JAX version).
 
-    Compute the uv sampling mask from the uv samples.
+    Compute the uv sampling mask from the uv samples. The uv samples can also be
+    given as a `UVTrack` or as an iterable of chunks (e.g. from `uv_track_stream`),
+    in which case all the chunks are accumulated in the same mask.
 
     Parameters
     ----------
-    uv_samples : np.ndarray
+    uv_samples : np.ndarray or UVTrack or iterable
         The uv samples coordinates in meters.
     sky_uv_shape : tuple
         The shape of the sky model in pixels.
     fov_size : tuple
         The field of view size in degrees.
     mask_type : str
-        The type of mask to use. Choose between 'binary', 'histogram' and 'weighted'.
+        The type of mask to use. Choose between 'binary', 'histogram', 'weighted'
+        and the imaging weightings 'natural', 'uniform' and 'briggs' (see
+        `imaging_weights`).
     weights : np.ndarray
-        The weights to use for the mask type 'weighted'.
+        The weights to use for the mask type 'weighted', indexed as the uv grid.
+    hermitian : bool
+        If True, the uv samples only hold one baseline of each conjugate pair
+        (see `get_baselines(unique=True)`) and the conjugate samples (-u, -v)
+        are added to the mask.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    multiplicity : np.ndarray
+        Optional number of antenna pairs represented by each baseline of the track
+        (see `get_redundant_baselines`). The histogram and weighted masks count
+        each sample that many times.
+    half_plane : bool
+        If True, return the half uv-plane u >= 0 of the mask (see `half_uv_grid`),
+        to be used with `sky2uv_half` and `uv2sky_half`.
+    out_of_range : str
+        The policy for the uv samples out of the uv grid. Choose between 'raise',
+        'clip' and 'drop' (see `count_uv_samples`).
+    return_n_out : bool
+        If True, also return the number of uv samples out of the uv grid.
+    robust : float
+        The Briggs robustness, for the mask type 'briggs'.
+    taper : float
+        Optional FWHM of a gaussian uv taper in wavelengths (see `uv_taper`).
 
     Returns
     -------
     uv_mask : np.ndarray
         The uv sampling mask.
     uv_samples_indices : np.ndarray
-        The indices of the uv samples in pixel coordinates.
+        The indices of the uv samples in pixel coordinates. The conjugate samples
+        added by the 'hermitian' option are not listed. None if the uv samples
+        are given by chunks.
+    n_out : jnp.ndarray
+        The number of uv samples clipped or dropped, if `return_n_out`.
     """
-    uv_samples_indices = scale_uv_samples(uv_samples, sky_uv_shape, fov_size)
-    # Check if the uv samples are within the uv-plane range
-    check_uv_samples_range(uv_samples_indices, uv_samples, sky_uv_shape, fov_size)
-
-    uv_mask = jnp.zeros(sky_uv_shape, dtype=jnp.complex128)
+    _check_mask_type(mask_type, weights)
 
-    # Convert uv_samples_indices to integer indices
-    indices = jnp.array(uv_samples_indices, dtype=jnp.int32)
-
-    if mask_type == "binary":
-        uv_mask = uv_mask.at[indices[:, 1], indices[:, 0]].set(1 + 0j)
-    elif mask_type == "histogram":
-        uv_mask = uv_mask.at[indices[:, 1], indices[:, 0]].add(1 + 0j)
-    elif mask_type == "weighted":
-        assert weights is not None, "Weights must be provided for mask type 'weighted'."
-        uv_mask = uv_mask.at[indices[:, 1], indices[:, 0]].add(
-            weights[indices[:, 0], indices[:, 1]]
+    count_params = {
+        "sky_uv_shape": sky_uv_shape,
+        "fov_size": fov_size,
+        "hermitian": hermitian,
+        "multiplicity": multiplicity,
+        "out_of_range": out_of_range,
+        "half_plane": half_plane,
+    }
+    # The half plane counts are scattered directly, folded with their conjugates
+    grid_shape = tuple(sky_uv_shape)
+    if half_plane:
+        grid_shape = (grid_shape[0], grid_shape[1] // 2 + 1)
+    if isinstance(uv_samples, (np.ndarray, jax.Array)):
+        uv_counts, uv_samples_indices, n_out = count_uv_samples(
+            uv_samples, **count_params
         )
     else:
-        raise ValueError(
-            "Invalid mask type. Choose between 'binary', 'histogram' and 'weighted'."
-        )
+        # Accumulate the chunks without keeping their indices
+        uv_counts, uv_samples_indices = jnp.zeros(grid_shape, dtype=jnp.int32), None
+        n_out = 0
+        for _, uv_samples_chunk in iter_uv_chunks(uv_samples):
+            uv_counts_chunk, _, n_out_chunk = count_uv_samples(
+                uv_samples_chunk, **count_params
+            )
+            uv_counts += uv_counts_chunk
+            n_out += n_out_chunk
+
+    uv_mask = counts_to_uv_mask(
+        uv_counts,
+        mask_type,
+        weights,
+        hermitian,
+        precision,
+        half_plane,
+        robust,
+        taper,
+        fov_size,
+        tuple(sky_uv_shape) if half_plane else None,
+    )
 
+    if return_n_out:
+        return uv_mask, uv_samples_indices, n_out
     return uv_mask, uv_samples_indices
 
 
-def uv2sky(uv):
+def grid_uv_samples_multiband(
+    uv_samples,
+    n_freqs,
+    sky_uv_shape,
+    fov_size,
+    mask_type="binary",
+    weights=None,
+    hermitian=False,
+    precision=None,
+    multiplicity=None,
+    half_plane=False,
+    out_of_range="raise",
+    return_n_out=False,
+    robust=0.0,
+    taper=None,
+):
+    """Grid uv samples multiband (JAX version).
+
+    Compute the uv sampling mask of each frequency band from a multi-band track,
+    given as an array, a `UVTrack` or an iterable of `UVTrack` chunks (e.g. from
+    `uv_track_stream`). The bands are counted in a single scatter (see
+    `count_uv_samples_multiband`) and converted to masks in a single batch.
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray or UVTrack or iterable
+        The multi-band uv samples coordinates.
+    n_freqs : int
+        The number of frequency bands.
+    sky_uv_shape : tuple
+        The shape of the sky model in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    mask_type : str
+        The type of mask to use. Choose between 'binary', 'histogram', 'weighted'
+        and the imaging weightings 'natural', 'uniform' and 'briggs' (see
+        `imaging_weights`).
+    weights : np.ndarray
+        The weights to use for the mask type 'weighted', indexed as the uv grid.
+    hermitian : bool
+        If True, add the conjugate samples (-u, -v) to the masks
+        (see `grid_uv_samples`).
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    multiplicity : np.ndarray
+        Optional number of antenna pairs represented by each baseline of the track
+        (see `get_redundant_baselines`). The histogram and weighted masks count
+        each sample that many times.
+    half_plane : bool
+        If True, return the half uv-planes of the masks (see `half_uv_grid`).
+    out_of_range : str
+        The policy for the uv samples out of the uv grid. Choose between 'raise',
+        'clip' and 'drop' (see `count_uv_samples`).
+    return_n_out : bool
+        If True, also return the number of uv samples out of the uv grid.
+    robust : float
+        The Briggs robustness, for the mask type 'briggs'.
+    taper : float
+        Optional FWHM of a gaussian uv taper in wavelengths (see `uv_taper`).
+
+    Returns
+    -------
+    uv_masks : jnp.ndarray
+        The uv sampling masks, shape (n_freqs, *sky_uv_shape), or
+        (n_freqs, N_v, N_u // 2 + 1) with `half_plane`.
+    n_out : jnp.ndarray
+        The number of uv samples clipped or dropped, if `return_n_out`.
+    """
+    _check_mask_type(mask_type, weights)
+    uv_counts, n_out = count_uv_samples_multiband(
+        uv_samples,
+        n_freqs,
+        sky_uv_shape,
+        fov_size,
+        hermitian,
+        multiplicity,
+        out_of_range,
+        half_plane=half_plane,
+    )
+    uv_masks = _counts_to_uv_masks(
+        uv_counts,
+        mask_type,
+        weights,
+        hermitian,
+        precision,
+        half_plane,
+        robust,
+        taper,
+        fov_size,
+        tuple(sky_uv_shape) if half_plane else None,
+    )
+    if return_n_out:
+        return uv_masks, n_out
+    return uv_masks
+
+
+def uv2sky(uv, precision=None):
     """Uv to sky (JAX version).
 
-    Function to compute the inverse Fourier transform of the uv plane.
+    Function to compute the inverse Fourier transform of the uv plane. Stacks of
+    uv planes are transformed along their last two axes in a single batched FFT.
 
     Parameters
     ----------
     uv : np.ndarray
         The image in the uv/Fourier domain.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
 
     Returns
     -------
     sky : np.ndarray
         The image in the sky domain.
     """
-    return jnp.fft.fftshift(jnp.fft.ifft2(jnp.fft.ifftshift(uv))).real
+    uv = aju.cast_precision(uv, precision)
+    sky = jnp.fft.ifft2(jnp.fft.ifftshift(uv, axes=(-2, -1)))
+    return jnp.fft.fftshift(sky, axes=(-2, -1)).real
+
+
+def uv2sky_half(uv_half, sky_shape, precision=None):
+    """Half uv plane to sky (JAX version).
+
+    Function to compute the inverse Fourier transform of a half uv-plane (see
+    `sky2uv_half`) with a complex-to-real FFT.
+
+    Parameters
+    ----------
+    uv_half : np.ndarray
+        The half uv-plane, shape (N_v, N_u // 2 + 1).
+    sky_shape : tuple
+        The shape of the sky image, which sets the parity of N_u.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    sky : np.ndarray
+        The real image in the sky domain.
+    """
+    uv_half = aju.cast_precision(uv_half, precision)
+    sky = jnp.fft.irfft2(jnp.fft.ifftshift(uv_half, axes=-2), s=tuple(sky_shape))
+    return jnp.fft.fftshift(sky, axes=(-2, -1))
+
+
+def oversize_beam(dirty_beam, factor=2):
+    """Oversize beam (JAX version).
+
+    Function to extend a dirty beam computed on the uv grid to a field `factor`
+    times larger, with the same pixel size, e.g. for the deconvolution of sources
+    near the image edges (see `clean.clean_hogbom`). On the larger field, the
+    gridded samples only fill every `factor`-th cell of the finer uv grid, so
+    the pruned inverse FFT reduces to the inverse FFT of the uv mask repeated
+    periodically: the oversized beam is computed from the dirty beam without
+    regridding the track nor any further FFT. It is the exact point spread
+    function of the observations simulated on the uv grid, which are circular
+    convolutions of the sky with the dirty beam.
+
+    Parameters
+    ----------
+    dirty_beam : jnp.ndarray
+        The dirty beam(s), centred as returned by `uv2sky`. Stacks of beams are
+        extended along their last two axes.
+    factor : int
+        The oversizing factor of the field.
+
+    Returns
+    -------
+    dirty_beam : jnp.ndarray
+        The oversized dirty beam(s), shape (..., factor * N_v, factor * N_u),
+        centred on pixel (factor * N_v // 2, factor * N_u // 2).
+    """
+    dirty_beam = jnp.asarray(dirty_beam)
+    n_v, n_u = dirty_beam.shape[-2:]
+    reps = (1,) * (dirty_beam.ndim - 2) + (factor, factor)
+    shift = (factor * n_v // 2 - n_v // 2, factor * n_u // 2 - n_u // 2)
+    return jnp.roll(jnp.tile(dirty_beam, reps), shift, axis=(-2, -1))
+
+
+class UVMaskCache:
+    """Uv mask cache.
+
+    Class to hold the uv masks and dirty beams of uv tracks, so that a track is
+    only gridded and its dirty beam only computed once for a given uv grid, e.g.
+    to simulate observations of many sky models with the same track. The entries
+    are keyed by a digest of the track content and of the gridding options, and
+    the least recently used ones are evicted beyond `max_size` entries. If
+    `cache_dir` is given, the entries are also stored on disk, as '<key>.npz'
+    files, and shared across runs and processes.
+
+    Attributes
+    ----------
+    max_size : int
+        The maximum number of entries held in memory.
+    cache_dir : str
+        The directory of the on-disk entries, None to only cache in memory.
+    hits : int
+        The number of entries found in memory or on disk.
+    misses : int
+        The number of entries computed.
+
+    """
+
+    def __init__(self, max_size=8, cache_dir=None):
+        """Initialize the uv mask cache.
+
+        Parameters
+        ----------
+        max_size : int
+            The maximum number of entries held in memory.
+        cache_dir : str
+            Optional directory of the on-disk entries, created if needed.
+
+        """
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        """Return the number of entries held in memory."""
+        return len(self._cache)
+
+    def __call__(
+        self,
+        uv_samples,
+        sky_uv_shape,
+        fov_size,
+        mask_type="binary",
+        hermitian=False,
+        precision=None,
+        half_plane=False,
+        out_of_range="raise",
+        robust=0.0,
+        taper=None,
+        key=None,
+    ):
+        """Uv mask and dirty beam of a uv track.
+
+        Parameters
+        ----------
+        uv_samples : np.ndarray or UVTrack or iterable
+            The uv samples coordinates. An iterable of chunks (see
+            `uv_track_stream`) is only accepted with an explicit `key`.
+        sky_uv_shape : tuple
+            The shape of the uv grid in pixels.
+        fov_size : tuple
+            The field of view size in degrees.
+        mask_type : str
+            The type of uv mask (see `grid_uv_samples`), except 'weighted'.
+        hermitian : bool
+            If True, the track only holds one baseline of each conjugate pair.
+        precision : str
+            Optional precision, 'single' or 'double'. Default is the global
+            precision (see `jax_utils.set_precision`).
+        half_plane : bool
+            If True, the uv mask of the half uv-plane (see `grid_uv_samples`).
+        out_of_range : str
+            The policy for the uv samples out of the uv grid (see
+            `count_uv_samples`).
+        robust : float
+            The Briggs robustness, for the mask type 'briggs'.
+        taper : float
+            Optional FWHM of a gaussian uv taper in wavelengths (see `uv_taper`).
+        key : str
+            Optional key of the track, to skip the hash of its content. It must
+            be a valid file name if the cache is stored on disk.
+
+        Returns
+        -------
+        uv_mask : jnp.ndarray
+            The uv sampling mask.
+        dirty_beam : jnp.ndarray
+            The dirty beam, the inverse Fourier transform of the uv mask.
+
+        """
+        grid_params = {
+            "sky_uv_shape": tuple(sky_uv_shape),
+            "fov_size": tuple(fov_size),
+            "mask_type": mask_type,
+            "hermitian": hermitian,
+            "precision": precision,
+            "half_plane": half_plane,
+            "out_of_range": out_of_range,
+            "robust": robust,
+            "taper": taper,
+        }
+        if key is None:
+            key = self.key(uv_samples, **grid_params)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        path = None
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, f"{key}.npz")
+        if path is not None and os.path.exists(path):
+            with np.load(path) as entry:
+                uv_mask, dirty_beam = entry["uv_mask"], entry["dirty_beam"]
+            self.hits += 1
+        else:
+            uv_mask, _ = grid_uv_samples(uv_samples, **grid_params)
+            if half_plane:
+                dirty_beam = uv2sky_half(
+                    uv_mask, grid_params["sky_uv_shape"], precision
+                )
+            else:
+                dirty_beam = uv2sky(uv_mask, precision)
+            self.misses += 1
+            if path is not None:
+                # Write then rename, so that concurrent readers never see a
+                # partial file
+                tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+                np.savez(tmp_path, uv_mask=uv_mask, dirty_beam=dirty_beam)
+                os.replace(tmp_path, path)
+
+        entry = (jnp.asarray(uv_mask), jnp.asarray(dirty_beam))
+        self._cache[key] = entry
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def key(uv_samples, **grid_params):
+        """Key of a uv track.
+
+        Parameters
+        ----------
+        uv_samples : np.ndarray or UVTrack
+            The uv samples coordinates.
+        **grid_params
+            The gridding options (see `UVMaskCache.__call__`).
+
+        Returns
+        -------
+        key : str
+            The hexadecimal digest of the track content, shape and dtype, and of
+            the gridding options.
+
+        """
+        if isinstance(uv_samples, UVTrack):
+            arrays = [uv_samples.uvw, uv_samples.freqs]
+        elif isinstance(uv_samples, (np.ndarray, jax.Array)):
+            arrays = [uv_samples]
+        else:
+            raise TypeError("An explicit key is required for a chunked uv track.")
+        if grid_params.get("mask_type") == "weighted":
+            raise ValueError("The mask type 'weighted' can not be cached.")
+        grid_params["precision"] = aju.complex_dtype(grid_params.get("precision")).str
+        digest = hashlib.blake2b(digest_size=16)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(repr((array.shape, array.dtype.str)).encode())
+            digest.update(array.data)
+        digest.update(repr(sorted(grid_params.items())).encode())
+        return digest.hexdigest()
+
+    def clear(self):
+        """Clear the entries held in memory, the on-disk entries are kept."""
+        self._cache.clear()
 
 
 def compute_visibilities_grid(sky_uv, uv_mask):
@@ -179,7 +1441,9 @@ def compute_visibilities_grid(sky_uv, uv_mask):
     return sky_uv * uv_mask + 0 + 0.0j
 
 
-def add_noise_uv(vis, uv_mask, sigma=0.1, seed=None):
+def add_noise_uv(
+    vis, uv_mask, sigma=0.1, seed=None, precision=None, sky_shape=None, rng=None
+):
     """Add noise in uv-plane.
 
     Function to add white gaussian noise to the visibilities in the uv-plane.
@@ -194,6 +1458,15 @@ def add_noise_uv(vis, uv_mask, sigma=0.1, seed=None):
         The standard deviation of the noise.
     seed : int
         Optional seed to set.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    sky_shape : tuple
+        The shape of the sky image if the visibilities are given on the half
+        uv-plane (see `sky2uv_half`).
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
 
     Returns
     -------
@@ -203,26 +1476,146 @@ def add_noise_uv(vis, uv_mask, sigma=0.1, seed=None):
     if sigma == 0.0:
         return vis
 
-    with local_seed(seed):
-        noise_sky = rnd.normal(0, sigma, vis.shape)
-    noise_uv = sky2uv(noise_sky)
+    with local_rng(seed, rng) as gen:
+        noise_sky = gen.normal(0, sigma, vis.shape if sky_shape is None else sky_shape)
+    if sky_shape is None:
+        noise_uv = sky2uv(noise_sky, precision)
+    else:
+        noise_uv = sky2uv_half(noise_sky, precision)
 
     return vis + compute_visibilities_grid(noise_uv, uv_mask)
 
 
+def sampled_noise_uv(
+    uv_samples,
+    sigma,
+    uv_mask,
+    sky_uv_shape,
+    fov_size,
+    hermitian=False,
+    multiplicity=None,
+    out_of_range="raise",
+    seed=None,
+    rng=None,
+):
+    """Sample noise in the uv-plane (JAX version).
+
+    Function to draw the thermal noise of the gridded visibilities directly in the
+    uv-plane, only for the uv samples. Each sample gets a complex gaussian noise of
+    standard deviation `sigma` on its real and imaginary parts, e.g. from the
+    radiometer equation (see `antenna_utils.baseline_noise`), and the noise of a
+    cell is the mean noise of its samples, weighted by the uv mask. The noise grid
+    is Hermitian, the conjugate samples (-u, -v) carrying the conjugate noise.
+    Without `hermitian`, the track is assumed to hold both baselines of each
+    conjugate pair (see `get_baselines`), which are conjugate measurements of the
+    same visibility.
+
+    Parameters
+    ----------
+    uv_samples : np.ndarray
+        The uv samples coordinates.
+    sigma : float or np.ndarray
+        The noise standard deviation of the visibilities, a scalar, one value per
+        baseline (repeated over the samples of the track) or one value per sample.
+    uv_mask : jnp.ndarray
+        The uv sampling mask of the samples, full or half uv-plane (see
+        `grid_uv_samples`).
+    sky_uv_shape : tuple
+        The shape of the uv grid in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    hermitian : bool
+        If True, the track only holds one baseline of each conjugate pair.
+    multiplicity : np.ndarray
+        Optional number of antenna pairs represented by each baseline of the track
+        (see `get_redundant_baselines`), each sample carrying the noise of the sum
+        of its antenna pairs.
+    out_of_range : str
+        The policy for the uv samples out of the uv grid. Choose between 'raise',
+        'clip' and 'drop' (see `count_uv_samples`).
+    seed : int
+        Optional seed to set for reproducibility in noise realisation.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
+
+    Returns
+    -------
+    noise_uv : jnp.ndarray
+        The noise of the gridded visibilities, zero out of the sampled cells, with
+        the shape and dtype of `uv_mask`.
+    """
+    uv_samples = jnp.asarray(uv_samples).reshape(-1, 3)
+    n_samples = uv_samples.shape[0]
+    sky_uv_shape = tuple(sky_uv_shape)
+    uv_counts, indices, _ = count_uv_samples(
+        uv_samples, sky_uv_shape, fov_size, hermitian, multiplicity, out_of_range
+    )
+    min_index, max_index = _uv_index_range(sky_uv_shape, hermitian)
+    in_range = jnp.all((indices >= min_index) & (indices <= max_index), axis=1)
+    indices = indices.astype(jnp.int32)
+    flat_idx = jnp.where(in_range, indices[:, 1] * sky_uv_shape[1] + indices[:, 0], 0)
+
+    # Noise of each sample, the noise of the sum of its antenna pairs
+    sigma = jnp.asarray(sigma)
+    if sigma.ndim > 0:
+        sigma = _tile_multiplicity(sigma, n_samples)
+    sigma = sigma * jnp.sqrt(_tile_multiplicity(multiplicity, n_samples))
+    with local_rng(seed, rng) as gen:
+        noise = gen.normal(0, 1, (2, n_samples))
+    noise = jnp.where(in_range, sigma * (noise[0] + 1j * noise[1]), 0)
+    noise_sum = jax.ops.segment_sum(
+        noise, flat_idx, num_segments=sky_uv_shape[0] * sky_uv_shape[1]
+    ).reshape(sky_uv_shape)
+
+    # Hermitian noise grid, mean noise of the samples and of the conjugate samples
+    noise_sum = noise_sum + jnp.conj(mirror_uv_grid(noise_sum))
+    n_sum = uv_counts + mirror_uv_grid(uv_counts)
+    if not hermitian:
+        # Both baselines of a pair measure the same visibility, with the same noise
+        noise_sum = noise_sum * np.sqrt(2)
+    noise_uv = jnp.where(n_sum > 0, noise_sum / jnp.maximum(n_sum, 1), 0)
+    if uv_mask.shape[-1] != sky_uv_shape[1]:
+        noise_uv = half_uv_grid(noise_uv, symmetrize=False)
+    return (noise_uv * uv_mask).astype(uv_mask.dtype)
+
+
 def simulate_dirty_observation(
-    sky, track, fov_size, multi_band=False, freqs=None, beam=None, sigma=0.2, seed=None
+    sky,
+    track,
+    fov_size,
+    multi_band=False,
+    freqs=None,
+    beam=None,
+    sigma=0.2,
+    seed=None,
+    hermitian=False,
+    precision=None,
+    half_plane=False,
+    out_of_range="raise",
+    mask_type="binary",
+    robust=0.0,
+    taper=None,
+    fft_cache=None,
+    vis_sigma=None,
+    rng=None,
+    mask_cache=None,
+    beam_factor=1,
 ):
     """Simulate dirty observation.
 
     Function to simulate a radio observation of the sky model from the track uv-samples.
+    The visibilities are computed on the uv grid, see
+    `gridding_utils.simulate_dirty_observation_nufft` for visibilities at the exact
+    uv coordinates.
 
     Parameters
     ----------
     sky : np.ndarray
         The sky model image.
     track : np.ndarray
-        The uv sampling points.
+        The uv sampling points. A `UVTrack`, or an iterator of track chunks
+        such as `uv_track_stream`, is also accepted.
     fov_size : float
         The field of view size in degrees.
     multi_band : bool
@@ -235,6 +1628,48 @@ def simulate_dirty_observation(
         The standard deviation of the noise.
     seed : int
         Optional seed to set for reproducibility in noise realisation.
+    hermitian : bool
+        If True, the track only holds one baseline of each conjugate pair
+        (see `get_baselines(unique=True)`) and the conjugate samples are
+        added when gridding.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    half_plane : bool
+        If True, compute the visibilities on the half uv-plane with real-to-complex
+        FFTs (see `sky2uv_half`), at half the memory and FFT time. The sky model
+        must be real.
+    out_of_range : str
+        The policy for the uv samples out of the uv grid. Choose between 'raise',
+        'clip' and 'drop' (see `count_uv_samples`).
+    mask_type : str
+        The type of uv mask, e.g. the imaging weighting 'natural', 'uniform' or
+        'briggs' (see `grid_uv_samples`).
+    robust : float
+        The Briggs robustness, for the mask type 'briggs'.
+    taper : float
+        Optional FWHM of a gaussian uv taper in wavelengths (see `uv_taper`).
+    fft_cache : SkyFFTCache
+        Optional cache of the sky Fourier transforms, e.g. to simulate several
+        observations of the same sky model.
+    vis_sigma : float or np.ndarray
+        Optional noise standard deviation of the visibilities, scalar or per
+        baseline (see `antenna_utils.baseline_noise`), or per band and baseline in
+        multi-band simulations. If given, the noise is drawn at the sampled uv
+        cells only (see `sampled_noise_uv`) and `sigma` is ignored.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
+        In multi-band simulations, each band draws from its own child generator
+        (see `simulate_dirty_cube`).
+    mask_cache : UVMaskCache
+        Optional cache of the uv masks and dirty beams, to grid the track and
+        compute the dirty beam only once over several calls. Only used in
+        single-band simulations.
+    beam_factor : int
+        The size of the dirty beam relative to the sky image, e.g. 2 for the
+        deconvolution with `clean.clean_hogbom` (see `oversize_beam`). Only used
+        in single-band simulations, `oversize_beam` extends the beam cubes.
 
     Returns
     -------
@@ -245,40 +1680,472 @@ def simulate_dirty_observation(
     """
     if multi_band:
         assert freqs is not None, "Frequency list is required for multiband simulation"
-        obs_multiband = []
-        beam_multiband = []
-        # Iterate over the frequency bands
-        for f_, track_f in zip(freqs, track):
-            # Apply beam to the sky
-            if beam is not None:
-                beam.set_fov(fov_size)
+        return simulate_dirty_cube(
+            sky,
+            track,
+            fov_size,
+            freqs,
+            beam,
+            sigma,
+            seed,
+            hermitian,
+            precision,
+            half_plane,
+            out_of_range,
+            mask_type,
+            robust,
+            taper,
+            fft_cache=fft_cache,
+            vis_sigma=vis_sigma,
+            rng=rng,
+        )
+
+    grid_params = {
+        "sky_uv_shape": sky.shape,
+        "fov_size": (fov_size, fov_size),
+        "hermitian": hermitian,
+        "precision": precision,
+        "half_plane": half_plane,
+        "out_of_range": out_of_range,
+        "mask_type": mask_type,
+        "robust": robust,
+        "taper": taper,
+    }
+    # Transforms between the sky and the (half) uv-plane
+    if half_plane:
+        to_uv, to_sky = sky2uv_half, partial(uv2sky_half, sky_shape=sky.shape)
+        noise_shape = sky.shape
+    else:
+        to_uv, to_sky, noise_shape = sky2uv, uv2sky, None
+
+    if fft_cache is None:
+        sky_uv = to_uv(sky, precision=precision)
+    else:
+        sky_uv = fft_cache(sky, half_plane, precision)
+    if mask_cache is None:
+        uv_mask, _ = grid_uv_samples(track, **grid_params)
+        dirty_beam = None
+    else:
+        uv_mask, dirty_beam = mask_cache(track, **grid_params)
+    vis = compute_visibilities_grid(sky_uv, uv_mask)
+    if vis_sigma is None:
+        vis = add_noise_uv(vis, uv_mask, sigma, seed, precision, noise_shape, rng)
+    else:
+        vis = vis + sampled_noise_uv(
+            track,
+            vis_sigma,
+            uv_mask,
+            sky.shape,
+            grid_params["fov_size"],
+            hermitian,
+            None,
+            out_of_range,
+            seed,
+            rng,
+        )
+    obs = to_sky(vis, precision=precision)
+    if dirty_beam is None:
+        dirty_beam = to_sky(uv_mask, precision=precision)
+    if beam_factor != 1:
+        dirty_beam = oversize_beam(dirty_beam, beam_factor)
+
+    return obs, dirty_beam
+
+
+def _allocate_cubes(out, shape, dtype):
+    """Allocate the output cubes of the dirty observations and dirty beams."""
+    if out is None:
+        return np.empty(shape, dtype=dtype), np.empty(shape, dtype=dtype)
+    if isinstance(out, (str, os.PathLike)):
+        return tuple(
+            np.lib.format.open_memmap(
+                f"{out}_{name}.npy", mode="w+", dtype=dtype, shape=shape
+            )
+            for name in ["obs", "dirty_beam"]
+        )
+    obs, dirty_beam = out
+    if np.shape(obs) != shape or np.shape(dirty_beam) != shape:
+        raise ValueError(f"The output cubes must have the shape {shape}.")
+    return obs, dirty_beam
+
+
+@partial(jax.jit, static_argnames=("sky_shape", "half_plane", "precision"))
+def _dirty_cube_block(
+    sky_uv, noise_sky, noise_uv, uv_masks, sky_shape, half_plane, precision
+):
+    """Batched dirty observations and dirty beams of a block of channels."""
+    # Transforms between the sky and the (half) uv-plane
+    if half_plane:
+        to_uv, to_sky = sky2uv_half, partial(uv2sky_half, sky_shape=sky_shape)
+    else:
+        to_uv, to_sky = sky2uv, uv2sky
+    if noise_sky is not None:
+        sky_uv = sky_uv + to_uv(noise_sky, precision=precision)
+    vis = compute_visibilities_grid(sky_uv, uv_masks)
+    if noise_uv is not None:
+        vis = vis + noise_uv
+    return to_sky(vis, precision=precision), to_sky(uv_masks, precision=precision)
+
+
+def simulate_dirty_cube(
+    sky,
+    track,
+    fov_size,
+    freqs,
+    beam=None,
+    sigma=0.2,
+    seed=None,
+    hermitian=False,
+    precision=None,
+    half_plane=False,
+    out_of_range="raise",
+    mask_type="binary",
+    robust=0.0,
+    taper=None,
+    out=None,
+    max_bytes=2**24,
+    fft_cache=None,
+    vis_sigma=None,
+    rng=None,
+):
+    """Simulate dirty cube.
+
+    Function to simulate a multi-band radio observation of the sky model as a cube
+    of dirty images. The channels are processed by blocks fitting in
+    `max_bytes`: the uv samples of a block are gridded in a single scatter (see
+    `count_uv_samples_multiband`), followed by batched FFTs over the channel
+    axis. The counts of a streamed track are accumulated beforehand. The
+    Fourier transform of the sky is computed once for all the bands without beam,
+    and once for each distinct band with a beam (see `SkyFFTCache`). The results
+    are written in preallocated cubes, which can be memory-mapped files.
+
+    Parameters
+    ----------
+    sky : np.ndarray
+        The sky model image.
+    track : np.ndarray
+        The uv sampling points of each band, e.g. a multi-band track. A
+        `UVTrack`, or an iterator of track chunks such as `uv_track_stream`, is
+        also accepted.
+    fov_size : float
+        The field of view size in degrees.
+    freqs : list
+        The frequency list in Hz.
+    beam : Beam
+        Optional beam object to apply to the sky.
+    sigma : float
+        The standard deviation of the noise.
+    seed : int
+        Optional seed to set for reproducibility in noise realisation.
+    hermitian : bool
+        If True, the track only holds one baseline of each conjugate pair
+        (see `simulate_dirty_observation`).
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    half_plane : bool
+        If True, compute the visibilities on the half uv-plane with real-to-complex
+        FFTs (see `sky2uv_half`).
+    out_of_range : str
+        The policy for the uv samples out of the uv grid. Choose between 'raise',
+        'clip' and 'drop' (see `count_uv_samples`).
+    mask_type : str
+        The type of uv mask (see `grid_uv_samples`).
+    robust : float
+        The Briggs robustness, for the mask type 'briggs'.
+    taper : float
+        Optional FWHM of a gaussian uv taper in wavelengths (see `uv_taper`).
+    out : tuple or str
+        Optional preallocated output cubes (obs, dirty_beam) of shape
+        (n_freqs, *sky.shape), e.g. memory-mapped arrays. If a path prefix is
+        given, the cubes are memory-mapped to the files '<out>_obs.npy' and
+        '<out>_dirty_beam.npy'.
+    max_bytes : int
+        The memory budget in bytes for the uv planes of a block of channels. Small
+        blocks that fit in the CPU cache are faster on CPU, larger blocks are
+        faster on accelerators. It also bounds the scatters counting the uv
+        samples (see `count_uv_samples_multiband`). The counts of an iterator of
+        track chunks are held for all the channels, outside of this budget.
+    fft_cache : SkyFFTCache
+        Optional cache of the sky Fourier transforms, to share the transforms
+        across calls. Default is a new cache for the call.
+    vis_sigma : float or np.ndarray
+        Optional noise standard deviation of the visibilities, scalar, per
+        baseline or per band and baseline, shape (n_freqs, n_baselines). If
+        given, the noise is drawn at the sampled uv cells only (see
+        `sampled_noise_uv`), which saves the FFT of the noise, and `sigma` is
+        ignored. The track must then be indexable by band, not an iterator
+        of track chunks.
+    rng : np.random.Generator or int or jax.Array
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
+        Each band draws from its own child generator, spawned in band order, so
+        the noise of a band does not depend on the block size. With a seed or a
+        key, the generator of band f is `rand_utils.fold_rng(rng, f)`.
+
+    Returns
+    -------
+    obs : np.ndarray
+        The dirty observations, shape (n_freqs, *sky.shape).
+    dirty_beam : np.ndarray
+        The dirty beams, shape (n_freqs, *sky.shape).
+    """
+    sky = np.asarray(sky)
+    n_freqs = len(freqs)
+    fov = (fov_size, fov_size)
+    count_params = (n_freqs, sky.shape, fov, hermitian, None, out_of_range)
+    # Iterators of track chunks can only be read once, their counts are
+    # accumulated beforehand, the other tracks are counted by block of bands
+    streamed = not isinstance(track, (np.ndarray, jax.Array, UVTrack, list, tuple))
+    if streamed and vis_sigma is not None:
+        raise ValueError(
+            "vis_sigma needs the uv samples of each band, the track must be an "
+            "array or a UVTrack, not an iterator of track chunks."
+        )
+    if streamed:
+        uv_counts, _ = count_uv_samples_multiband(
+            track, *count_params, half_plane=half_plane, max_bytes=max_bytes
+        )
+    mask_params = (mask_type, None, hermitian, precision, half_plane, robust, taper)
+    folded_shape = sky.shape if half_plane else None
+    obs_cube, beam_cube = _allocate_cubes(
+        out, (n_freqs, *sky.shape), aju.real_dtype(precision)
+    )
+
+    if fft_cache is None:
+        fft_cache = SkyFFTCache()
+    # Independent generator of each band, or the legacy seed of the global state
+    band_rngs = [None] * n_freqs if rng is None else get_rng(rng).spawn(n_freqs)
+    if beam is None:
+        # Same sky in every band, transformed once and broadcast over the channels
+        sky_uv = fft_cache(sky, half_plane, precision)[None]
+
+    # Channels per block, each channel holds about four complex uv planes
+    channel_bytes = 4 * sky.size * aju.complex_dtype(precision).itemsize
+    block = int(min(max(max_bytes // channel_bytes, 1), n_freqs))
+    for start in range(0, n_freqs, block):
+        stop = min(start + block, n_freqs)
+        if streamed:
+            uv_counts_block = uv_counts[start:stop]
+        else:
+            uv_counts_block, _ = count_uv_samples_multiband(
+                track,
+                *count_params,
+                channel_range=(start, stop),
+                half_plane=half_plane,
+                max_bytes=max_bytes,
+            )
+        uv_masks = _counts_to_uv_masks(uv_counts_block, *mask_params, fov, folded_shape)
+        # Apply beam to the sky, identical bands are only transformed once
+        if beam is not None:
+            beam.set_fov(fov_size)
+            sky_obs = []
+            for f_ in freqs[start:stop]:
                 beam.set_f(f_ / 1e9)
-                beam_amplitude = beam.get_beam()
-                sky_obs = sky * beam_amplitude
-            else:
-                sky_obs = sky
-            # Transform to uv domain
-            sky_uv = sky2uv(sky_obs)
-            # Compute visibilities
-            uv_mask, _ = grid_uv_samples(track_f, sky_uv.shape, (fov_size, fov_size))
-            vis_f = compute_visibilities_grid(sky_uv, uv_mask)
-            # Add noise
-            vis_f = add_noise_uv(vis_f, uv_mask, sigma, seed=seed)
-            # Back to image domain
-            obs = uv2sky(vis_f)
-            dirty_beam = uv2sky(uv_mask)
-
-            obs_multiband.append(obs)
-            beam_multiband.append(dirty_beam)
-
-        obs = np.array(obs_multiband)
-        dirty_beam = np.array(beam_multiband)
+                sky_obs.append(sky * beam.get_beam())
+            sky_uv = fft_cache.transform_stack(sky_obs, half_plane, precision)
+        # Noise, the same realisation of each band as `add_noise_uv`
+        noise_sky, noise_uv = None, None
+        if vis_sigma is not None:
+            noise_uv = jnp.stack(
+                [
+                    sampled_noise_uv(
+                        track[f],
+                        vis_sigma[f] if np.ndim(vis_sigma) == 2 else vis_sigma,
+                        uv_masks[f - start],
+                        sky.shape,
+                        fov,
+                        hermitian,
+                        None,
+                        out_of_range,
+                        seed,
+                        band_rngs[f],
+                    )
+                    for f in range(start, stop)
+                ]
+            )
+        elif sigma != 0.0:
+            noise_sky = []
+            for f in range(start, stop):
+                with local_rng(seed, band_rngs[f]) as gen:
+                    noise_sky.append(gen.normal(0, sigma, sky.shape))
+            noise_sky = np.array(noise_sky)
+        obs_cube[start:stop], beam_cube[start:stop] = _dirty_cube_block(
+            sky_uv, noise_sky, noise_uv, uv_masks, sky.shape, half_plane, precision
+        )
+
+    return obs_cube, beam_cube
+
+
+@partial(jax.jit, static_argnames=("sky_shape", "half_plane", "precision"))
+def _dirty_batch_block(skies, uv_mask, sky_shape, half_plane, precision):
+    """Dirty observations of a block of sky models with a shared uv mask."""
+    # Transforms between the sky and the (half) uv-plane
+    if half_plane:
+        to_uv, to_sky = sky2uv_half, partial(uv2sky_half, sky_shape=sky_shape)
+    else:
+        to_uv, to_sky = sky2uv, uv2sky
+
+    def dirty_obs(sky):
+        vis = compute_visibilities_grid(to_uv(sky, precision=precision), uv_mask)
+        return to_sky(vis, precision=precision)
+
+    return jax.vmap(dirty_obs)(skies)
+
+
+def simulate_dirty_batch(
+    skies,
+    track,
+    fov_size,
+    sigma=0.2,
+    seed=None,
+    hermitian=False,
+    precision=None,
+    half_plane=False,
+    out_of_range="raise",
+    mask_type="binary",
+    robust=0.0,
+    taper=None,
+    out=None,
+    max_bytes=2**24,
+    mask_cache=None,
+    beam_factor=1,
+    rng=None,
+):
+    """Simulate dirty batch.
+
+    Function to simulate the radio observations of a batch of sky models with the
+    same track, e.g. for training sets. The track is gridded and the dirty beam
+    computed once, then the sky models are processed by blocks fitting in
+    `max_bytes`, with FFTs vectorized over the block. Each sky model gets its own
+    noise realisation, and the observations are written in a preallocated stack,
+    which can be a memory-mapped file.
+
+    Parameters
+    ----------
+    skies : np.ndarray
+        The sky model images, shape (n_skies, N_v, N_u). A memory-mapped array is
+        read block by block.
+    track : np.ndarray
+        The uv sampling points, or a `UVTrack` (see `simulate_dirty_observation`).
+    fov_size : float
+        The field of view size in degrees.
+    sigma : float
+        The standard deviation of the noise.
+    seed : int
+        Optional seed to set for reproducibility in noise realisation. The noise
+        of the sky models is drawn in sequence from the seeded global state.
+    hermitian : bool
+        If True, the track only holds one baseline of each conjugate pair
+        (see `simulate_dirty_observation`).
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+    half_plane : bool
+        If True, compute the visibilities on the half uv-plane with real-to-complex
+        FFTs (see `sky2uv_half`).
+    out_of_range : str
+        The policy for the uv samples out of the uv grid. Choose between 'raise',
+        'clip' and 'drop' (see `count_uv_samples`).
+    mask_type : str
+        The type of uv mask (see `grid_uv_samples`).
+    robust : float
+        The Briggs robustness, for the mask type 'briggs'.
+    taper : float
+        Optional FWHM of a gaussian uv taper in wavelengths (see `uv_taper`).
+    out : np.ndarray or str
+        Optional preallocated output stack of shape (n_skies, N_v, N_u), e.g. a
+        memory-mapped array, or the path of a '.npy' file to memory-map it to.
+    max_bytes : int
+        The memory budget in bytes for the uv planes of a block of sky models.
+    mask_cache : UVMaskCache
+        Optional cache of the uv masks and dirty beams, to share them across
+        calls, e.g. over the chunks of a large batch.
+    beam_factor : int
+        The size of the dirty beam relative to the sky images (see
+        `oversize_beam`).
+    rng : np.random.Generator or int or jax.Array or list
+        Optional explicit random generator, seed or JAX PRNG key, which leaves the
+        global random state untouched (see `rand_utils.get_rng`). Overrides `seed`.
+        Each sky model draws from its own child generator, spawned in order, so
+        the noise of a sky model does not depend on the block size. With a seed
+        or a key, the generator of sky model i is `rand_utils.fold_rng(rng, i)`.
+        A list of generators, one per sky model, is also accepted.
+
+    Returns
+    -------
+    obs : np.ndarray
+        The dirty observations, shape (n_skies, N_v, N_u).
+    dirty_beam : jnp.ndarray
+        The dirty beam shared by all the observations.
+    """
+    n_skies, sky_shape = len(skies), tuple(np.shape(skies)[1:])
+    grid_params = {
+        "sky_uv_shape": sky_shape,
+        "fov_size": (fov_size, fov_size),
+        "hermitian": hermitian,
+        "precision": precision,
+        "half_plane": half_plane,
+        "out_of_range": out_of_range,
+        "mask_type": mask_type,
+        "robust": robust,
+        "taper": taper,
+    }
+    if mask_cache is None:
+        uv_mask, _ = grid_uv_samples(track, **grid_params)
+        if half_plane:
+            dirty_beam = uv2sky_half(uv_mask, sky_shape, precision)
+        else:
+            dirty_beam = uv2sky(uv_mask, precision)
+    else:
+        uv_mask, dirty_beam = mask_cache(track, **grid_params)
+    if beam_factor != 1:
+        dirty_beam = oversize_beam(dirty_beam, beam_factor)
+
+    dtype = aju.real_dtype(precision)
+    if out is None:
+        obs = np.empty((n_skies, *sky_shape), dtype=dtype)
+    elif isinstance(out, (str, os.PathLike)):
+        obs = np.lib.format.open_memmap(
+            out, mode="w+", dtype=dtype, shape=(n_skies, *sky_shape)
+        )
+    else:
+        obs = out
+        if np.shape(obs) != (n_skies, *sky_shape):
+            raise ValueError(
+                f"The output stack must have the shape {(n_skies, *sky_shape)}."
+            )
+
+    # Independent generator of each sky model, or the legacy seed of the global
+    # state, shared by all the blocks
+    if rng is None or isinstance(rng, list):
+        sample_rngs = rng
     else:
-        sky_uv = sky2uv(sky)
-        uv_mask, _ = grid_uv_samples(track, sky_uv.shape, (fov_size, fov_size))
-        vis = compute_visibilities_grid(sky_uv, uv_mask)
-        vis = add_noise_uv(vis, uv_mask, sigma, seed=seed)
-        obs = uv2sky(vis)
-        dirty_beam = uv2sky(uv_mask)
+        sample_rngs = get_rng(rng).spawn(n_skies)
+    # Sky models per block, each sky model holds about four complex uv planes
+    sky_bytes = 4 * np.prod(sky_shape) * aju.complex_dtype(precision).itemsize
+    block = int(min(max(max_bytes // sky_bytes, 1), n_skies))
+    with local_rng(seed) as gen:
+        for start in range(0, n_skies, block):
+            stop = min(start + block, n_skies)
+            skies_block = np.asarray(skies[start:stop])
+            # The noise is added in the sky domain, saving its own FFT
+            if sigma != 0.0 and sample_rngs is None:
+                skies_block = skies_block + gen.normal(0, sigma, skies_block.shape)
+            elif sigma != 0.0:
+                skies_block = skies_block + np.array(
+                    [
+                        rng_i.normal(0, sigma, sky_shape)
+                        for rng_i in sample_rngs[start:stop]
+                    ]
+                )
+            # Blocks are padded to their shape bucket to reuse the compiled kernel
+            obs[start:stop] = _dirty_batch_block(
+                aju.pad_to_bucket(skies_block.astype(dtype)),
+                uv_mask,
+                sky_shape,
+                half_plane,
+                precision,
+            )[: stop - start]
 
     return obs, dirty_beam
@@ -0,0 +1,219 @@
+"""JAX utils.
+
+This module contains functions to configure the JAX backend: shape buckets
+for padded jit calls, the on-disk persistent compilation cache and the
+floating point precision policy of the simulations.
+
+:Authors: Ezequiel Centofanti <ezequiel.centofanti@cea.fr>
+
+"""
+
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+
+def shape_bucket(n, steps_per_octave=4):
+    """Shape bucket.
+
+    Function to round up an array size to its shape bucket. Buckets are spaced
+    by `steps_per_octave` steps between consecutive powers of two, so padding to
+    the bucket size wastes at most 1/steps_per_octave of the size while the
+    number of distinct (compiled) shapes grows only logarithmically.
+
+    Parameters
+    ----------
+    n : int
+        The array size.
+    steps_per_octave : int
+        The number of buckets between consecutive powers of two.
+
+    Returns
+    -------
+    n_bucket : int
+        The bucket size, n_bucket >= n.
+    """
+    n = int(n)
+    if n <= 1:
+        return n
+    step = max(1, (1 << ((n - 1).bit_length() - 1)) // steps_per_octave)
+    return -(-n // step) * step
+
+
+def pad_to_bucket(x, axis=0, steps_per_octave=4):
+    """Pad to bucket.
+
+    Function to zero-pad an array along an axis up to its shape bucket. NumPy
+    arrays are padded on the host, JAX arrays on their device, so that padding
+    never synchronises with the host nor copies the array back to it.
+
+    Parameters
+    ----------
+    x : np.ndarray or jax.Array
+        The array to pad.
+    axis : int
+        The axis to pad.
+    steps_per_octave : int
+        The number of buckets between consecutive powers of two.
+
+    Returns
+    -------
+    x_pad : np.ndarray or jax.Array
+        The padded array, on the host or device of `x`. The valid entries are
+        x_pad[:n] along `axis`.
+    """
+    on_device = isinstance(x, jax.Array)
+    if not on_device:
+        x = np.asarray(x)
+    n = x.shape[axis]
+    pad_width = [(0, 0)] * x.ndim
+    pad_width[axis] = (0, shape_bucket(n, steps_per_octave) - n)
+    # Device arrays stay on the device, the padding is compiled per input shape
+    if on_device:
+        return jnp.pad(x, pad_width)
+    return np.pad(x, pad_width)
+
+
+def enable_compilation_cache(cache_dir, min_compile_time_secs=1.0):
+    """Enable compilation cache.
+
+    Function to enable the JAX persistent compilation cache, so that compiled
+    functions are stored on disk and reused across runs.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The directory where the compiled functions are stored.
+    min_compile_time_secs : float
+        Only cache the functions which take longer than this time to compile.
+    """
+    jax.config.update("jax_compilation_cache_dir", str(cache_dir))
+    jax.config.update(
+        "jax_persistent_cache_min_compile_time_secs", min_compile_time_secs
+    )
+
+
+########################################
+#          Precision policy            #
+########################################
+
+# Global precision policy, None follows the JAX default dtypes (see jax_enable_x64)
+_precision = None
+
+
+def set_precision(precision=None):
+    """Set precision.
+
+    Function to set the global floating point precision of the simulations.
+    Choosing 'double' enables the JAX 64-bit mode (jax_enable_x64).
+
+    Parameters
+    ----------
+    precision : str
+        The precision to use. Choose between 'single' (float32/complex64),
+        'double' (float64/complex128) and None (JAX default dtypes).
+    """
+    global _precision
+    if precision not in [None, "single", "double"]:
+        raise ValueError("Invalid precision. Choose between 'single' and 'double'.")
+    if precision == "double":
+        jax.config.update("jax_enable_x64", True)
+    _precision = precision
+
+
+def get_precision(precision=None):
+    """Get precision.
+
+    Function to get the precision to use in a function call: the per-call
+    precision if given, the global precision otherwise. The double precision
+    requires the JAX 64-bit mode, enabled by `set_precision('double')` (or the
+    jax_enable_x64 flag), otherwise JAX would silently compute in single
+    precision.
+
+    Parameters
+    ----------
+    precision : str
+        Optional per-call precision, 'single' or 'double'.
+
+    Returns
+    -------
+    precision : str
+        The precision to use, or None to keep the JAX default dtypes.
+    """
+    if precision not in [None, "single", "double"]:
+        raise ValueError("Invalid precision. Choose between 'single' and 'double'.")
+    precision = _precision if precision is None else precision
+    if precision == "double" and not jax.config.jax_enable_x64:
+        raise ValueError(
+            "Double precision requires the JAX 64-bit mode, enable it with "
+            "set_precision('double')."
+        )
+    return precision
+
+
+def real_dtype(precision=None):
+    """Real dtype.
+
+    Function to get the real floating point dtype of a precision.
+
+    Parameters
+    ----------
+    precision : str
+        Optional per-call precision, 'single' or 'double'.
+
+    Returns
+    -------
+    dtype : np.dtype
+        The real floating point dtype of the precision.
+    """
+    precision = get_precision(precision)
+    if precision is None:
+        return jnp.result_type(float)
+    return np.dtype(np.float32 if precision == "single" else np.float64)
+
+
+def complex_dtype(precision=None):
+    """Complex dtype.
+
+    Function to get the complex floating point dtype of a precision.
+
+    Parameters
+    ----------
+    precision : str
+        Optional per-call precision, 'single' or 'double'.
+
+    Returns
+    -------
+    dtype : np.dtype
+        The complex floating point dtype of the precision.
+    """
+    precision = get_precision(precision)
+    if precision is None:
+        return jnp.result_type(complex)
+    return np.dtype(np.complex64 if precision == "single" else np.complex128)
+
+
+def cast_precision(x, precision=None):
+    """Cast precision.
+
+    Function to cast an array to the real or complex dtype of the precision.
+    The array is returned unchanged if no precision is set.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        The array to cast.
+    precision : str
+        Optional per-call precision, 'single' or 'double'.
+
+    Returns
+    -------
+    x : jnp.ndarray
+        The array in the given precision.
+    """
+    if get_precision(precision) is None:
+        return x
+    x = jnp.asarray(x)
+    if jnp.iscomplexobj(x):
+        return x.astype(complex_dtype(precision))
+    return x.astype(real_dtype(precision))
@@ -0,0 +1,231 @@
+"""Layout utils.
+
+This module contains functions to evaluate batches of candidate antenna array
+layouts: baselines, uv tracks, gridded uv coverage and summary metrics are
+computed for all the layouts in a single compiled pass.
+
+:Authors: Ezequiel Centofanti <ezequiel.centofanti@cea.fr>
+
+"""
+
+from functools import partial
+
+import jax.numpy as jnp
+import numpy as np
+from jax import jit, vmap
+
+import argosim.antenna_utils as au
+from argosim.imaging_utils import scale_uv_samples
+from argosim.jax_utils import pad_to_bucket, real_dtype, shape_bucket
+
+
+def pad_antenna_arrays(arrays, n_max=None):
+    """Pad antenna arrays.
+
+    Function to stack antenna arrays with different numbers of antennas into a
+    single zero-padded array, along with the mask of the valid antennas. The
+    number of antennas is padded to its shape bucket (see `jax_utils.shape_bucket`).
+
+    Parameters
+    ----------
+    arrays : list
+        The antenna arrays in ENU coordinates, each of shape (n_antenna, 3).
+    n_max : int
+        Optional number of antennas of the padded arrays. Default is the shape
+        bucket of the largest array.
+
+    Returns
+    -------
+    antenna : np.ndarray
+        The padded antenna positions, shape (n_layouts, n_max, 3).
+    mask : np.ndarray
+        The mask of the valid antennas, shape (n_layouts, n_max).
+    """
+    n_antenna = [len(array) for array in arrays]
+    if n_max is None:
+        n_max = shape_bucket(max(n_antenna))
+    if n_max < max(n_antenna):
+        raise ValueError(f"n_max must be at least {max(n_antenna)}.")
+    antenna = np.zeros((len(arrays), n_max, 3))
+    mask = np.zeros((len(arrays), n_max), dtype=bool)
+    for i, array in enumerate(arrays):
+        antenna[i, : n_antenna[i]] = array
+        mask[i, : n_antenna[i]] = True
+    return antenna, mask
+
+
+def layout_baselines(antenna, mask):
+    """Layout baselines (JAX version).
+
+    Function to compute the baselines of a batch of padded antenna arrays. The
+    baselines follow the order of `get_baselines`.
+
+    Parameters
+    ----------
+    antenna : np.ndarray
+        The padded antenna positions, shape (n_layouts, n_max, 3).
+    mask : np.ndarray
+        The mask of the valid antennas, shape (n_layouts, n_max).
+
+    Returns
+    -------
+    baselines : jnp.ndarray
+        The baselines in ENU coordinates, shape (n_layouts, n_baselines, 3).
+    baselines_mask : jnp.ndarray
+        The mask of the valid baselines (both antennas valid), shape
+        (n_layouts, n_baselines).
+    """
+    antenna_idx = au.get_antenna_idx(np.shape(antenna)[1])
+    baselines = antenna[:, antenna_idx[:, 0]] - antenna[:, antenna_idx[:, 1]]
+    baselines_mask = mask[:, antenna_idx[:, 0]] & mask[:, antenna_idx[:, 1]]
+    return jnp.asarray(baselines), jnp.asarray(baselines_mask)
+
+
+def _layout_coverage(
+    antenna, mask, antenna_idx, lat, dec, h, lam_inv, sky_uv_shape, fov_size
+):
+    """Uv track, uv coverage and metrics of a single padded layout."""
+    # Antenna-based uvw track, shape (n_freqs, n_times, n_baselines, 3)
+    X, Y, Z = au.ENU_to_XYZ(antenna, lat)
+    track = lam_inv[:, None, None, None] * au.uvw_track_meters(
+        X, Y, Z, dec, h, antenna_idx
+    )
+    baselines_mask = mask[antenna_idx[:, 0]] & mask[antenna_idx[:, 1]]
+    samples_mask = jnp.broadcast_to(baselines_mask, track.shape[:-1]).reshape(-1)
+    track = track.reshape(-1, 3)
+
+    # Histogram of the valid samples, the out of range samples are dropped
+    indices = scale_uv_samples(track, sky_uv_shape, fov_size).astype(jnp.int32)
+    in_range = jnp.all((indices >= 0) & (indices < jnp.array(sky_uv_shape)), axis=1)
+    valid = samples_mask & in_range
+    flat_idx = jnp.where(valid, indices[:, 1] * sky_uv_shape[1] + indices[:, 0], 0)
+    uv_counts = jnp.zeros(sky_uv_shape[0] * sky_uv_shape[1], dtype=track.dtype)
+    uv_counts = uv_counts.at[flat_idx].add(valid).reshape(sky_uv_shape)
+
+    baselines = antenna[antenna_idx[:, 0]] - antenna[antenna_idx[:, 1]]
+    metrics = {
+        "n_antenna": jnp.sum(mask),
+        "n_baselines": jnp.sum(baselines_mask),
+        "max_baseline": jnp.max(
+            jnp.where(baselines_mask, jnp.linalg.norm(baselines, axis=1), 0)
+        ),
+        "filling_factor": jnp.mean(uv_counts > 0),
+        "n_out_of_range": jnp.sum(samples_mask & ~in_range),
+    }
+    return uv_counts, metrics
+
+
+@partial(jit, static_argnames=("sky_uv_shape", "fov_size"))
+def _evaluate_layouts(
+    antenna, mask, antenna_idx, lat, dec, h, lam_inv, sky_uv_shape, fov_size
+):
+    """Compiled evaluation of a batch of padded layouts."""
+    return vmap(
+        _layout_coverage, in_axes=(0, 0, None, None, None, None, None, None, None)
+    )(antenna, mask, antenna_idx, lat, dec, h, lam_inv, sky_uv_shape, fov_size)
+
+
+def evaluate_layouts(
+    antenna,
+    mask=None,
+    lat=35.0 / 180 * jnp.pi,
+    dec=35.0 / 180 * jnp.pi,
+    track_time=0.0,
+    t_0=0.0,
+    n_times=1,
+    f=1420e6,
+    df=0.0,
+    n_freqs=1,
+    sky_uv_shape=(256, 256),
+    fov_size=(1.0, 1.0),
+    return_uv_counts=False,
+    max_bytes=2**28,
+    precision=None,
+):
+    """Evaluate layouts (JAX version).
+
+    Function to evaluate the uv coverage of a batch of antenna array layouts for a
+    given observation. The uv tracks of all the layouts are computed and gridded
+    into uv coverage histograms in a single compiled pass, the padded antennas
+    being excluded by the validity mask. The layouts are processed by blocks whose
+    uv samples fit in `max_bytes`.
+
+    Parameters
+    ----------
+    antenna : list or np.ndarray
+        The antenna arrays in ENU coordinates, as a list of (n_antenna, 3) arrays
+        or as padded positions of shape (n_layouts, n_max, 3).
+    mask : np.ndarray
+        The mask of the valid antennas of the padded positions, shape
+        (n_layouts, n_max). Ignored if `antenna` is a list (see
+        `pad_antenna_arrays`). Default is all antennas valid.
+    lat : float
+        The latitude of the antenna arrays in radians.
+    dec : float
+        The declination of the source in radians.
+    track_time : float
+        The duration of the tracking in hours.
+    t_0 : float
+        The initial tracking time in hours.
+    n_times : int
+        The number of time steps.
+    f : float
+        The central frequency of the observation in Hz.
+    df : float
+        The frequency range of the observation in Hz.
+    n_freqs : int
+        The number of frequency samples.
+    sky_uv_shape : tuple
+        The shape of the uv grid in pixels.
+    fov_size : tuple
+        The field of view size in degrees.
+    return_uv_counts : bool
+        If True, also return the uv coverage histogram of each layout.
+    max_bytes : int
+        The memory budget in bytes for the uv samples of a block of layouts.
+    precision : str
+        Optional precision, 'single' or 'double'. Default is the global precision
+        (see `jax_utils.set_precision`).
+
+    Returns
+    -------
+    metrics : dict
+        The summary metrics of each layout, arrays of shape (n_layouts,):
+        'n_antenna', 'n_baselines', 'max_baseline' (in meters), 'filling_factor'
+        (fraction of sampled uv cells) and 'n_out_of_range' (number of uv samples
+        dropped out of the uv grid). With `return_uv_counts`, 'uv_counts' holds the
+        uv coverage histograms, shape (n_layouts, *sky_uv_shape).
+    """
+    dtype = real_dtype(precision)
+    if isinstance(antenna, (list, tuple)):
+        antenna, mask = pad_antenna_arrays(antenna)
+    antenna = np.asarray(antenna, dtype=dtype)
+    if mask is None:
+        mask = np.ones(antenna.shape[:2], dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    n_layouts, n_max = mask.shape
+    antenna_idx = au.get_antenna_idx(n_max)
+
+    h = (np.linspace(t_0, t_0 + track_time, n_times) * np.pi / 12).astype(dtype)
+    lam_inv = np.linspace(f - df / 2, f + df / 2, n_freqs) / au.SPEED_OF_LIGHT
+    args = (antenna_idx, dtype.type(lat), dtype.type(dec), h, lam_inv.astype(dtype))
+    static_args = {"sky_uv_shape": tuple(sky_uv_shape), "fov_size": tuple(fov_size)}
+
+    # Number of layouts per block, each block is padded to its shape bucket
+    layout_bytes = max(n_freqs * n_times * len(antenna_idx) * 3 * dtype.itemsize, 1)
+    block = int(min(max(max_bytes // layout_bytes, 1), n_layouts))
+
+    blocks = []
+    for start in range(0, n_layouts, block):
+        stop = min(start + block, n_layouts)
+        uv_counts, metrics = _evaluate_layouts(
+            pad_to_bucket(antenna[start:stop]),
+            pad_to_bucket(mask[start:stop]),
+            *args,
+            **static_args,
+        )
+        if return_uv_counts:
+            metrics["uv_counts"] = uv_counts
+        blocks.append({key: val[: stop - start] for key, val in metrics.items()})
+
+    return {key: jnp.concatenate([b[key] for b in blocks]) for key in blocks[0]}
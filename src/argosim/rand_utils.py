@@ -1,12 +1,16 @@
 """Random utils.
 
 A small module to hold a class for a temporary seed,
-so as to not mess with any global seed.
+so as to not mess with any global seed, and the explicit
+random generators which do not use the global state at all.
 
 :Authors: Samuel Gullin <gullin@ia.forth.gr>
 
 """
 
+from contextlib import contextmanager
+
+import jax
 import numpy as np
 
 
@@ -52,3 +56,97 @@ class local_seed:
         """
         if self.seed:
             np.random.set_state(self.old_state)
+
+
+def _seed_sequence(rng):
+    """Seed sequence of a generator, seed sequence, integer seed or JAX PRNG key."""
+    if isinstance(rng, np.random.SeedSequence):
+        return rng
+    if isinstance(rng, np.random.Generator):
+        return rng.bit_generator.seed_seq
+    if isinstance(rng, jax.Array):
+        return np.random.SeedSequence(np.asarray(jax.random.key_data(rng)).tolist())
+    return np.random.SeedSequence(rng)
+
+
+def get_rng(rng=None):
+    """Get random generator.
+
+    Function to get an explicit numpy random generator, which does not use nor
+    change the global `numpy.random` state and can be used from several threads.
+    New generators use the counter-based Philox bit generator.
+
+    Parameters
+    ----------
+    rng : np.random.Generator or np.random.SeedSequence or int or jax.Array
+        A generator (returned as is), a seed sequence, an integer seed or a JAX
+        PRNG key. None gives a generator seeded from the OS entropy.
+
+    Returns
+    -------
+    rng : np.random.Generator
+        The random generator.
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.Generator(np.random.Philox(_seed_sequence(rng)))
+
+
+def fold_rng(rng, *counters):
+    """Fold random generator.
+
+    Function to derive an independent random generator from a parent generator,
+    seed sequence, integer seed or JAX PRNG key and integer counters, e.g. the
+    (sample, band) indices of a simulation. The derived generator only depends on
+    the seed of the parent and on the counters, not on the draws already made nor
+    on the order of the calls, so that parallel simulations split across threads
+    or processes are reproducible.
+
+    Parameters
+    ----------
+    rng : np.random.Generator or np.random.SeedSequence or int or jax.Array
+        The parent generator or seed.
+    *counters : int
+        The non-negative integer counters.
+
+    Returns
+    -------
+    rng : np.random.Generator
+        The derived random generator.
+    """
+    seed_seq = _seed_sequence(rng)
+    child = np.random.SeedSequence(
+        seed_seq.entropy,
+        spawn_key=tuple(seed_seq.spawn_key) + tuple(int(c) for c in counters),
+        pool_size=seed_seq.pool_size,
+    )
+    return np.random.Generator(np.random.Philox(child))
+
+
+@contextmanager
+def local_rng(seed=None, rng=None):
+    """Local random generator.
+
+    Context manager yielding the random generator of a stochastic function. An
+    explicit generator `rng` is used as is (see `get_rng`), without touching the
+    global `numpy.random` state. Otherwise the global state is used within a
+    `local_seed(seed)` scope, which reproduces the legacy seeded draws. The
+    yielded object supports the `random` and `normal` methods in both cases.
+
+    Parameters
+    ----------
+    seed : int
+        Optional seed of the global state, ignored if `rng` is given.
+    rng : np.random.Generator or np.random.SeedSequence or int or jax.Array
+        Optional explicit generator or seed (see `get_rng`).
+
+    Yields
+    ------
+    rng : np.random.Generator or module
+        The random generator, or the `numpy.random` module.
+    """
+    if rng is None or rng is np.random:
+        with local_seed(seed):
+            yield np.random
+    else:
+        yield get_rng(rng)
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 import numpy as np
 import numpy.testing as npt
 
@@ -81,6 +83,8 @@ class TestAntennaUtils:
         ]
     )
 
+    random_antenna_unique_idx_exp = np.array([[0, 1], [0, 2], [1, 2]])
+
     uv_track_default_exp = np.array(
         [
             [6.87539883e02, -2.05251355e03, -1.34622557e-13],
@@ -193,6 +197,17 @@ class TestAntennaUtils:
             err_msg="Random antenna array outputs do not match.",
         )
 
+    def test_random_antenna_arr_rng(self):
+        antenna_arr = au.random_antenna_arr(n_antenna=8, rng=self.random_antenna_seed)
+        npt.assert_array_equal(
+            au.random_antenna_arr(n_antenna=8, rng=self.random_antenna_seed),
+            antenna_arr,
+            err_msg="Random antenna array is not reproducible with an explicit seed.",
+        )
+        npt.assert_array_equal(
+            antenna_arr.shape, (8, 3), err_msg="Random antenna array shape mismatch."
+        )
+
     def test_uni_antenna_arr(self):
 
         uni_antenna_out = au.uni_antenna_array()
@@ -291,6 +306,48 @@ class TestAntennaUtils:
             err_msg="Baselines computed from random antenna array do not match expected output.",
         )
 
+    def test_get_baselines_unique(self):
+        baselines_out, antenna_idx_out = au.get_baselines(
+            self.random_antenna_exp, unique=True
+        )
+        npt.assert_array_equal(
+            antenna_idx_out,
+            self.random_antenna_unique_idx_exp,
+            err_msg="Unique baseline antenna indices do not match expected output.",
+        )
+        npt.assert_allclose(
+            baselines_out,
+            self.random_antenna_baselines_exp[[0, 1, 3]],
+            atol=self.uv_atol,
+            err_msg="Unique baselines do not match the i < j full baselines.",
+        )
+
+    def test_get_redundant_baselines(self):
+        array = au.uni_antenna_array(4, 4, 300.0, 300.0)
+        for unique, n_unique_exp in [(False, 48), (True, 24)]:
+            baselines, multiplicity, antenna_idx, group_idx = (
+                au.get_redundant_baselines(array, unique=unique)
+            )
+            assert len(baselines) == n_unique_exp, "Unexpected number of groups."
+            assert np.sum(multiplicity) == len(antenna_idx)
+            npt.assert_array_equal(
+                np.bincount(group_idx),
+                multiplicity,
+                err_msg="Baseline groups do not match their multiplicity.",
+            )
+            b_pairs = array[antenna_idx[:, 0]] - array[antenna_idx[:, 1]]
+            b_groups = baselines[group_idx]
+            if unique:
+                # The pairs are grouped with their conjugates
+                same_sign = np.all(np.isclose(b_pairs, b_groups), axis=1)
+                b_groups[~same_sign] *= -1
+            npt.assert_allclose(
+                b_groups,
+                b_pairs,
+                atol=self.uv_atol,
+                err_msg="Redundant baselines do not match their antenna pairs.",
+            )
+
     def test_uv_track_default(self):
         track, _ = au.uv_track_multiband(self.random_antenna_baselines_exp)
         npt.assert_allclose(
@@ -311,6 +368,176 @@ class TestAntennaUtils:
             err_msg="UV track computed from random antenna baselines does not match expected output.",
         )
 
+    def test_baseline_noise(self):
+        # SEFD of 100, 400 and 900 Jy, 1 MHz channel and 10 s integration
+        noise_level = np.array([100.0, 400.0, 900.0])
+        sigma = au.baseline_noise(noise_level, 1e6, 10.0)
+        # sigma_ij = sqrt(SEFD_i SEFD_j / (2 * 1e7))
+        sigma_exp = np.array([200, 300, 200, 600, 300, 600]) / np.sqrt(2e7)
+        npt.assert_allclose(sigma, sigma_exp)
+        sigma_unique = au.baseline_noise(
+            noise_level, 1e6, 10.0, au.get_antenna_idx(3, unique=True)
+        )
+        npt.assert_allclose(sigma_unique, sigma_exp[[0, 1, 3]])
+        # Root mean square noise of the grouped antenna pairs
+        sigma_group = au.baseline_noise(
+            noise_level, 1e6, 10.0, group_idx=np.array([0, 0, 1, 1, 1, 1])
+        )
+        npt.assert_allclose(
+            sigma_group**2,
+            [np.mean(sigma_exp[:2] ** 2), np.mean(sigma_exp[2:] ** 2)],
+        )
+
+    def test_get_antenna_idx(self):
+        antenna_idx_out = au.get_antenna_idx(len(self.random_antenna_exp))
+        baselines_out = (
+            self.random_antenna_exp[antenna_idx_out[:, 0]]
+            - self.random_antenna_exp[antenna_idx_out[:, 1]]
+        )
+        npt.assert_allclose(
+            baselines_out,
+            self.random_antenna_baselines_exp,
+            atol=self.uv_atol,
+            err_msg="Antenna indices do not match the baselines ordering.",
+        )
+
+    def test_uv_track_antenna_idx(self):
+        track, _ = au.uv_track_multiband(
+            self.random_antenna_exp,
+            *self.uv_track_params,
+            antenna_idx=au.get_antenna_idx(len(self.random_antenna_exp)),
+        )
+        npt.assert_allclose(
+            track,
+            self.uv_track_exp,
+            atol=self.uv_atol,
+            err_msg="UV track computed from antenna positions does not match expected output.",
+        )
+
+    def test_uv_track_lazy(self):
+        track_lazy, freqs = au.uv_track_multiband(
+            self.random_antenna_baselines_exp, *self.uv_track_params, lazy=True
+        )
+        assert len(track_lazy) == len(freqs)
+        assert track_lazy.shape == self.multiband_track_shape_exp
+        npt.assert_allclose(
+            track_lazy.to_array(),
+            self.uv_track_exp,
+            atol=self.uv_atol,
+            err_msg="Lazy UV track does not match expected output.",
+        )
+        track_bands = np.array(list(track_lazy))
+        npt.assert_allclose(
+            track_bands.reshape(-1, 3),
+            self.uv_track_exp,
+            atol=self.uv_atol,
+            err_msg="Lazy UV track bands do not match expected output.",
+        )
+
+    def test_uv_track_stream(self):
+        track = au.uv_track_multiband(
+            self.random_antenna_baselines_exp,
+            *self.uv_track_params[:-1],
+            multi_band=True,
+        )[0].reshape(2, 3, 6, 3)
+        # Budget of two time steps of a single band
+        max_bytes = 2 * 6 * 3 * track.dtype.itemsize
+        track_chunks = list(
+            au.uv_track_stream(
+                self.random_antenna_baselines_exp,
+                *self.uv_track_params[:-1],
+                max_bytes=max_bytes,
+            )
+        )
+        assert len(track_chunks) == 4, "Unexpected number of track chunks."
+        for i, chunk in enumerate(track_chunks):
+            t_slice = slice(0, 2) if i < 2 else slice(2, 3)
+            npt.assert_array_equal(chunk.channels, [i % 2])
+            assert chunk.to_array().nbytes <= max_bytes
+            npt.assert_allclose(
+                chunk.to_array(),
+                track[i % 2, t_slice].reshape(-1, 3),
+                atol=self.uv_atol,
+                err_msg="UV track chunk does not match the full track.",
+            )
+
+    def test_compiled_uv_track_bucket(self, monkeypatch):
+        # 12 and 13 antennas give 132 and 156 baselines, both in the 160 bucket
+        track_params = {"dec": 0.5, "h": np.linspace(-0.1, 0.1, 3)}
+        XYZ = au.stack_XYZ(au.get_baselines(self.y_antenna_exp[:13]))
+        au.compiled_uv_track(XYZ[:132], **track_params)
+        n_compiled = len(au._uv_track_cache)
+        track = au.compiled_uv_track(XYZ, **track_params)
+        assert track.shape == (3, 156, 3), "Compiled track has padded entries."
+        assert (
+            len(au._uv_track_cache) == n_compiled
+        ), "Track in the same shape bucket was compiled again."
+        # The least recently used compilations are evicted
+        monkeypatch.setattr(au, "_uv_track_cache", OrderedDict())
+        monkeypatch.setattr(au, "_UV_TRACK_CACHE_SIZE", 1)
+        au.compiled_uv_track(XYZ[:10], **track_params)
+        au.compiled_uv_track(XYZ, **track_params)
+        assert len(au._uv_track_cache) == 1, "The uv track cache is not bounded."
+
+    def test_uv_track_pointings(self):
+        lat, dec, track_time, t_0, *track_params = self.uv_track_params
+        decs = np.array([dec, -dec, 0.0])
+        t_0s = np.array([t_0, t_0 + 1.0, t_0 - 1.0])
+        # Small memory budget to split the pointings in several blocks
+        tracks, _ = au.uv_track_pointings(
+            self.random_antenna_baselines_exp,
+            lat,
+            decs,
+            track_time,
+            t_0s,
+            *track_params,
+            max_bytes=1,
+        )
+        assert tracks.shape == (3, *self.uv_track_exp.shape)
+        npt.assert_allclose(
+            tracks[0],
+            self.uv_track_exp,
+            atol=self.uv_atol,
+            err_msg="Batched UV track does not match expected output.",
+        )
+        for i in range(1, 3):
+            track, _ = au.uv_track_multiband(
+                self.random_antenna_baselines_exp,
+                lat,
+                decs[i],
+                track_time,
+                t_0s[i],
+                *track_params,
+            )
+            npt.assert_allclose(
+                tracks[i],
+                track,
+                atol=self.uv_atol,
+                err_msg="Batched UV track does not match the single pointing track.",
+            )
+
+    def test_observatory(self):
+        lat, dec, *track_params = self.uv_track_params
+        for antenna_based in [False, True]:
+            obs = au.Observatory(
+                self.random_antenna_exp, lat=lat, antenna_based=antenna_based
+            )
+            track, _ = obs.uv_track(dec, *track_params)
+            npt.assert_allclose(
+                track,
+                self.uv_track_exp,
+                atol=self.uv_atol,
+                err_msg="Observatory UV track does not match expected output.",
+            )
+        # Repeated pointings reuse the cached XYZ coordinates
+        XYZ = obs.XYZ()
+        obs.uv_track(-dec, *track_params)
+        obs.set_lat(lat)
+        obs.set_antenna(self.random_antenna_exp)
+        assert obs.XYZ() is XYZ, "XYZ coordinates were not cached."
+        obs.set_lat(-lat)
+        assert obs.XYZ() is not XYZ, "Cache was not invalidated on a new latitude."
+
     def test_uv_track_multiband(self):
         track, _ = au.uv_track_multiband(
             self.random_antenna_baselines_exp,
@@ -2,6 +2,7 @@ import numpy as np
 import numpy.testing as npt
 
 import argosim.clean as ac
+import argosim.imaging_utils as aiu
 
 
 class TestClean:
@@ -115,3 +116,19 @@ class TestClean:
             decimal=self.clean_decimal,
             err_msg="Sky model with res==True from clean did not match expected values.",
         )
+
+    def test_clean_hogbom_oversized_beam(self):
+        beam = np.load(self.beam_path)
+        beam_2x = np.asarray(aiu.oversize_beam(beam))
+        npt.assert_array_equal(beam_2x.shape, (512, 512))
+        npt.assert_array_almost_equal(ac.cut_beam(beam_2x, 128, 128, beam.shape), beam)
+        # Point source near the edge, the gridded observation wraps its sidelobes
+        obs = np.roll(beam, (-120, 110), axis=(0, 1))
+        residuals = []
+        for B in [beam_2x, beam]:
+            I_clean, sky_model = ac.clean_hogbom(obs, B, 1.0, 1)
+            I_clean_res, _ = ac.clean_hogbom(obs, B, 1.0, 1, res=True)
+            npt.assert_almost_equal(sky_model[8, 238], beam[128, 128])
+            residuals.append(np.max(np.abs(I_clean_res - I_clean)))
+        # Exact subtraction with the oversized beam, truncated sidelobes otherwise
+        assert residuals[0] < 1e-6 * beam[128, 128] < residuals[1]
@@ -71,3 +71,25 @@ class TestDataUtils:
             decimal=self.sky_model_decimal,
             err_msg="Number of sources in sky model does not match expected value.",
         )
+
+    def test_n_source_sky_rng(self):
+        params = ((64, 64), 1.0, [0.05, 0.1], [0.5, 0.5])
+        np.random.seed(self.seed)
+        state = np.random.random(8)
+        np.random.seed(self.seed)
+        sky_model_out = adu.n_source_sky(*params, rng=np.random.default_rng(332))
+        npt.assert_array_equal(
+            np.random.random(8),
+            state,
+            err_msg="Explicit generator changed the global random state.",
+        )
+        npt.assert_array_equal(
+            sky_model_out,
+            adu.n_source_sky(*params, rng=np.random.default_rng(332)),
+            err_msg="Sky model is not reproducible with an explicit generator.",
+        )
+        npt.assert_array_equal(
+            adu.mu2d(rng=1),
+            adu.mu2d(rng=1),
+            err_msg="Mean vector is not reproducible with an explicit seed.",
+        )
@@ -0,0 +1,73 @@
+import os
+from functools import partial
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+import argosim.dataset_utils as dsu
+from argosim.rand_utils import fold_rng
+
+
+class TestDatasetUtils:
+
+    track_path = "src/argosim/tests/data/pathfinder_uv_track.npy"
+    dataset_params = {"n_samples": 5, "shard_size": 2, "chunk_size": 1, "seed": 3}
+    sample_params = {
+        "fov_size": 1.0,
+        "sky_shape": (32, 32),
+        "n_sources": (1, 3),
+        "source_size": (0.05, 0.1),
+        "sigma": 0.1,
+        "out_of_range": "drop",
+    }
+
+    def sample_fn(self):
+        track = np.load(self.track_path)
+        return partial(dsu.simulate_samples, track=track, **self.sample_params)
+
+    def load_field(self, output_dir, name):
+        index = dsu.load_index(output_dir)
+        return np.concatenate(
+            [dsu.load_shard(output_dir, shard)[name] for shard in index["shards"]]
+        )
+
+    def test_write_dataset(self, tmp_path):
+        index = dsu.write_dataset(tmp_path, self.sample_fn(), **self.dataset_params)
+        assert [shard["stop"] for shard in index["shards"]] == [2, 4, 5]
+        assert index["fields"]["obs"]["shape"] == [32, 32]
+        npt.assert_array_equal(self.load_field(tmp_path, "index"), np.arange(5))
+        obs = self.load_field(tmp_path, "obs")
+        assert obs.shape == (5, 32, 32)
+        # Same samples by chunks of a different size
+        samples = self.sample_fn()(np.arange(2, 4), [fold_rng(3, i) for i in [2, 3]])
+        npt.assert_array_almost_equal(samples["obs"], obs[2:4])
+        npt.assert_array_almost_equal(
+            dsu.load_shard(tmp_path, 1)["psf"][0], samples["psf"][0]
+        )
+
+    def test_write_dataset_resume(self, tmp_path):
+        dsu.write_dataset(tmp_path, self.sample_fn(), **self.dataset_params)
+        obs = self.load_field(tmp_path, "obs")
+        # Interrupted writing: the last shard is missing from the index
+        index = dsu.load_index(tmp_path)
+        index["shards"] = index["shards"][:1]
+        dsu._save_index(tmp_path, index)
+        os.remove(tmp_path / "shard_00001_obs.npy")
+        index = dsu.write_dataset(tmp_path, self.sample_fn(), **self.dataset_params)
+        assert len(index["shards"]) == 3
+        npt.assert_array_equal(self.load_field(tmp_path, "obs"), obs)
+        with pytest.raises(ValueError):
+            dsu.write_dataset(
+                tmp_path, self.sample_fn(), **dict(self.dataset_params, seed=4)
+            )
+
+    def test_write_dataset_workers(self, tmp_path):
+        dsu.write_dataset(tmp_path / "serial", self.sample_fn(), **self.dataset_params)
+        dsu.write_dataset(
+            tmp_path / "pool", self.sample_fn(), n_workers=2, **self.dataset_params
+        )
+        npt.assert_array_almost_equal(
+            self.load_field(tmp_path / "pool", "obs"),
+            self.load_field(tmp_path / "serial", "obs"),
+        )
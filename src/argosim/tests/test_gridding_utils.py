@@ -0,0 +1,257 @@
+import jax
+import numpy as np
+import numpy.testing as npt
+
+import argosim.gridding_utils as agu
+import argosim.imaging_utils as aiu
+
+
+class TestGriddingUtils:
+
+    sky_shape = (64, 64)
+    fov_size = (1.0, 1.0)
+    # Point sources (row, column, intensity) relative to the image centre
+    sources = [(5, -9, 1.0), (-3, 2, 0.5)]
+    n_samples = 200
+    seed = 123
+    vis_rtol = 1e-4
+
+    def sky_model(self, sources=None):
+        sky = np.zeros(self.sky_shape)
+        for m, l, intensity in self.sources if sources is None else sources:
+            sky[self.sky_shape[0] // 2 + m, self.sky_shape[1] // 2 + l] = intensity
+        return sky
+
+    def uv_samples(self):
+        # Off-grid uv samples, in wavelengths, within 80% of the uv-plane
+        max_uv = (180 / np.pi) * self.sky_shape[0] / (2 * self.fov_size[0])
+        rng = np.random.default_rng(self.seed)
+        uv_samples = np.zeros((self.n_samples, 3))
+        uv_samples[:, :2] = rng.uniform(-0.8, 0.8, (self.n_samples, 2)) * max_uv
+        return uv_samples
+
+    def direct_vis(self, uv_samples):
+        # Direct Fourier transform of the point sources, sky2uv convention
+        k = uv_samples[:, :2] * np.pi / 180 * np.array(self.fov_size)
+        vis = np.zeros(len(uv_samples), dtype=complex)
+        for m, l, intensity in self.sources:
+            phase = (k[:, 0] * l + k[:, 1] * m) / self.sky_shape[0]
+            vis += intensity * np.exp(-2j * np.pi * phase)
+        return vis
+
+    def test_kernel(self):
+        for kernel in ["kaiser_bessel", "exp_semicircle"]:
+            gk = agu.GriddingKernel(kernel, support=6, oversampling=32)
+            assert gk.table.shape == (6 * 32 + 1,)
+            npt.assert_allclose(gk.table[6 * 16], 1.0)
+            npt.assert_allclose(gk.table, gk.table[::-1])
+            correction = gk.grid_correction(self.sky_shape)
+            assert correction.shape == self.sky_shape
+            assert np.all(correction > 0)
+            assert gk.grid_correction(self.sky_shape) is correction
+            # Fourier transform of the kernel integrated on a fine grid
+            t = np.linspace(-3, 3, 20001)
+            x = np.arange(self.sky_shape[0]) - self.sky_shape[0] // 2
+            ft = np.cos(2 * np.pi * np.outer(x / self.sky_shape[0], t)) @ gk(t)
+            ft = ft * (t[1] - t[0])
+            npt.assert_allclose(
+                correction[:, self.sky_shape[1] // 2], ft * ft[x == 0], rtol=1e-6
+            )
+        with npt.assert_raises(ValueError):
+            agu.GriddingKernel("invalid_kernel")
+
+    def test_predict_visibilities(self):
+        uv_samples = self.uv_samples()
+        vis_exp = self.direct_vis(uv_samples)
+        for kernel in ["kaiser_bessel", "exp_semicircle"]:
+            vis = agu.predict_visibilities(
+                self.sky_model(),
+                uv_samples,
+                self.fov_size,
+                agu.GriddingKernel(kernel),
+            )
+            npt.assert_allclose(
+                vis,
+                vis_exp,
+                atol=self.vis_rtol * np.max(np.abs(vis_exp)),
+                err_msg="Degridded visibilities do not match the direct transform.",
+            )
+
+    def test_image_visibilities(self):
+        uv_samples = self.uv_samples()
+        vis = self.direct_vis(uv_samples)
+        sky = agu.image_visibilities(uv_samples, vis, self.sky_shape, self.fov_size)
+        # Direct inverse transform of the visibilities at the source pixels
+        k = uv_samples[:, :2] * np.pi / 180 * np.array(self.fov_size)
+        for m, l, _ in self.sources:
+            phase = (k[:, 0] * l + k[:, 1] * m) / self.sky_shape[0]
+            pixel_exp = np.sum(vis * np.exp(2j * np.pi * phase)).real
+            pixel_exp /= np.prod(self.sky_shape)
+            npt.assert_allclose(
+                sky[self.sky_shape[0] // 2 + m, self.sky_shape[1] // 2 + l],
+                pixel_exp,
+                rtol=self.vis_rtol,
+                err_msg="Dirty image does not match the direct transform.",
+            )
+
+    def test_nufft(self):
+        uv_samples = self.uv_samples()
+        vis_exp = self.direct_vis(uv_samples)
+        for eps in [1e-2, 1e-4]:
+            vis = agu.sky2vis(self.sky_model(), uv_samples, self.fov_size, eps)
+            err = np.linalg.norm(vis - vis_exp) / np.linalg.norm(vis_exp)
+            assert err < eps, f"NUFFT error {err} above the requested accuracy {eps}."
+
+    def test_simulate_dirty_observation_nufft(self):
+        # On-grid conjugate uv samples, for which the gridded simulation is exact
+        pixel_size = 180 / np.pi / np.array(self.fov_size)
+        rng = np.random.default_rng(self.seed)
+        # Distinct u > 0 pixels, so the samples and their conjugates are distinct
+        pixels = np.stack([np.arange(1, 21), rng.integers(-20, 20, 20)], axis=1)
+        uv_samples = np.zeros((40, 3))
+        uv_samples[:20, :2] = pixels * pixel_size
+        uv_samples[20:, :2] = -pixels * pixel_size
+        obs_params = {"fov_size": self.fov_size[0], "sigma": 0.0}
+        obs_exp, beam_exp = aiu.simulate_dirty_observation(
+            self.sky_model(), uv_samples, **obs_params
+        )
+        obs, beam, vis = agu.simulate_dirty_observation_nufft(
+            self.sky_model(), uv_samples, **obs_params, return_vis=True
+        )
+        assert vis.shape == (40,)
+        npt.assert_allclose(obs, obs_exp, atol=1e-5)
+        npt.assert_allclose(beam, beam_exp, atol=1e-5)
+        # Hermitian track with one sample of each conjugate pair
+        obs_hermitian, _ = agu.simulate_dirty_observation_nufft(
+            self.sky_model(), uv_samples[:20], **obs_params, hermitian=True
+        )
+        npt.assert_allclose(obs_hermitian, obs_exp, atol=1e-5)
+
+    def test_nufft_precision(self):
+        uv_samples = self.uv_samples()
+        sky = self.sky_model()
+        kernel = agu.nufft_kernel(1e-4)
+        with jax.enable_x64(True):
+            for precision, dtype in [("single", np.float32), ("double", np.float64)]:
+                params = {"precision": precision, "kernel": kernel}
+                vis = agu.sky2vis(sky, uv_samples, self.fov_size, **params)
+                assert vis.dtype == np.result_type(dtype, np.complex64)
+                for w_stacking in [False, True]:
+                    dirty = agu.vis2sky(
+                        uv_samples,
+                        vis,
+                        self.sky_shape,
+                        self.fov_size,
+                        w_stacking=w_stacking,
+                        **params,
+                    )
+                    assert dirty.dtype == dtype
+
+    def test_grid_out_of_range(self):
+        uv_samples = self.uv_samples() * 2
+        with npt.assert_raises(ValueError):
+            agu.grid_visibilities(
+                uv_samples,
+                np.ones(self.n_samples),
+                self.sky_shape,
+                self.fov_size,
+            )
+
+    def wide_field_direct_vis(self, uv_samples):
+        # Direct transform with the w-term, V = sum I / n exp(-2i pi (ul + vm + wn'))
+        pixel_size = np.deg2rad(self.wide_fov[0]) / self.sky_shape[0]
+        vis = np.zeros(len(uv_samples), dtype=complex)
+        for m, l, intensity in self.wide_sources:
+            l, m = l * pixel_size, m * pixel_size
+            n = np.sqrt(1 - l**2 - m**2)
+            phase = uv_samples @ np.array([l, m, n - 1])
+            vis += intensity / n * np.exp(-2j * np.pi * phase)
+        return vis
+
+    wide_fov = (3.0, 3.0)
+    # Sources close to the edges of the field, where the w-term is the largest
+    wide_sources = [(25, -28, 1.0), (-20, 12, 0.5)]
+    w_max = 500.0
+    n_w_planes_exp = 23
+    wstack_rtol = 1e-2
+
+    def wide_field_samples(self):
+        uv_samples = self.uv_samples() * self.fov_size[0] / self.wide_fov[0]
+        rng = np.random.default_rng(self.seed)
+        uv_samples[:, 2] = rng.uniform(-self.w_max, self.w_max, self.n_samples)
+        return uv_samples
+
+    def test_plan_w_planes(self):
+        uv_samples = self.wide_field_samples()
+        n_w_planes = agu.plan_w_planes(uv_samples, self.wide_fov)
+        assert n_w_planes == self.n_w_planes_exp
+        assert agu.plan_w_planes(uv_samples, self.wide_fov, phase_tol=0.01) > 200
+        # Coplanar samples only need plain 2D gridding
+        assert agu.plan_w_planes(self.uv_samples(), self.wide_fov) == 1
+
+    def test_predict_visibilities_wstack(self):
+        uv_samples = self.wide_field_samples()
+        vis_exp = self.wide_field_direct_vis(uv_samples)
+        vis = agu.predict_visibilities_wstack(
+            self.sky_model(self.wide_sources), uv_samples, self.wide_fov, phase_tol=1e-2
+        )
+        err = np.linalg.norm(vis - vis_exp) / np.linalg.norm(vis_exp)
+        assert err < self.wstack_rtol, f"W-stacking error {err} too large."
+        # Ignoring the w-term is not accurate for wide fields
+        vis_2d = agu.predict_visibilities(
+            self.sky_model(self.wide_sources), uv_samples, self.wide_fov
+        )
+        err = np.linalg.norm(vis_2d - vis_exp) / np.linalg.norm(vis_exp)
+        assert err > 10 * self.wstack_rtol
+
+    def test_image_visibilities_wstack(self):
+        uv_samples = self.wide_field_samples()
+        vis = self.wide_field_direct_vis(uv_samples)
+        sky = agu.image_visibilities_wstack(
+            uv_samples, vis, self.sky_shape, self.wide_fov, phase_tol=1e-2
+        )
+        # Direct adjoint transform of the visibilities at the source pixels
+        pixel_size = np.deg2rad(self.wide_fov[0]) / self.sky_shape[0]
+        for m, l, _ in self.wide_sources:
+            l_, m_ = l * pixel_size, m * pixel_size
+            n = np.sqrt(1 - l_**2 - m_**2)
+            phase = uv_samples @ np.array([l_, m_, n - 1])
+            pixel_exp = np.sum(vis * np.exp(2j * np.pi * phase)).real / n
+            pixel_exp /= np.prod(self.sky_shape)
+            npt.assert_allclose(
+                sky[self.sky_shape[0] // 2 + m, self.sky_shape[1] // 2 + l],
+                pixel_exp,
+                rtol=self.wstack_rtol,
+                err_msg="W-stacking dirty image does not match the direct transform.",
+            )
+
+    def test_wstack_blocks(self):
+        uv_samples = self.wide_field_samples()
+        # Samples on three of the w-planes only, the other planes are skipped
+        rng = np.random.default_rng(self.seed)
+        uv_samples_sparse = uv_samples.copy()
+        uv_samples_sparse[:, 2] = rng.choice([-1, 0, 1], self.n_samples) * self.w_max
+        sky = self.sky_model(self.wide_sources)
+        for samples in (uv_samples, uv_samples_sparse):
+            params = (self.wide_fov, self.n_w_planes_exp)
+            # One plane per block against all the planes in a single block
+            vis = agu.predict_visibilities_wstack(sky, samples, *params, max_bytes=1)
+            vis_exp = agu.predict_visibilities_wstack(sky, samples, *params)
+            npt.assert_allclose(
+                vis,
+                vis_exp,
+                rtol=self.vis_rtol,
+                err_msg="Blocked w-stacking visibilities do not match.",
+            )
+            dirty = agu.image_visibilities_wstack(
+                samples, vis_exp, self.sky_shape, *params, max_bytes=1
+            )
+            dirty_exp = agu.image_visibilities_wstack(
+                samples, vis_exp, self.sky_shape, *params
+            )
+            npt.assert_allclose(
+                dirty,
+                dirty_exp,
+                atol=self.vis_rtol * np.max(np.abs(dirty_exp)),
+                err_msg="Blocked w-stacking dirty image does not match.",
+            )
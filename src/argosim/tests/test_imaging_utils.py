@@ -1,7 +1,12 @@
+import jax
+import jax.numpy as jnp
 import numpy as np
 import numpy.testing as npt
 
+import argosim.antenna_utils as au
+import argosim.beam_utils as abu
 import argosim.imaging_utils as aiu
+from argosim.rand_utils import fold_rng
 
 
 class TestImagingUtils:
@@ -32,6 +37,9 @@ class TestImagingUtils:
     )
     uv_weights_path = "src/argosim/tests/data/uv_sampling_weights.npy"
 
+    pathfinder_array_path = "configs/arrays/argos_pathfinder.enu.txt"
+    track_params = {"track_time": 1.0, "t_0": -0.5, "n_times": 4, "f": 2e9}
+
     sky_uv_w_masked_path = "src/argosim/tests/data/sky_uv_w_masked.npy"
 
     uv_noise_params = (0.1, 612)  # noise_level  # seed
@@ -70,6 +78,28 @@ class TestImagingUtils:
             err_msg="UV to Sky conversion failed. The resulting Sky image does not match the expected output.",
         )
 
+    def test_sky2uv_half(self):
+        sky = np.load(self.sky_model_expected_path)
+        sky_uv_half = aiu.sky2uv_half(sky)
+        assert sky_uv_half.shape == (sky.shape[0], sky.shape[1] // 2 + 1)
+        npt.assert_array_almost_equal(
+            sky_uv_half,
+            aiu.half_uv_grid(np.load(self.sky_model_uv_expected_path), False),
+            decimal=self.decimal_uv,
+            err_msg="Sky to half UV conversion does not match the full UV image.",
+        )
+
+    def test_uv2sky_half(self):
+        rng = np.random.default_rng(0)
+        for shape in [(8, 8), (7, 9)]:
+            # uv-plane without Hermitian symmetry
+            uv = rng.normal(size=shape) + 1j * rng.normal(size=shape)
+            npt.assert_array_almost_equal(
+                aiu.uv2sky_half(aiu.half_uv_grid(uv), shape),
+                aiu.uv2sky(uv),
+                err_msg="Half UV to sky conversion does not match the full one.",
+            )
+
     def test_grid_uv_samples(self):
         track = np.load(self.pathfinder_uv_track_path)
         # Test binary mask
@@ -94,10 +124,10 @@ class TestImagingUtils:
             err_msg="Histogram mask UV samples do not match the expected output.",
         )
 
-        # Test weighted mask
+        # Test weighted mask, the expected mask used weights indexed as [u, v]
         weights = np.load(self.uv_weights_path)
         mask_uv_weighted, _ = aiu.grid_uv_samples(
-            track, *self.grid_uv_samples_params, mask_type="weighted", weights=weights
+            track, *self.grid_uv_samples_params, mask_type="weighted", weights=weights.T
         )
         mask_uv_weighted_expected = np.load(self.pathfinder_uv_mask_weighted_path)
         npt.assert_array_almost_equal(
@@ -106,6 +136,179 @@ class TestImagingUtils:
             err_msg="Weighted mask UV samples do not match the expected output.",
         )
 
+    def test_count_uv_samples(self):
+        track = np.load(self.pathfinder_uv_track_path)
+        uv_counts, indices, n_out = aiu.count_uv_samples(
+            track, *self.grid_uv_samples_params
+        )
+        assert n_out == 0
+        assert np.issubdtype(uv_counts.dtype, np.integer)
+        assert uv_counts.sum() == track.shape[0]
+        assert indices.shape == (track.shape[0], 2)
+        npt.assert_array_almost_equal(
+            aiu.counts_to_uv_mask(uv_counts, "histogram"),
+            np.load(self.pathfinder_uv_mask_hist_path),
+            err_msg="Histogram mask from counts does not match the expected output.",
+        )
+        npt.assert_array_almost_equal(
+            aiu.counts_to_uv_mask(uv_counts, "binary"),
+            np.load(self.pathfinder_uv_mask_path),
+            err_msg="Binary mask from counts does not match the expected output.",
+        )
+        # Samples below the grid origin are out of range too
+        with npt.assert_raises(ValueError):
+            aiu.count_uv_samples(np.array([[-1e4, 0.0, 0.0]]), (64, 64), (1.0, 1.0))
+        # Device tracks are padded and counted without a copy to the host
+        track = jnp.asarray(track)
+        params = (*self.grid_uv_samples_params, False, None, "drop")
+        aiu.count_uv_samples(track, *params)
+        with jax.transfer_guard_device_to_host("disallow"):
+            uv_counts_device, _, _ = aiu.count_uv_samples(track, *params)
+        npt.assert_array_equal(uv_counts_device, uv_counts)
+
+    def test_count_uv_samples_half_plane(self):
+        uv = np.random.default_rng(0).uniform(-300, 300, (500, 3))
+        for shape in [(64, 64), (63, 63)]:
+            for hermitian in [False, True]:
+                track = uv if hermitian else np.concatenate([uv, -uv])
+                params = (shape, (1.0, 1.0), hermitian)
+                uv_counts, _, _ = aiu.count_uv_samples(
+                    track, *params, out_of_range="drop"
+                )
+                uv_counts_half, _, _ = aiu.count_uv_samples(
+                    track, *params, out_of_range="drop", half_plane=True
+                )
+                # Folded counts of the samples and of their conjugates
+                npt.assert_array_equal(
+                    uv_counts_half,
+                    aiu.half_uv_grid(
+                        uv_counts + aiu.mirror_uv_grid(uv_counts), symmetrize=False
+                    ),
+                )
+                for mask_type in ["binary", "histogram", "briggs"]:
+                    mask_params = (mask_type, None, hermitian, None)
+                    uv_mask = aiu.counts_to_uv_mask(uv_counts, *mask_params)
+                    npt.assert_allclose(
+                        aiu.counts_to_uv_mask(
+                            uv_counts_half, *mask_params, True, sky_uv_shape=shape
+                        ),
+                        aiu.half_uv_grid(uv_mask),
+                        rtol=1e-5,
+                        err_msg="Half plane mask does not match the full mask.",
+                    )
+
+    def test_imaging_weights(self):
+        track = np.load(self.pathfinder_uv_track_path)
+        uv_counts, _, _ = aiu.count_uv_samples(track, *self.grid_uv_samples_params)
+        natural = aiu.imaging_weights(uv_counts, "natural")
+        uniform = aiu.imaging_weights(uv_counts, "uniform")
+        npt.assert_allclose(natural, uv_counts)
+        npt.assert_allclose(uniform, uv_counts > 0)
+        # Briggs weighting goes from uniform to natural with the robustness
+        briggs_low = aiu.imaging_weights(uv_counts, "briggs", robust=-5)
+        briggs_high = aiu.imaging_weights(uv_counts, "briggs", robust=5)
+        npt.assert_allclose(briggs_low / briggs_low.max(), uniform, atol=1e-3)
+        npt.assert_allclose(briggs_high / briggs_high.max(), natural / natural.max())
+        briggs = aiu.imaging_weights(uv_counts, "briggs", robust=0.0)
+        assert np.all((briggs <= natural) & (briggs >= 0))
+        with npt.assert_raises(ValueError):
+            aiu.imaging_weights(uv_counts, "invalid_weighting")
+
+    def test_grid_uv_samples_weighting(self):
+        track = np.load(self.pathfinder_uv_track_path)
+        mask_uv_hist = np.load(self.pathfinder_uv_mask_hist_path)
+        mask_uv, _ = aiu.grid_uv_samples(
+            track, *self.grid_uv_samples_params, mask_type="natural"
+        )
+        npt.assert_array_almost_equal(mask_uv, mask_uv_hist)
+        # The taper is 1/2 at a uv distance of taper / 2
+        taper = 1000.0
+        mask_uv_taper, _ = aiu.grid_uv_samples(
+            track, *self.grid_uv_samples_params, mask_type="natural", taper=taper
+        )
+        taper_grid = aiu.uv_taper((256, 256), (3.0, 3.0), taper)
+        npt.assert_array_almost_equal(mask_uv_taper, mask_uv_hist * taper_grid)
+        pix_size = 180 / np.pi / 3.0
+        npt.assert_allclose(
+            aiu.uv_taper((1, 1001), (3.0, 3.0), 2 * pix_size * 100)[0, 600], 0.5
+        )
+
+    def test_grid_uv_samples_hermitian(self):
+        array = au.load_antenna_enu_txt(self.pathfinder_array_path)
+        weights = np.load(self.uv_weights_path)
+        track, _ = au.uv_track_multiband(au.get_baselines(array), **self.track_params)
+        baselines_unique, _ = au.get_baselines(array, unique=True)
+        track_unique, _ = au.uv_track_multiband(baselines_unique, **self.track_params)
+        for mask_type in ["binary", "histogram", "weighted"]:
+            mask_uv, _ = aiu.grid_uv_samples(
+                track, *self.grid_uv_samples_params, mask_type, weights
+            )
+            mask_uv_hermitian, _ = aiu.grid_uv_samples(
+                track_unique,
+                *self.grid_uv_samples_params,
+                mask_type,
+                weights,
+                hermitian=True,
+            )
+            npt.assert_array_almost_equal(
+                mask_uv_hermitian,
+                mask_uv,
+                err_msg=f"Hermitian {mask_type} mask does not match the full track mask.",
+            )
+
+    def test_grid_uv_samples_stream(self):
+        array = au.load_antenna_enu_txt(self.pathfinder_array_path)
+        baselines = au.get_baselines(array)
+        track_params = dict(self.track_params, df=2e8, n_freqs=3)
+        track, _ = au.uv_track_multiband(baselines, **track_params)
+        track_stream = au.uv_track_stream(baselines, max_bytes=1024, **track_params)
+        mask_uv, _ = aiu.grid_uv_samples(
+            track, *self.grid_uv_samples_params, mask_type="histogram"
+        )
+        mask_uv_stream, indices = aiu.grid_uv_samples(
+            track_stream, *self.grid_uv_samples_params, mask_type="histogram"
+        )
+        assert indices is None
+        npt.assert_array_almost_equal(
+            mask_uv_stream,
+            mask_uv,
+            err_msg="Histogram mask from a streamed track does not match the full track.",
+        )
+
+    def test_grid_uv_samples_redundant(self):
+        array = au.uni_antenna_array(4, 4, 300.0, 300.0)
+        weights = np.load(self.uv_weights_path)
+        track, _ = au.uv_track_multiband(au.get_baselines(array), **self.track_params)
+        for unique in [False, True]:
+            baselines, multiplicity, _, _ = au.get_redundant_baselines(array, unique)
+            track_redundant, _ = au.uv_track_multiband(baselines, **self.track_params)
+            for mask_type in ["binary", "histogram", "weighted"]:
+                mask_uv, _ = aiu.grid_uv_samples(
+                    track, *self.grid_uv_samples_params, mask_type, weights
+                )
+                mask_uv_redundant, _ = aiu.grid_uv_samples(
+                    track_redundant,
+                    *self.grid_uv_samples_params,
+                    mask_type,
+                    weights,
+                    hermitian=unique,
+                    multiplicity=multiplicity,
+                )
+                npt.assert_array_almost_equal(
+                    mask_uv_redundant,
+                    mask_uv,
+                    decimal=5,
+                    err_msg=f"Redundant {mask_type} mask does not match the full track mask.",
+                )
+
+    def test_mirror_uv_grid(self):
+        for n in [4, 5]:
+            grid = np.zeros((n, n))
+            grid[n // 2 + 1, n // 2 - 1] = 1.0
+            grid_mirror = aiu.mirror_uv_grid(grid)
+            assert grid_mirror[n // 2 - 1, n // 2 + 1] == 1.0
+            assert np.sum(grid_mirror) == 1.0
+
     def test_grid_uv_samples_out_of_range(self):
         track = np.load(self.pathfinder_uv_track_path)
         # catch ValueError for out of range samples
@@ -116,6 +319,31 @@ class TestImagingUtils:
                 track, (64, 64), (1.0, 1.0), mask_type="histogram"
             )
 
+    def test_grid_uv_samples_out_of_range_policy(self):
+        track = np.load(self.pathfinder_uv_track_path)
+        grid_params = ((128, 128), (3.0, 3.0), "histogram")
+        min_index, max_index = 0, 127
+        indices = np.asarray(aiu.scale_uv_samples(track, *grid_params[:2]))
+        n_out_exp = np.sum(
+            np.any((indices < min_index) | (indices > max_index), axis=1)
+        )
+        assert n_out_exp > 0
+        # Drop the samples out of range
+        mask_drop, _, n_out = aiu.grid_uv_samples(
+            track, *grid_params, out_of_range="drop", return_n_out=True
+        )
+        assert n_out == n_out_exp
+        npt.assert_allclose(np.sum(mask_drop.real), len(track) - n_out_exp)
+        # Clip the samples out of range to the grid edges
+        mask_clip, indices_clip, n_out = aiu.grid_uv_samples(
+            track, *grid_params, out_of_range="clip", return_n_out=True
+        )
+        assert n_out == n_out_exp
+        npt.assert_allclose(np.sum(mask_clip.real), len(track))
+        assert np.all((indices_clip >= min_index) & (indices_clip <= max_index))
+        with npt.assert_raises(ValueError):
+            aiu.grid_uv_samples(track, *grid_params, out_of_range="invalid_policy")
+
     def test_grid_uv_samples_invalid_mask_type(self):
         track = np.load(self.pathfinder_uv_track_path)
         # catch ValueError for invalid mask type
@@ -182,6 +410,96 @@ class TestImagingUtils:
             err_msg="Simulated dirty beam does not match the expected output.",
         )
 
+    def test_simulate_dirty_obs_lazy_track(self):
+        array = au.load_antenna_enu_txt(self.pathfinder_array_path)
+        baselines = au.get_baselines(array)
+        track_params = dict(self.track_params, df=2e8, n_freqs=3)
+        track, freqs = au.uv_track_multiband(baselines, multi_band=True, **track_params)
+        track_lazy, _ = au.uv_track_multiband(baselines, lazy=True, **track_params)
+        sky = np.load(self.sky_model_expected_path)
+        sim_params = {"fov_size": 3.0, "sigma": 0.0, "multi_band": True, "freqs": freqs}
+        obs, dirty_beam = aiu.simulate_dirty_observation(sky, track, **sim_params)
+        obs_lazy, dirty_beam_lazy = aiu.simulate_dirty_observation(
+            sky, track_lazy, **sim_params
+        )
+        npt.assert_array_almost_equal(
+            obs_lazy,
+            obs,
+            err_msg="Dirty observation from a lazy track does not match the expected output.",
+        )
+        npt.assert_array_almost_equal(
+            dirty_beam_lazy,
+            dirty_beam,
+            err_msg="Dirty beam from a lazy track does not match the expected output.",
+        )
+
+    def test_simulate_dirty_obs_stream(self):
+        array = au.load_antenna_enu_txt(self.pathfinder_array_path)
+        baselines = au.get_baselines(array)
+        track_params = dict(self.track_params, df=2e8, n_freqs=3)
+        track, freqs = au.uv_track_multiband(baselines, multi_band=True, **track_params)
+        track_stream = au.uv_track_stream(baselines, max_bytes=1024, **track_params)
+        sky = np.load(self.sky_model_expected_path)
+        sim_params = {"fov_size": 3.0, "sigma": 0.0, "multi_band": True, "freqs": freqs}
+        obs, dirty_beam = aiu.simulate_dirty_observation(sky, track, **sim_params)
+        obs_stream, dirty_beam_stream = aiu.simulate_dirty_observation(
+            sky, track_stream, **sim_params
+        )
+        npt.assert_array_almost_equal(
+            obs_stream,
+            obs,
+            err_msg="Dirty observation from a streamed track does not match the expected output.",
+        )
+        npt.assert_array_almost_equal(
+            dirty_beam_stream,
+            dirty_beam,
+            err_msg="Dirty beam from a streamed track does not match the expected output.",
+        )
+
+    def test_simulate_dirty_obs_half_plane(self):
+        sky = np.load(self.sky_model_expected_path)
+        track = np.load(self.pathfinder_uv_track_path)
+        params = self.obs_sim_single_band_params
+        obs_half, dirty_beam_half = aiu.simulate_dirty_observation(
+            sky,
+            track,
+            fov_size=params["fov_size"],
+            sigma=params["sigma"],
+            seed=params["seed"],
+            half_plane=True,
+        )
+        npt.assert_array_almost_equal(
+            obs_half,
+            np.load(self.obs_sim_single_band_path),
+            err_msg="Half plane dirty observation does not match the expected output.",
+        )
+        npt.assert_array_almost_equal(
+            dirty_beam_half,
+            np.load(self.dirty_beam_sim_single_band_path),
+            err_msg="Half plane dirty beam does not match the expected output.",
+        )
+
+    def test_simulate_dirty_obs_single_precision(self):
+        sky = np.load(self.sky_model_expected_path)
+        track = np.load(self.pathfinder_uv_track_path)
+        params = self.obs_sim_single_band_params
+        obs_out, dirty_beam_out = aiu.simulate_dirty_observation(
+            sky,
+            track,
+            fov_size=params["fov_size"],
+            sigma=params["sigma"],
+            seed=params["seed"],
+            precision="single",
+        )
+        assert obs_out.dtype == np.float32
+        assert dirty_beam_out.dtype == np.float32
+        npt.assert_array_almost_equal(
+            obs_out,
+            np.load(self.obs_sim_single_band_path),
+            decimal=self.decimal_uv,
+            err_msg="Single precision dirty observation does not match the expected output.",
+        )
+
     def test_simulate_dirty_obs_multi_band(self):
         sky = np.load(self.sky_model_expected_path)
         track = np.load(self.pathfinder_uv_track_path)
@@ -208,3 +526,300 @@ class TestImagingUtils:
             dirty_beam_exp,
             err_msg="Simulated multi-band dirty beam does not match the expected output.",
         )
+
+    def test_count_uv_samples_multiband(self, monkeypatch):
+        array = au.load_antenna_enu_txt(self.pathfinder_array_path)
+        baselines = au.get_baselines(array)
+        track_params = dict(self.track_params, df=2e8, n_freqs=3)
+        track, _ = au.uv_track_multiband(baselines, multi_band=True, **track_params)
+        shape, fov = self.grid_uv_samples_params
+        uv_counts, n_out = aiu.count_uv_samples_multiband(track, 3, shape, fov)
+        assert uv_counts.shape == (3, *shape)
+        assert n_out == 0
+        for uv_counts_f, track_f in zip(uv_counts, track):
+            npt.assert_array_equal(
+                uv_counts_f, aiu.count_uv_samples(track_f, shape, fov)[0]
+            )
+        # Per-band list of tracks
+        uv_counts_list, _ = aiu.count_uv_samples_multiband(list(track), 3, shape, fov)
+        npt.assert_array_equal(uv_counts_list, uv_counts)
+        # One band per scatter within a small memory budget
+        uv_counts_small, _ = aiu.count_uv_samples_multiband(
+            track, 3, shape, fov, max_bytes=1
+        )
+        npt.assert_array_equal(uv_counts_small, uv_counts)
+        # Bands split into scatters of at most two channels, and block of bands
+        monkeypatch.setattr(aiu, "_MAX_FLAT_INDEX", 2 * shape[0] * shape[1] + 1)
+        uv_counts_split, _ = aiu.count_uv_samples_multiband(track, 3, shape, fov)
+        npt.assert_array_equal(uv_counts_split, uv_counts)
+        uv_counts_block, _ = aiu.count_uv_samples_multiband(
+            track, 3, shape, fov, channel_range=(1, 3)
+        )
+        npt.assert_array_equal(uv_counts_block, uv_counts[1:])
+
+    def test_count_uv_samples_multiband_overflow(self):
+        # The flat index of channel 200 of a 4096 x 4096 grid overflows int32
+        uvw = np.array([[100.0, 50.0, 0.0], [-100.0, -50.0, 0.0]])
+        chunk = au.UVTrack(uvw, np.full(128, 1e9), channels=np.arange(128, 256))
+        shape = (4096, 4096)
+        uv_counts, _ = aiu.count_uv_samples_multiband(
+            iter([chunk]), 256, shape, (1.0, 1.0), channel_range=(200, 201)
+        )
+        uv_counts_exp, _, _ = aiu.count_uv_samples(chunk[72], shape, (1.0, 1.0))
+        npt.assert_array_equal(uv_counts[0], uv_counts_exp)
+        assert uv_counts[0, 0, 0] == 0 and uv_counts.sum() == 2
+
+    def test_simulate_dirty_cube(self, tmp_path):
+        array = au.load_antenna_enu_txt(self.pathfinder_array_path)
+        baselines = au.get_baselines(array)
+        track_params = dict(self.track_params, df=2e8, n_freqs=3)
+        track, freqs = au.uv_track_multiband(baselines, multi_band=True, **track_params)
+        sky = np.load(self.sky_model_expected_path)
+        sim_params = {"fov_size": 3.0, "sigma": 0.1, "seed": 717}
+        beam = abu.CosCubeBeam(n_pix=sky.shape[0])
+        obs, dirty_beam = aiu.simulate_dirty_cube(
+            sky, track, freqs=freqs, beam=beam, **sim_params
+        )
+        assert obs.shape == dirty_beam.shape == (3, *sky.shape)
+        for f_, track_f, obs_f, dirty_beam_f in zip(freqs, track, obs, dirty_beam):
+            beam.set_f(f_ / 1e9)
+            obs_exp, dirty_beam_exp = aiu.simulate_dirty_observation(
+                sky * beam.get_beam(), track_f, **sim_params
+            )
+            npt.assert_array_almost_equal(
+                obs_f,
+                obs_exp,
+                decimal=self.decimal_uv,
+                err_msg="Dirty cube channel does not match the single band output.",
+            )
+            npt.assert_array_almost_equal(dirty_beam_f, dirty_beam_exp)
+        # One channel per block, written to memory-mapped cubes
+        obs_mm, dirty_beam_mm = aiu.simulate_dirty_cube(
+            sky,
+            track,
+            freqs=freqs,
+            beam=beam,
+            out=tmp_path / "cube",
+            max_bytes=1,
+            **sim_params,
+        )
+        assert isinstance(obs_mm, np.memmap)
+        npt.assert_array_almost_equal(np.load(tmp_path / "cube_obs.npy"), obs)
+        npt.assert_array_almost_equal(
+            np.load(tmp_path / "cube_dirty_beam.npy"), dirty_beam
+        )
+
+    def test_sky_fft_cache(self):
+        sky = np.load(self.sky_model_expected_path)
+        fft_cache = aiu.SkyFFTCache(max_size=2)
+        npt.assert_array_almost_equal(fft_cache(sky), aiu.sky2uv(sky))
+        npt.assert_array_almost_equal(
+            fft_cache(sky, half_plane=True), aiu.sky2uv_half(sky)
+        )
+        fft_cache(sky)
+        assert (fft_cache.hits, fft_cache.misses) == (1, 2)
+        # Distinct images of a stack are transformed once
+        sky_uv = fft_cache.transform_stack([2 * sky, sky, 2 * sky])
+        npt.assert_array_almost_equal(sky_uv[0], 2 * aiu.sky2uv(sky), decimal=4)
+        assert (fft_cache.hits, fft_cache.misses) == (3, 3)
+        assert len(fft_cache) == 2
+
+    def test_oversize_beam(self):
+        track = np.load(self.pathfinder_uv_track_path)
+        uv_mask, _ = aiu.grid_uv_samples(
+            track, (64, 64), (1.0, 1.0), out_of_range="drop"
+        )
+        # Same uv samples on the uv grid of a field twice larger
+        uv_mask_2x = np.zeros((128, 128), dtype=uv_mask.dtype)
+        uv_mask_2x[::2, ::2] = uv_mask
+        npt.assert_array_almost_equal(
+            aiu.oversize_beam(aiu.uv2sky(uv_mask)), 4 * aiu.uv2sky(uv_mask_2x)
+        )
+        _, beam_2x = aiu.simulate_dirty_observation(
+            np.zeros((64, 64)), track, 1.0, out_of_range="drop", beam_factor=2
+        )
+        npt.assert_array_almost_equal(beam_2x, 4 * aiu.uv2sky(uv_mask_2x))
+
+    def test_uv_mask_cache(self, tmp_path):
+        sky = np.load(self.sky_model_expected_path)
+        track = np.load(self.pathfinder_uv_track_path)
+        grid_params = {"sky_uv_shape": sky.shape, "fov_size": (1.0, 1.0)}
+        mask_cache = aiu.UVMaskCache(max_size=1, cache_dir=tmp_path)
+        uv_mask, dirty_beam = mask_cache(track, **grid_params)
+        uv_mask_exp, _ = aiu.grid_uv_samples(track, **grid_params)
+        npt.assert_array_almost_equal(uv_mask, uv_mask_exp)
+        npt.assert_array_almost_equal(dirty_beam, aiu.uv2sky(uv_mask_exp))
+        mask_cache(track, **grid_params)
+        mask_cache(track, mask_type="histogram", **grid_params)
+        assert (mask_cache.hits, mask_cache.misses, len(mask_cache)) == (1, 2, 1)
+        # On-disk entries are shared across caches
+        disk_cache = aiu.UVMaskCache(cache_dir=tmp_path)
+        _, dirty_beam_disk = disk_cache(track, **grid_params)
+        npt.assert_array_almost_equal(dirty_beam_disk, dirty_beam)
+        assert (disk_cache.hits, disk_cache.misses) == (1, 0)
+        # Same observation with the cached uv mask and dirty beam
+        params = {"fov_size": 1.0, "sigma": 0.1, "seed": 717}
+        obs_exp, beam_exp = aiu.simulate_dirty_observation(sky, track, **params)
+        obs, beam = aiu.simulate_dirty_observation(
+            sky, track, mask_cache=mask_cache, **params
+        )
+        npt.assert_array_almost_equal(obs, obs_exp)
+        npt.assert_array_almost_equal(beam, beam_exp)
+
+    class AchromaticBeam:
+        def __init__(self, n_pix):
+            self.amplitude = np.linspace(0.5, 1.0, n_pix)[None, :] ** 2
+
+        def set_fov(self, fov_deg):
+            pass
+
+        def set_f(self, f):
+            pass
+
+        def get_beam(self):
+            return self.amplitude
+
+    def test_simulate_dirty_cube_fft_reuse(self):
+        array = au.load_antenna_enu_txt(self.pathfinder_array_path)
+        baselines = au.get_baselines(array)
+        track_params = dict(self.track_params, df=2e8, n_freqs=3)
+        track, freqs = au.uv_track_multiband(baselines, multi_band=True, **track_params)
+        sky = np.load(self.sky_model_expected_path)
+        sim_params = {"fov_size": 3.0, "sigma": 0.1, "seed": 717}
+        for beam in [None, self.AchromaticBeam(sky.shape[0])]:
+            fft_cache = aiu.SkyFFTCache()
+            obs, _ = aiu.simulate_dirty_cube(
+                sky,
+                track,
+                freqs=freqs,
+                beam=beam,
+                max_bytes=1,
+                fft_cache=fft_cache,
+                **sim_params,
+            )
+            assert fft_cache.misses == 1
+            sky_obs = sky if beam is None else sky * beam.get_beam()
+            obs_exp, _ = aiu.simulate_dirty_observation(
+                sky_obs, track[-1], **sim_params
+            )
+            npt.assert_array_almost_equal(obs[-1], obs_exp, decimal=self.decimal_uv)
+
+    def test_sampled_noise_uv(self):
+        shape, fov = (64, 64), (1.0, 1.0)
+        sigma, n_repeat = 0.5, 4
+        # Distinct u > 0 cells, each sampled n_repeat times
+        u, v = np.meshgrid(np.arange(1, 31), np.arange(-30, 30))
+        pixels = np.stack([u.ravel(), v.ravel()], axis=1)
+        uv_samples = np.zeros((len(pixels) * n_repeat, 3))
+        uv_samples[:, :2] = np.repeat(pixels, n_repeat, axis=0) * 180 / np.pi
+        for hermitian in [True, False]:
+            track = (
+                uv_samples if hermitian else np.concatenate([uv_samples, -uv_samples])
+            )
+            grid_params = {
+                "sky_uv_shape": shape,
+                "fov_size": fov,
+                "hermitian": hermitian,
+            }
+            uv_mask, _ = aiu.grid_uv_samples(track, **grid_params)
+            noise_uv = aiu.sampled_noise_uv(
+                track,
+                sigma,
+                uv_mask,
+                shape,
+                fov,
+                hermitian,
+                seed=self.uv_noise_params[1],
+            )
+            npt.assert_array_equal(noise_uv[uv_mask == 0], 0)
+            npt.assert_allclose(noise_uv, np.conj(aiu.mirror_uv_grid(noise_uv)))
+            # The noise of a cell is the mean noise of its samples
+            noise_std = np.std(noise_uv[uv_mask != 0].real)
+            npt.assert_allclose(noise_std, sigma / np.sqrt(n_repeat), rtol=0.05)
+            # Same noise on the half uv-plane
+            uv_mask_half, _ = aiu.grid_uv_samples(track, **grid_params, half_plane=True)
+            noise_uv_half = aiu.sampled_noise_uv(
+                track,
+                sigma,
+                uv_mask_half,
+                shape,
+                fov,
+                hermitian,
+                seed=self.uv_noise_params[1],
+            )
+            npt.assert_allclose(
+                noise_uv_half, aiu.half_uv_grid(noise_uv, symmetrize=False), atol=1e-6
+            )
+
+    def test_simulate_dirty_obs_vis_sigma(self):
+        sky = np.load(self.sky_model_expected_path)
+        track = np.load(self.pathfinder_uv_track_path)
+        params = {"fov_size": 1.0, "seed": 717}
+        obs_exp, _ = aiu.simulate_dirty_observation(sky, track, sigma=0.0, **params)
+        obs, _ = aiu.simulate_dirty_observation(sky, track, vis_sigma=0.0, **params)
+        npt.assert_array_almost_equal(obs, obs_exp)
+        obs_noisy, _ = aiu.simulate_dirty_observation(
+            sky, track, vis_sigma=1.0, **params
+        )
+        assert np.std(obs_noisy - obs_exp) > 0
+        # Multi-band cube with one noise level per band
+        cube, _ = aiu.simulate_dirty_observation(
+            sky,
+            np.stack([track, track]),
+            multi_band=True,
+            freqs=[1e9, 1e9],
+            vis_sigma=np.array([[0.0], [1.0]]),
+            **params,
+        )
+        npt.assert_array_almost_equal(cube[0], obs_exp)
+        npt.assert_array_almost_equal(cube[1], obs_noisy)
+        # Iterators of track chunks cannot be indexed by band
+        with npt.assert_raises(ValueError):
+            aiu.simulate_dirty_cube(
+                sky, iter([track, track]), freqs=[1e9, 1e9], vis_sigma=1.0, **params
+            )
+
+    def test_simulate_dirty_batch(self, tmp_path):
+        sky = np.load(self.sky_model_expected_path)
+        skies = np.stack([sky, sky[::-1], sky.T])
+        track = np.load(self.pathfinder_uv_track_path)
+        params = {"fov_size": 1.0, "sigma": 0.5, "rng": 5}
+        obs, beam = aiu.simulate_dirty_batch(skies, track, **params)
+        obs_1, _ = aiu.simulate_dirty_batch(
+            skies, track, out=tmp_path / "obs.npy", max_bytes=1, **params
+        )
+        npt.assert_array_almost_equal(obs_1, obs)
+        assert isinstance(obs_1, np.memmap)
+        # The uv mask and dirty beam of a given cache are shared across calls
+        mask_cache = aiu.UVMaskCache()
+        for _ in range(2):
+            obs_c, beam_c = aiu.simulate_dirty_batch(
+                skies, track, mask_cache=mask_cache, **params
+            )
+            npt.assert_array_almost_equal(obs_c, obs)
+            npt.assert_array_almost_equal(beam_c, beam)
+        assert (mask_cache.hits, mask_cache.misses) == (1, 1)
+        # Same observations as the single sky simulations
+        for i in range(len(skies)):
+            params["rng"] = fold_rng(5, i)
+            obs_i, beam_i = aiu.simulate_dirty_observation(skies[i], track, **params)
+            npt.assert_array_almost_equal(obs[i], obs_i)
+        npt.assert_array_almost_equal(beam, beam_i)
+
+    def test_simulate_dirty_cube_rng(self):
+        sky = np.load(self.sky_model_expected_path)[::4, ::4]
+        track = np.load(self.pathfinder_uv_track_path)
+        params = {"fov_size": 1.0, "sigma": 0.5, "out_of_range": "drop", "rng": 5}
+        cube, _ = aiu.simulate_dirty_cube(
+            sky, np.stack([track] * 3), freqs=[1e9] * 3, **params
+        )
+        # Independent noise of each band, whatever the block size
+        assert np.std(cube[0] - cube[1]) > 0
+        cube_1, _ = aiu.simulate_dirty_cube(
+            sky, np.stack([track] * 3), freqs=[1e9] * 3, max_bytes=1, **params
+        )
+        npt.assert_array_almost_equal(cube_1, cube)
+        # Band generators derived from the seed and the band index
+        params["rng"] = fold_rng(5, 2)
+        obs, _ = aiu.simulate_dirty_observation(sky, track, **params)
+        npt.assert_array_almost_equal(cube[2], obs)
@@ -0,0 +1,70 @@
+import jax
+import numpy as np
+import numpy.testing as npt
+
+import argosim.imaging_utils as aiu
+import argosim.jax_utils as aju
+
+
+class TestJaxUtils:
+
+    bucket_sizes_in = [0, 1, 3, 8, 9, 100, 512, 513, 1000]
+    bucket_sizes_exp = [0, 1, 3, 8, 10, 112, 512, 640, 1024]
+
+    def test_shape_bucket(self):
+        bucket_sizes_out = [aju.shape_bucket(n) for n in self.bucket_sizes_in]
+        npt.assert_array_equal(
+            bucket_sizes_out,
+            self.bucket_sizes_exp,
+            err_msg="Shape buckets do not match expected values.",
+        )
+
+    def test_pad_to_bucket(self):
+        x = np.ones((9, 3))
+        x_pad = aju.pad_to_bucket(x)
+        assert x_pad.shape == (10, 3), "Padded shape does not match its bucket."
+        npt.assert_array_equal(x_pad[:9], x, err_msg="Padding modified the array.")
+        npt.assert_array_equal(x_pad[9:], 0.0, err_msg="Padding is not zero.")
+
+    def test_enable_compilation_cache(self, tmp_path):
+        cache_dir = jax.config.jax_compilation_cache_dir
+        min_time = jax.config.jax_persistent_cache_min_compile_time_secs
+        try:
+            aju.enable_compilation_cache(tmp_path, min_compile_time_secs=0.0)
+            assert jax.config.jax_compilation_cache_dir == str(tmp_path)
+            assert jax.config.jax_persistent_cache_min_compile_time_secs == 0.0
+        finally:
+            jax.config.update("jax_compilation_cache_dir", cache_dir)
+            jax.config.update("jax_persistent_cache_min_compile_time_secs", min_time)
+
+    def test_precision_policy(self):
+        try:
+            aju.set_precision("single")
+            assert aju.get_precision() == "single"
+            assert aju.real_dtype() == np.float32
+            assert aju.complex_dtype() == np.complex64
+            assert aju.cast_precision(np.ones(3)).dtype == np.float32
+            assert aju.cast_precision(np.ones(3) + 0j).dtype == np.complex64
+        finally:
+            aju.set_precision(None)
+        x = np.ones(3)
+        assert aju.cast_precision(x) is x, "Array cast without precision policy."
+
+    def test_per_call_double_precision(self):
+        sky = np.ones((8, 8))
+        if not jax.config.jax_enable_x64:
+            with npt.assert_raises(ValueError):
+                aju.get_precision("double")
+            with npt.assert_raises(ValueError):
+                aiu.sky2uv(sky, precision="double")
+        with jax.enable_x64(True):
+            assert aju.get_precision("double") == "double"
+            assert aju.real_dtype("double") == np.float64
+            assert aiu.sky2uv(sky, precision="double").dtype == np.complex128
+            assert aiu.sky2uv(sky, precision="single").dtype == np.complex64
+
+    def test_invalid_precision(self):
+        with npt.assert_raises(ValueError):
+            aju.set_precision("half")
+        with npt.assert_raises(ValueError):
+            aju.get_precision("quad")
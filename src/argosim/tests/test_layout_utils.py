@@ -0,0 +1,71 @@
+import numpy as np
+import numpy.testing as npt
+
+import argosim.antenna_utils as au
+import argosim.imaging_utils as iu
+import argosim.layout_utils as lu
+
+
+class TestLayoutUtils:
+
+    layouts = [au.random_antenna_arr(n, seed=n) for n in (4, 7, 5)]
+    n_antenna_exp = [4, 7, 5]
+    n_baselines_exp = [12, 42, 20]
+    padded_shape_exp = (3, 7, 3)
+    track_params = {
+        "lat": 35.0 / 180 * np.pi,
+        "dec": 35.0 / 180 * np.pi,
+        "track_time": 1.0,
+        "t_0": -0.5,
+        "n_times": 4,
+        "f": 1.0e9,
+        "df": 1.0e8,
+        "n_freqs": 2,
+    }
+    grid_params = {"sky_uv_shape": (128, 128), "fov_size": (1.0, 1.0)}
+
+    def test_pad_antenna_arrays(self):
+        antenna, mask = lu.pad_antenna_arrays(self.layouts)
+        npt.assert_equal(antenna.shape, self.padded_shape_exp)
+        npt.assert_array_equal(mask.sum(axis=1), self.n_antenna_exp)
+        npt.assert_array_equal(antenna[1], self.layouts[1])
+
+    def test_layout_baselines(self):
+        baselines, baselines_mask = lu.layout_baselines(
+            *lu.pad_antenna_arrays(self.layouts)
+        )
+        npt.assert_array_equal(baselines_mask.sum(axis=1), self.n_baselines_exp)
+        npt.assert_allclose(
+            baselines[0][baselines_mask[0]],
+            au.get_baselines(self.layouts[0]),
+            atol=1e-3,
+            err_msg="Layout baselines do not match expected output.",
+        )
+
+    def test_evaluate_layouts(self):
+        # Small memory budget to split the layouts in several blocks
+        metrics = lu.evaluate_layouts(
+            self.layouts,
+            **self.track_params,
+            **self.grid_params,
+            return_uv_counts=True,
+            max_bytes=1,
+        )
+        npt.assert_array_equal(metrics["n_antenna"], self.n_antenna_exp)
+        npt.assert_array_equal(metrics["n_baselines"], self.n_baselines_exp)
+        npt.assert_array_equal(metrics["n_out_of_range"], 0)
+        for i, layout in enumerate(self.layouts):
+            track, _ = au.uv_track_multiband(
+                au.get_baselines(layout), **self.track_params
+            )
+            uv_counts, _ = iu.grid_uv_samples(
+                track, **self.grid_params, mask_type="histogram"
+            )
+            npt.assert_allclose(
+                metrics["uv_counts"][i],
+                uv_counts.real,
+                err_msg="Layout uv coverage does not match the single layout one.",
+            )
+            npt.assert_allclose(
+                metrics["filling_factor"][i], np.mean(uv_counts.real > 0)
+            )
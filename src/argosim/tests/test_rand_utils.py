@@ -1,5 +1,9 @@
+import jax
+import numpy as np
 import numpy.random as rnd
+import numpy.testing as npt
 
+from argosim.rand_utils import fold_rng, get_rng, local_rng
 from argosim.rand_utils import local_seed as ls
 
 
@@ -28,7 +32,37 @@ def test_seed_safety():
             assert (original == new).all(), "Nested empty seed changed outcome!"
 
 
+def test_fold_rng():
+    rnd.seed(9)
+    original = rnd.random((64))
+
+    # Same seed and counters, same draws, whatever the order of the calls
+    first = fold_rng(7, 0, 1).random(8)
+    fold_rng(7, 1, 0).random(8)
+    npt.assert_array_equal(fold_rng(7, 0, 1).random(8), first)
+    # Derived from the seed of a generator, not from its draws
+    rng = get_rng(7)
+    rng.random(16)
+    npt.assert_array_equal(fold_rng(rng, 0, 1).random(8), first)
+    # Independent counters
+    assert not np.allclose(fold_rng(7, 1, 0).random(8), first)
+    assert not np.allclose(fold_rng(7, 0).random(8), first)
+
+    # JAX PRNG keys
+    npt.assert_array_equal(
+        fold_rng(jax.random.PRNGKey(3), 2).random(8),
+        fold_rng(jax.random.key(3), 2).random(8),
+    )
+
+    # The global state is left untouched
+    rnd.seed(9)
+    with local_rng(rng=5) as gen:
+        gen.random(64)
+    npt.assert_array_equal(rnd.random((64)), original)
+
+
 if __name__ == "__main__":
     print("Testing rand_utils.py ...")
     test_seed_safety()
+    test_fold_rng()
     print("All ok!")